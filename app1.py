@@ -6,12 +6,24 @@ Enhanced with Isotope Serviceability Analysis
 
 import streamlit as st
 import pandas as pd
-import folium
-from folium import plugins
-from streamlit_folium import st_folium
-from pathlib import Path
 import streamlit.components.v1 as components
-import re
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from nm_core import (
+    DEFAULT_VIEW_BOUNDS, DEFAULT_VIEW_ZOOM, DIFF_STYLES, FEATURED_ISOTOPES, GATEWAY_RADIUS_METERS,
+    MIN_REMAINING_ACTIVITY, NUCLIDES, SCALABLE_MAP_SITE_THRESHOLD, SERVICE_THRESHOLD_HOURS, SITE_LAYERS, TABLE_PAGE_SIZE,
+    TRANSIT_HANDLING_HOURS, TRANSIT_SPEED_KMH, VIEWPORT_MAX_MARKERS, WATCH_POLL_SECONDS,
+    HalflifeIndex, IncrementalWorkbook, PagedTable, RenderedMapCache, SiteBuilder, SiteGrid, SnapshotStore, StageProfiler,
+    UploadCache, aggregate_sites, apply_map_threshold, create_isotope_summary, create_legend_html, data_fingerprint,
+    default_sources, diff_datasets, fill_site_layer, format_halflife, gateway_coverage, halflife_service_rule,
+    load_workbooks, merge_workbooks, reclassify_sites, site_classes, site_layer_payload, source_labels, threshold_sites,
+    transit_viability, upload_sha256, workbook_signature,
+)
 
 st.set_page_config(
     page_title="NM Origins & Manufacturers | EMEA",
@@ -20,23 +32,8 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Marken UPS Healthcare Logistics Color Palette
-COLORS = {
-    'marken_deep_green': '#0D3B2E',
-    'marken_green': '#1A6B52',
-    'marken_accent': '#28B463',
-    'marken_blue': '#1B4F72',
-    'ups_brown': '#351C15',
-    'can_serve': '#22A06B',       # Green - can serve (≥6h half-life)
-    'cannot_serve': '#DC2626',    # Red - cannot serve (<6h half-life)
-    'partial_serve': '#F59E0B',   # Amber - mixed isotopes
-    # Gateway status colors
-    'gateway_current': '#22A06B',      # Green - Current/Active
-    'gateway_development': '#F59E0B',  # Yellow/Amber - Development
-    'gateway_requested': '#DC2626',    # Red - Requested
-}
-
-st.markdown("""
+# Page styles, injected once per run by main()
+APP_CSS = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
     * { font-family: 'Inter', -apple-system, sans-serif; }
@@ -81,297 +78,392 @@ st.markdown("""
     
     #MainMenu, footer, .stDeployButton { display: none !important; }
 </style>
-""", unsafe_allow_html=True)
-
-# Isotope half-life database (in hours for comparison)
-ISOTOPE_HALFLIVES = {
-    'Mo-99': 65.9,
-    'Lu-177': 159.6,      # ~6.65 days
-    'I-131': 192.0,       # 8 days
-    'Ac-225': 237.6,      # ~9.9 days
-    'Tc-99m': 6.0,
-    'Tb-161': 166.8,      # 6.95 days
-    'Ga-68': 1.13,        # 67.8 min
-    'Y-90': 64.1,
-    'F-18': 1.83,         # 109.7 min
-    'Ho-166': 26.8,
-    'Re-188': 17.0,
-    'I-125': 1425.6,      # 59.4 days
-    'Sm-153': 46.3,
-    'Ra-223': 273.6,      # 11.4 days
-}
-
-SERVICE_THRESHOLD_HOURS = 6.0
-
-def parse_isotopes_from_description(description):
-    """Extract isotopes and their half-lives from description text.
-    Prioritizes reference database for accuracy over potentially ambiguous parsed values."""
-    isotopes = []
-    found_isotopes = set()
-    
-    # Find all isotopes mentioned in the description
-    all_isotope_names = list(dict.fromkeys(re.findall(r'([A-Z][a-z]?-\d+m?)', description)))
-    
-    # For known isotopes, always use reference database (more reliable than parsing)
-    for isotope in all_isotope_names:
-        if isotope in ISOTOPE_HALFLIVES:
-            hours = ISOTOPE_HALFLIVES[isotope]
-            if hours < 1:
-                display = f"{hours*60:.1f} min"
-            elif hours < 24:
-                display = f"{hours:.1f} h"
-            else:
-                display = f"{hours/24:.1f} d"
-            
-            can_serve = hours >= SERVICE_THRESHOLD_HOURS
-            isotopes.append({
-                'name': isotope,
-                'halflife_hours': round(hours, 2),
-                'halflife_display': display,
-                'can_serve': can_serve
-            })
-            found_isotopes.add(isotope)
-        else:
-            # For unknown isotopes, try to parse from description
-            direct_pattern = rf'{re.escape(isotope)}\s*[~]?([\d.]+(?:–[\d.]+)?)\s*(min|h|d)'
-            match = re.search(direct_pattern, description)
-            if match:
-                value_str = match.group(1)
-                unit = match.group(2)
-                if '–' in value_str:
-                    value_str = value_str.split('–')[0]
-                try:
-                    value = float(value_str)
-                    if unit == 'min':
-                        hours = value / 60
-                    elif unit == 'd':
-                        hours = value * 24
-                    else:
-                        hours = value
-                    
-                    can_serve = hours >= SERVICE_THRESHOLD_HOURS
-                    isotopes.append({
-                        'name': isotope,
-                        'halflife_hours': round(hours, 2),
-                        'halflife_display': f"{value_str} {unit}",
-                        'can_serve': can_serve
-                    })
-                    found_isotopes.add(isotope)
-                except:
-                    pass
-    
-    # Sort: can serve first, then cannot serve, then by name
-    isotopes.sort(key=lambda x: (not x['can_serve'], x['name']))
-    
-    return isotopes
+"""
 
-def get_site_serviceability(isotopes):
-    """Determine overall site serviceability based on isotopes."""
-    if not isotopes:
-        return 'unknown'
-    
-    can_serve_count = sum(1 for i in isotopes if i['can_serve'])
-    cannot_serve_count = len(isotopes) - can_serve_count
-    
-    if cannot_serve_count == 0:
-        return 'can_serve'
-    elif can_serve_count == 0:
-        return 'cannot_serve'
-    else:
-        return 'partial_serve'
+@st.cache_resource
+def configure_logging():
+    """Once per process, send the "nm_dashboard" loggers (per-stage perf records at INFO, cache
+    warnings) to stderr, unless logging is already configured. NM_LOG_LEVEL overrides the
+    level, e.g. NM_LOG_LEVEL=WARNING drops the per-stage records."""
+    logger = logging.getLogger("nm_dashboard")
+    logger.setLevel(os.environ.get("NM_LOG_LEVEL", "INFO").upper())
+    if not logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+        logger.addHandler(handler)
+    return logger
+
+@st.cache_resource
+def get_site_builder():
+    """Process-wide SiteBuilder: a changed legend re-parses only its new or edited rows."""
+    return SiteBuilder()
+
+# cache_resource: records are shared, not copied, which avoids unpickling every SiteRecord on
+# each rerun. Their parsed fields are never changed in place (reclassify_sites copies); the
+# one thing written to them is SiteMemo's site.derived cache of values computed from the record.
+@st.cache_resource(show_spinner=False)
+def _enrich_sites_cached(fingerprint, _df_legend, _sites=None):
+    # _sites: records already built for this legend (e.g. from the upload cache)
+    return _sites if _sites is not None else get_site_builder().build(_df_legend)
+
+def enrich_sites(df_legend):
+    """Parse every legend description once per distinct dataset.
+    Returns SiteRecords in legend order; cached on the legend's content fingerprint."""
+    return _enrich_sites_cached(data_fingerprint(df_legend), df_legend)
+
+@st.cache_resource(show_spinner=False)
+def _halflife_index_cached(fingerprint, _sites):
+    return HalflifeIndex(_sites)
+
+def apply_service_threshold(df_legend, sites, threshold_hours):
+    """Reclassify sites for a different half-life threshold.
+    Only sites with an isotope between the default and the new threshold are rebuilt."""
+    if threshold_hours == SERVICE_THRESHOLD_HOURS:
+        return sites
+    return _apply_service_threshold_cached(data_fingerprint(df_legend), sites, threshold_hours)
+
+# Recently used thresholds stay materialized, so dragging the slider back and forth is free
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _apply_service_threshold_cached(fingerprint, _sites, threshold_hours):
+    return threshold_sites(_sites, threshold_hours, _halflife_index_cached(fingerprint, _sites))
+
+@st.cache_resource
+def get_workbook_pool():
+    """Worker processes for multi-workbook loads, spawned once and shared by all sessions
+    (spawn rather than fork: the server process is multi-threaded)."""
+    return ProcessPoolExecutor(max_workers=min(8, os.cpu_count() or 1),
+                               mp_context=multiprocessing.get_context('spawn'))
 
 @st.cache_data
-def load_data(uploaded_file=None):
+def _load_data_cached(sources_key, _sources):
     try:
-        if uploaded_file is not None:
-            df_map = pd.read_excel(uploaded_file, sheet_name="Manufacturers", header=1)
-            df_legend = pd.read_excel(uploaded_file, sheet_name="Legend")
-            df_gateways = pd.read_excel(uploaded_file, sheet_name="UPS_Gateways")
-        else:
-            path = Path(__file__).parent / "nm_manufacturers_data.xlsx"
-            if path.exists():
-                df_map = pd.read_excel(path, sheet_name="Manufacturers", header=1)
-                df_legend = pd.read_excel(path, sheet_name="Legend")
-                df_gateways = pd.read_excel(path, sheet_name="UPS_Gateways")
-            else:
-                return None, None, None
-        
-        # Clean up Manufacturers dataframe - drop empty columns
-        df_map = df_map.dropna(axis=1, how='all')
-        # Ensure correct column names
-        if 'ID' not in df_map.columns:
-            df_map.columns = ['ID', 'Country', 'Latitude', 'Longitude']
-        
-        return df_map, df_legend, df_gateways
+        return load_workbooks(_sources, get_workbook_pool() if len(_sources) > 1 else None)
     except Exception as e:
         st.error(f"Error: {e}")
         return None, None, None
 
-def create_popup_html(site_id, description, isotopes, serviceability):
-    """Create rich HTML popup for map markers."""
-    # Site header with serviceability color
-    if serviceability == 'can_serve':
-        header_color = COLORS['can_serve']
-        status_text = '✓ SERVICEABLE'
-        status_bg = '#D1FAE5'
-    elif serviceability == 'cannot_serve':
-        header_color = COLORS['cannot_serve']
-        status_text = '✗ NOT SERVICEABLE'
-        status_bg = '#FEE2E2'
-    else:
-        header_color = COLORS['partial_serve']
-        status_text = '◐ PARTIAL'
-        status_bg = '#FEF3C7'
-    
-    # Extract site name from description (before first parenthesis or semicolon)
-    site_name = description.split('(')[0].split(';')[0].strip()
-    if len(site_name) > 40:
-        site_name = site_name[:37] + "..."
-    
-    isotope_rows = ""
-    for iso in isotopes:
-        serve_badge = f'<span style="background:{("#D1FAE5" if iso["can_serve"] else "#FEE2E2")};color:{("#065F46" if iso["can_serve"] else "#991B1B")};padding:1px 6px;border-radius:8px;font-size:9px;font-weight:600;">{"✓" if iso["can_serve"] else "✗"}</span>'
-        isotope_rows += f'''
-        <tr style="border-bottom:1px solid #f0f0f0;">
-            <td style="padding:4px 6px;font-weight:600;color:#1B4F72;">{iso["name"]}</td>
-            <td style="padding:4px 6px;text-align:center;">{iso["halflife_display"]}</td>
-            <td style="padding:4px 6px;text-align:center;">{serve_badge}</td>
-        </tr>'''
-    
-    popup_html = f'''
-    <div style="font-family:Inter,-apple-system,sans-serif;width:280px;padding:0;margin:0;">
-        <div style="background:linear-gradient(135deg,{COLORS['marken_deep_green']},{COLORS['marken_green']});padding:10px 12px;border-radius:8px 8px 0 0;">
-            <div style="color:white;font-size:18px;font-weight:700;">Site {site_id}</div>
-            <div style="color:rgba(255,255,255,0.9);font-size:11px;margin-top:2px;">{site_name}</div>
-        </div>
-        <div style="background:{status_bg};padding:6px 12px;text-align:center;">
-            <span style="color:{header_color};font-weight:700;font-size:11px;">{status_text}</span>
-        </div>
-        <div style="background:white;padding:8px;border-radius:0 0 8px 8px;border:1px solid #e5e5e5;border-top:none;">
-            <div style="font-size:10px;color:#6B7280;text-transform:uppercase;letter-spacing:0.5px;margin-bottom:6px;">Isotopes & Half-Lives</div>
-            <table style="width:100%;border-collapse:collapse;font-size:10px;">
-                <tr style="background:#f9fafb;">
-                    <th style="padding:4px 6px;text-align:left;color:#374151;">Isotope</th>
-                    <th style="padding:4px 6px;text-align:center;color:#374151;">T½</th>
-                    <th style="padding:4px 6px;text-align:center;color:#374151;">Service</th>
-                </tr>
-                {isotope_rows}
-            </table>
-            <div style="margin-top:8px;padding:6px;background:#F3F4F6;border-radius:4px;font-size:9px;color:#6B7280;">
-                <strong>Threshold:</strong> ≥6h half-life required for Marken service
-            </div>
-        </div>
-    </div>
-    '''
-    return popup_html
+@st.cache_resource
+def get_upload_cache():
+    """Disk cache of parsed uploads, shared by all sessions (see UploadCache)."""
+    return UploadCache()
 
-def create_map(df_map, df_legend, df_gateways):
-    m = folium.Map(location=[50.0, 10.0], zoom_start=4, tiles='cartodbpositron')
-    
-    # Add UPS Gateways with status-based coloring
-    for _, row in df_gateways.iterrows():
-        status = row.get("Status", "").strip()
-        if status == "Current":
-            gateway_color = COLORS['gateway_current']  # Green
-            status_label = "Current"
-        elif status == "Development":
-            gateway_color = COLORS['gateway_development']  # Yellow
-            status_label = "Development"
-        else:  # Requested or other
-            gateway_color = COLORS['gateway_requested']  # Red
-            status_label = "Requested"
-        
-        folium.Circle(
-            location=[row["Latitude"], row["Longitude"]],
-            radius=120000, color=gateway_color, weight=3, fill=False, opacity=0.9,
-            tooltip=f"UPS Gateway: {row['Code']} - {row['City']} ({status_label})"
-        ).add_to(m)
-    
-    # Create legend lookup
-    legend_dict = df_legend.set_index('ID')['Description'].to_dict()
-    
-    # Process each manufacturing site
-    for _, row in df_map.iterrows():
-        site_id = row['ID']
-        description = legend_dict.get(site_id, "No description available")
-        
-        # Parse isotopes and determine serviceability
-        isotopes = parse_isotopes_from_description(description)
-        serviceability = get_site_serviceability(isotopes)
-        
-        # Choose marker color based on serviceability
-        if serviceability == 'can_serve':
-            marker_color = COLORS['can_serve']
-            border_color = '#065F46'
-        elif serviceability == 'cannot_serve':
-            marker_color = COLORS['cannot_serve']
-            border_color = '#7F1D1D'
+# Each upload is hashed once, not on every rerun
+@st.cache_data(show_spinner=False, max_entries=64)
+def _upload_digest_cached(upload_key, _files):
+    return upload_sha256(_files)
+
+# Recent uploads stay in memory; the disk cache serves other sessions and restarts
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _load_uploads_cached(digest, _files):
+    cache = get_upload_cache()
+    entry = cache.get(digest)
+    if entry is None:
+        sources = [(f.name, f.getvalue()) for f in _files]
+        frames = load_workbooks(sources, get_workbook_pool() if len(sources) > 1 else None)
+        entry = frames, enrich_sites(frames[1])
+        cache.put(digest, entry)
+    return entry
+
+def load_uploads(uploaded_files):
+    """Frames of the uploaded workbooks, keyed by their content: an identical upload from any
+    session is parsed and enriched once. Its site records are handed to enrich_sites as well."""
+    key = tuple((f.name, f.size, getattr(f, 'file_id', None)) for f in uploaded_files)
+    try:
+        frames, sites = _load_uploads_cached(_upload_digest_cached(key, uploaded_files), uploaded_files)
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return None, None, None
+    _enrich_sites_cached(data_fingerprint(frames[1]), frames[1], sites)
+    return frames
+
+def load_data(uploaded_files=None):
+    """Load (Manufacturers, Legend, UPS_Gateways) from one or more uploads, or from the bundled
+    workbook plus any in DEFAULT_WORKBOOK_DIR. Several workbooks are read in parallel and merged
+    (see merge_workbooks); local workbooks are re-read whenever their mtime or size changes."""
+    if uploaded_files is not None and not isinstance(uploaded_files, list):
+        uploaded_files = [uploaded_files]
+    if uploaded_files:
+        return load_uploads(uploaded_files)
+    sources = default_sources()
+    if not sources:
+        return None, None, None
+    return _load_data_cached(tuple((str(path), workbook_signature(path)) for path in sources), sources)
+
+@st.cache_resource
+def watched_workbook(path):
+    """Incremental reader of one local workbook, shared by all sessions."""
+    return IncrementalWorkbook(path)
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _merge_watched_cached(versions, _named_frames):
+    return merge_workbooks(_named_frames)
+
+def load_watched_data():
+    """Watch-mode load_data for the local workbooks: each one is re-read by difference (see
+    IncrementalWorkbook), so an edit re-parses only the rows it touched and unchanged sheets
+    keep their frames. Returns the frames, {workbook: {sheet: changed rows, None if re-read}}
+    for workbooks an edit changed in this run, and the file signatures that were read."""
+    paths = default_sources()
+    if not paths:
+        return (None, None, None), {}, ()
+    try:
+        named_frames, changes = [], {}
+        for label, path in zip(source_labels(paths), paths):
+            reader = watched_workbook(str(path))
+            first_read = reader.signature is None
+            named_frames.append((label, reader.refresh()))
+            edited = {sheet: rows for sheet, rows in reader.changes.items() if rows != []}
+            if edited and not first_read:
+                changes[label] = edited
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return (None, None, None), {}, ()
+    signatures = tuple(watched_workbook(str(path)).signature for path in paths)
+    if len(named_frames) == 1:
+        return named_frames[0][1], changes, signatures
+    versions = tuple((str(path), watched_workbook(str(path)).version) for path in paths)
+    return _merge_watched_cached(versions, named_frames), changes, signatures
+
+@st.fragment(run_every=WATCH_POLL_SECONDS)
+def watch_workbooks(signatures):
+    """Poll the local workbooks in watch mode; rerun the app once one changes on disk."""
+    try:
+        current = tuple(workbook_signature(path) for path in default_sources())
+    except OSError:
+        return  # a workbook is being saved; try again on the next poll
+    if current != signatures:
+        st.rerun()
+
+def describe_changes(changes):
+    """One line for the reload toast, e.g. "nm_manufacturers_data: Legend 1 row, Manufacturers re-read"."""
+    parts = []
+    for label, sheets in changes.items():
+        edits = ', '.join(f"{sheet} re-read" if rows is None else f"{sheet} {len(rows):,} row{'s' if len(rows) != 1 else ''}"
+                          for sheet, rows in sheets.items())
+        parts.append(f"{label}: {edits}")
+    return '; '.join(parts)
+
+@st.cache_resource
+def get_map_cache():
+    """Process-wide rendered map cache, shared across sessions."""
+    return RenderedMapCache()
+
+def map_cache_key(df_map, df_legend, df_gateways, service_model=''):
+    """Content address of a rendered map: input frames plus every threshold that affects it.
+    service_model identifies how sites were classified (see service_model_key)."""
+    thresholds = f"{SERVICE_THRESHOLD_HOURS}|{GATEWAY_RADIUS_METERS}|{SCALABLE_MAP_SITE_THRESHOLD}"
+    return f"{data_fingerprint(df_map, df_legend, df_gateways)}|{thresholds}|{service_model}"
+
+def render_map_html(df_map, df_legend, df_gateways, sites, service_model='',
+                    service_threshold=None, service_rule=None, site_layer='markers'):
+    """Return the map as standalone HTML, building it only on a cache miss.
+    With service_threshold set, site colors and popups are re-derived in the browser
+    for that half-life threshold, so the cached HTML is reused as-is for any threshold.
+    Aggregate site layers (see SITE_LAYERS) are counted server-side, so they are cached
+    per threshold instead."""
+    if site_layer != 'markers':
+        service_model = f"{service_model}|{site_layer}|{service_threshold}"
+    cache = get_map_cache()
+    key = map_cache_key(df_map, df_legend, df_gateways, service_model)
+    map_html = cache.get(key)
+    if map_html is None:
+        from nm_map import create_map  # folium is loaded on the first map build, not at startup
+        if site_layer != 'markers':
+            map_html = create_map(df_map, sites, df_gateways, site_layer=site_layer).get_root().render()
+        elif len(df_map) > SCALABLE_MAP_SITE_THRESHOLD:
+            # Clustered: only the site payload is rebuilt; tiles, gateway circles and popup code
+            # come from a shell cached per gateways and popup rule, so site edits skip folium
+            shell_key = f"shell|{data_fingerprint(df_gateways)}|{GATEWAY_RADIUS_METERS}|{service_rule}"
+            shell = cache.get(shell_key)
+            if shell is None:
+                shell = create_map(None, None, df_gateways, service_rule=service_rule, shell=True).get_root().render()
+                cache.put(shell_key, shell)
+            map_html = fill_site_layer(shell, *site_layer_payload(df_map, sites))
         else:
-            marker_color = COLORS['partial_serve']
-            border_color = '#92400E'
-        
-        # Create popup
-        popup_html = create_popup_html(site_id, description, isotopes, serviceability)
-        popup = folium.Popup(popup_html, max_width=300)
-        
-        # Create marker with serviceability color
-        icon_html = f'''
-        <div style="
-            background:{marker_color};
-            color:white;
-            font-weight:700;
-            font-size:11px;
-            width:26px;
-            height:22px;
-            display:flex;
-            align-items:center;
-            justify-content:center;
-            border:2px solid {border_color};
-            border-radius:4px;
-            box-shadow:1px 1px 4px rgba(0,0,0,0.3);
-            transform:translate(-13px,-11px);
-        ">{site_id}</div>
-        '''
-        
-        folium.Marker(
-            location=[row["Latitude"], row["Longitude"]],
-            icon=folium.DivIcon(html=icon_html, icon_size=(26, 22)),
-            popup=popup,
-            tooltip=f"Site {site_id}: {row['Country']} (Click for details)"
-        ).add_to(m)
-    
-    return m
+            map_html = create_map(df_map, sites, df_gateways, lazy_popups=True, service_rule=service_rule).get_root().render()
+        cache.put(key, map_html)
+    return apply_map_threshold(map_html, service_threshold)
 
-def create_isotope_summary(df_legend):
-    """Create a summary dataframe of all sites with isotope serviceability."""
-    summary_data = []
-    
-    for _, row in df_legend.iterrows():
-        site_id = row['ID']
-        description = row['Description']
-        isotopes = parse_isotopes_from_description(description)
-        serviceability = get_site_serviceability(isotopes)
-        
-        # Extract site name
-        site_name = description.split('(')[0].split(';')[0].strip()
-        if '–' in site_name:
-            site_name = site_name.split('–')[0].strip()
-        
-        # Create isotope strings
-        can_serve_isotopes = [i['name'] for i in isotopes if i['can_serve']]
-        cannot_serve_isotopes = [i['name'] for i in isotopes if not i['can_serve']]
-        
-        summary_data.append({
-            'Site': site_id,
-            'Name': site_name[:30] + ('...' if len(site_name) > 30 else ''),
-            'Can Serve (≥6h)': ', '.join(can_serve_isotopes) if can_serve_isotopes else '—',
-            'Cannot Serve (<6h)': ', '.join(cannot_serve_isotopes) if cannot_serve_isotopes else '—',
-            'Status': '✓ Full' if serviceability == 'can_serve' else ('✗ None' if serviceability == 'cannot_serve' else '◐ Partial')
-        })
+@st.cache_data(show_spinner=False)
+def _gateway_coverage_cached(fingerprint, _df_map, _df_gateways, radius_km):
+    return gateway_coverage(_df_map, _df_gateways, radius_km)
+
+def compute_gateway_coverage(df_map, df_gateways):
+    """Nearest gateway, distance and coverage flag for every site, indexed by site ID.
+    A site is covered when it lies within GATEWAY_RADIUS_METERS of any gateway."""
+    return _gateway_coverage_cached(
+        data_fingerprint(df_map, df_gateways), df_map, df_gateways, GATEWAY_RADIUS_METERS / 1000
+    )
+
+@st.cache_data(show_spinner=False)
+def _transit_viability_cached(fingerprint, _df_map, _df_gateways, _sites, speed_kmh, handling_hours, min_remaining):
+    return transit_viability(_df_map, _df_gateways, _sites, speed_kmh, handling_hours, min_remaining)
+
+def apply_transit_decay_model(df_map, df_legend, df_gateways, sites, speed_kmh=TRANSIT_SPEED_KMH,
+                              handling_hours=TRANSIT_HANDLING_HOURS, min_remaining=MIN_REMAINING_ACTIVITY):
+    """Reclassify sites by activity remaining at their best gateway after transit,
+    instead of the static half-life threshold."""
+    can_serve = _transit_viability_cached(
+        data_fingerprint(df_map, df_legend, df_gateways), df_map, df_gateways, sites,
+        speed_kmh, handling_hours, min_remaining
+    )
+    return reclassify_sites(sites, can_serve)
+
+def service_model_key(model, speed_kmh, handling_hours, min_remaining):
+    """Identifier of the active service model, used in rendered-map cache keys."""
+    if model == 'decay':
+        return f"decay:{speed_kmh}:{handling_hours}:{min_remaining}"
+    return 'halflife'
+
+def classify_sites(df_map, df_legend, df_gateways, model, threshold_hours, speed_kmh, handling_hours, min_remaining):
+    """Enriched site records classified under the active service model."""
+    sites = enrich_sites(df_legend)
+    if model == 'decay':
+        return apply_transit_decay_model(df_map, df_legend, df_gateways, sites, speed_kmh, handling_hours, min_remaining)
+    return apply_service_threshold(df_legend, sites, threshold_hours)
+
+@st.cache_resource(show_spinner=False)
+def _site_grid_cached(fingerprint, _df_map):
+    return SiteGrid(_df_map['Latitude'], _df_map['Longitude'])
+
+def viewport_from_state(state):
+    """(south, west, north, east), zoom from the map component's last reported view."""
+    bounds = (state or {}).get('bounds') or {}
+    south_west, north_east = bounds.get('_southWest') or {}, bounds.get('_northEast') or {}
+    try:
+        box = (float(south_west['lat']), float(south_west['lng']), float(north_east['lat']), float(north_east['lng']))
+    except (KeyError, TypeError, ValueError):
+        box = DEFAULT_VIEW_BOUNDS
+    return box, int((state or {}).get('zoom') or DEFAULT_VIEW_ZOOM)
+
+def render_viewport_map(df_map, df_gateways, sites, service_rule=None):
+    """Map whose site layer holds only what is in the browser's current view.
+    The component reports bounds and zoom back on pan/zoom; the next run queries the grid
+    index and swaps in a new layer (individual markers, or cell aggregates when more than
+    VIEWPORT_MAX_MARKERS sites are in view). Returns the number of markers sent."""
+    from nm_map import create_base_map, viewport_layer
+    from streamlit_folium import st_folium
+    
+    box, zoom = viewport_from_state(st.session_state.get('viewport_map'))
+    positions = _site_grid_cached(data_fingerprint(df_map), df_map).query(*box)
+    in_view = df_map.iloc[positions]
+    if len(positions) <= VIEWPORT_MAX_MARKERS:
+        layer = viewport_layer(in_view, sites, service_rule=service_rule)
+        sent = len(positions)
+    else:
+        aggregates = aggregate_sites(in_view['Latitude'], in_view['Longitude'], site_classes(in_view, sites), zoom)
+        layer = viewport_layer(in_view, sites, aggregates)
+        sent = len(aggregates)
+    st_folium(create_base_map(df_gateways), key='viewport_map', height=520, use_container_width=True,
+              returned_objects=['bounds', 'zoom'], feature_group_to_add=layer)
+    st.caption(f"{len(positions):,} of {len(df_map):,} sites in view • "
+               f"{sent:,} {'markers' if len(positions) <= VIEWPORT_MAX_MARKERS else 'cluster bubbles'} sent")
+    return sent
+
+# Paged tables are shared read-only; their sort orders fill in as users sort
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _summary_table_cached(fingerprint, model_key, service_labels, _sites, _coverage):
+    return PagedTable(create_isotope_summary(_sites, _coverage, service_labels))
+
+def summary_table(df_map, df_legend, df_gateways, sites, coverage, model_key, service_labels):
+    """Isotope summary for the active service model, built once per dataset and model."""
+    return _summary_table_cached(data_fingerprint(df_map, df_legend, df_gateways), model_key,
+                                 tuple(service_labels), sites, coverage)
+
+@st.cache_resource(show_spinner=False)
+def _gateway_table_cached(fingerprint, _df_gateways):
+    return PagedTable(_df_gateways[['Code', 'City', 'Country', 'Status']])
+
+@st.cache_resource
+def get_snapshot_store():
+    """Dataset snapshots on local disk (see SnapshotStore); uploads are scoped to their session."""
+    return SnapshotStore()
+
+# Each dataset is written at most once per process; the store skips ones saved before a restart
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _save_snapshot_cached(fingerprint, scope, _frames, _label):
+    return get_snapshot_store().save(_frames, _label, scope)
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _snapshot_frames_cached(key):
+    return get_snapshot_store().load(key)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _dataset_diff_cached(old_key, new_key):
+    return diff_datasets(_snapshot_frames_cached(old_key), _snapshot_frames_cached(new_key))
+
+def snapshot_label(meta):
+    saved = time.strftime('%Y-%m-%d %H:%M', time.localtime(meta['saved']))
+    return f"{meta['label'] or 'Dataset'} • {saved} • {meta['sites']:,} sites"
+
+def render_dataset_history(frames, label, uploaded):
+    """Save the loaded dataset as a snapshot, then compare any two snapshots: change counts,
+    a map of the changes and one table per kind of change. Uploads are saved under this
+    session's scope, so they are listed only here and never to other sessions."""
+    session = st.session_state.setdefault('snapshot_scope', uuid.uuid4().hex)
+    try:
+        current = _save_snapshot_cached(data_fingerprint(*frames), session if uploaded else None, frames, label)
+        snapshots = get_snapshot_store().snapshots(session)
+    except Exception as e:
+        st.caption(f"Snapshots are unavailable: {e}")
+        return
+    if len(snapshots) < 2:
+        st.info("Every loaded dataset is saved as a snapshot; load another revision of the workbook to compare the two.")
+        return
+    keys = [meta['key'] for meta in snapshots]
+    labels = {meta['key']: snapshot_label(meta) for meta in snapshots}
+    position = keys.index(current) if current in keys else len(keys) - 1
+    h1, h2 = st.columns(2)
+    old = h1.selectbox("Compare", keys, index=position - 1 if position else 1, format_func=labels.get, key='diff_old')
+    new = h2.selectbox("with", keys, index=position, format_func=labels.get, key='diff_new')
+    if old == new:
+        st.caption("Pick two different snapshots to compare.")
+        return
     
-    return pd.DataFrame(summary_data)
+    diff = _dataset_diff_cached(old, new)
+    counts = diff.counts()
+    for column, (kind, (name, _)) in zip(st.columns(len(DIFF_STYLES)), DIFF_STYLES.items()):
+        column.metric(name, f"{counts[kind]:,}")
+    cache = get_map_cache()
+    key = f"diff|{old}|{new}"
+    map_html = cache.get(key)
+    if map_html is None:
+        from nm_map import create_diff_map
+        map_html = create_diff_map(_snapshot_frames_cached(new)[2], diff).get_root().render()
+        cache.put(key, map_html)
+    components.html(map_html, height=420)
+    t1, t2, t3 = st.tabs(["Sites", "Isotopes", "Gateways"])
+    t1.dataframe(diff.sites, use_container_width=True, hide_index=True, height=240)
+    t2.dataframe(diff.isotopes, use_container_width=True, hide_index=True, height=240)
+    t3.dataframe(diff.gateways, use_container_width=True, hide_index=True, height=240)
+
+def paged_dataframe(table, key, height):
+    """Filter, sort and page controls over a PagedTable; only the current page is sent to the browser.
+    Returns the page shown."""
+    columns = list(table.df.columns)
+    f1, f2, f3, f4 = st.columns([3, 2, 1, 1])
+    query = f1.text_input("Filter", key=f"{key}_query", placeholder="🔍 Filter rows",
+                          label_visibility="collapsed")
+    sort_by = f2.selectbox("Sort by", [None] + columns, key=f"{key}_sort", label_visibility="collapsed",
+                           format_func=lambda c: "Sort: file order" if c is None else f"Sort: {c}")
+    descending = f3.toggle("↓", key=f"{key}_desc", help="Sort descending", disabled=sort_by is None)
+    positions = table.select(query, sort_by, not descending)
+    
+    n_pages = max(1, -(-len(positions) // TABLE_PAGE_SIZE))
+    if st.session_state.get(f"{key}_page", 1) > n_pages:
+        st.session_state[f"{key}_page"] = n_pages  # the filter shrank the result
+    page = f4.number_input("Page", 1, n_pages, key=f"{key}_page", label_visibility="collapsed")
+    page_df = table.page(positions, page)
+    
+    st.dataframe(page_df, use_container_width=True, hide_index=True, height=height)
+    start = (page - 1) * TABLE_PAGE_SIZE
+    filtered = f" (filtered from {len(table):,})" if len(positions) != len(table) else ""
+    st.caption(f"Rows {min(start + 1, len(positions)):,}–{start + len(page_df):,} of {len(positions):,}{filtered} • page {page} of {n_pages}")
+    return page_df
 
 def main():
+    configure_logging()
+    st.markdown(APP_CSS, unsafe_allow_html=True)
     st.markdown('''
     <div class="exec-header">
         <svg width="45" height="45" viewBox="0 0 100 100">
@@ -387,184 +479,203 @@ def main():
     ''', unsafe_allow_html=True)
     
     with st.expander("📂 Data Source", expanded=False):
-        uploaded_file = st.file_uploader("Upload nm_manufacturers_data.xlsx", type=["xlsx"])
+        uploaded_file = st.file_uploader(
+            "Upload nm_manufacturers_data.xlsx (several regional workbooks are merged)",
+            type=["xlsx"], accept_multiple_files=True
+        )
+        watch = st.toggle(
+            "Watch local workbooks for changes", key='watch_mode', disabled=bool(uploaded_file),
+            help="Check the workbooks on disk every few seconds and apply edits as they are saved, "
+                 "re-reading only the rows that changed"
+        ) and not uploaded_file
         st.info("📊 All isotope data extracted from PowerPoint Slide 2")
     
-    df_map, df_legend, df_gateways = load_data(uploaded_file)
-    
-    if df_map is None:
-        st.warning("⬆️ Please upload **nm_manufacturers_data.xlsx**")
-        return
-    
-    # Calculate KPIs
-    total_sites = df_legend['ID'].nunique()
-    total_countries = df_map['Country'].nunique()
-    total_gateways = len(df_gateways)
-    
-    # Count isotopes and serviceability
-    all_isotopes = set()
-    serviceable_count = 0
-    for _, row in df_legend.iterrows():
-        isotopes = parse_isotopes_from_description(row['Description'])
-        for iso in isotopes:
-            all_isotopes.add(iso['name'])
-        serviceability = get_site_serviceability(isotopes)
-        if serviceability in ['can_serve', 'partial_serve']:
-            serviceable_count += 1
-    
-    # KPI Row
-    st.markdown(f'''
-    <div class="kpi-row">
-        <div class="kpi-box"><div class="kpi-val">{total_sites}</div><div class="kpi-lbl">Production Sites</div></div>
-        <div class="kpi-box"><div class="kpi-val">{total_countries}</div><div class="kpi-lbl">Countries</div></div>
-        <div class="kpi-box"><div class="kpi-val">{total_gateways}</div><div class="kpi-lbl">UPS Gateways</div></div>
-        <div class="kpi-box"><div class="kpi-val">{len(all_isotopes)}</div><div class="kpi-lbl">Isotopes</div></div>
-        <div class="kpi-box"><div class="kpi-val" style="color:#22A06B;">{serviceable_count}</div><div class="kpi-lbl">Serviceable Sites</div></div>
-    </div>
-    ''', unsafe_allow_html=True)
-    
-    # Color Legend - Sites
-    st.markdown('''
-    <div style="display:flex;gap:20px;margin-bottom:8px;padding:8px 12px;background:white;border-radius:8px;border:1px solid #E5E8EB;">
-        <div style="font-size:11px;font-weight:600;color:#374151;margin-right:4px;">Sites:</div>
-        <div style="display:flex;align-items:center;gap:6px;font-size:11px;">
-            <div style="width:18px;height:14px;background:#22A06B;border-radius:3px;border:2px solid #065F46;"></div>
-            <span><strong>Can Serve</strong> (≥6h)</span>
-        </div>
-        <div style="display:flex;align-items:center;gap:6px;font-size:11px;">
-            <div style="width:18px;height:14px;background:#F59E0B;border-radius:3px;border:2px solid #92400E;"></div>
-            <span><strong>Partial</strong></span>
-        </div>
-        <div style="display:flex;align-items:center;gap:6px;font-size:11px;">
-            <div style="width:18px;height:14px;background:#DC2626;border-radius:3px;border:2px solid #7F1D1D;"></div>
-            <span><strong>Cannot Serve</strong> (<6h)</span>
-        </div>
-    </div>
-    ''', unsafe_allow_html=True)
-    
-    # Color Legend - Gateways
-    st.markdown('''
-    <div style="display:flex;gap:20px;margin-bottom:12px;padding:8px 12px;background:white;border-radius:8px;border:1px solid #E5E8EB;">
-        <div style="font-size:11px;font-weight:600;color:#374151;margin-right:4px;">UPS Gateways:</div>
-        <div style="display:flex;align-items:center;gap:6px;font-size:11px;">
-            <div style="width:18px;height:18px;border:3px solid #22A06B;border-radius:50%;"></div>
-            <span><strong>Current</strong></span>
-        </div>
-        <div style="display:flex;align-items:center;gap:6px;font-size:11px;">
-            <div style="width:18px;height:18px;border:3px solid #F59E0B;border-radius:50%;"></div>
-            <span><strong>Development</strong></span>
+    with st.expander("⚙️ Service Model", expanded=False):
+        model = st.radio(
+            "Classify sites by", ['halflife', 'decay'], horizontal=True,
+            format_func=lambda m: "Half-life threshold" if m == 'halflife' else "Transit decay to nearest gateway"
+        )
+        threshold_hours = st.slider(
+            "Minimum half-life (h)", 0.5, 72.0, SERVICE_THRESHOLD_HOURS, step=0.5,
+            help="What-if for the cold chain: isotopes at or above this half-life count as serviceable",
+            disabled=model != 'halflife'
+        )
+        d1, d2, d3 = st.columns(3)
+        speed_kmh = d1.number_input("Transit speed (km/h)", 10.0, 900.0, TRANSIT_SPEED_KMH, step=10.0)
+        handling_hours = d2.number_input("Handling time (h)", 0.0, 48.0, TRANSIT_HANDLING_HOURS, step=0.5)
+        min_remaining_pct = d3.number_input("Min. activity on arrival (%)", 1, 99, int(MIN_REMAINING_ACTIVITY * 100))
+    
+    # Per-stage timings go to the perf log on every run; memory is traced only when diagnostics are on
+    with StageProfiler(trace_memory=st.session_state.get('show_diagnostics', False)) as profiler:
+        with profiler.stage('load_data') as stage:
+            if watch:
+                frames, changes, signatures = load_watched_data()
+            else:
+                frames = load_data(uploaded_file)
+            df_map, df_legend, df_gateways = stage.output = frames
+        if watch:
+            watch_workbooks(signatures)
+            if changes:
+                st.toast(f"Workbook updated • {describe_changes(changes)}", icon="🔄")
+        
+        if df_map is None:
+            st.warning("⬆️ Please upload **nm_manufacturers_data.xlsx**")
+            return
+        
+        # Parse and classify every site once; all views below read from this
+        with profiler.stage('classify_sites'):
+            sites = classify_sites(df_map, df_legend, df_gateways, model, threshold_hours,
+                                   speed_kmh, handling_hours, min_remaining_pct / 100)
+        if model == 'decay':
+            service_labels = (f'≥{min_remaining_pct}% on arrival', f'<{min_remaining_pct}% on arrival')
+            service_rule = f"≥{min_remaining_pct}% activity left on arrival at the nearest gateway"
+            map_threshold = None
+        else:
+            service_labels = (f'≥{threshold_hours:g}h', f'<{threshold_hours:g}h')
+            service_rule = halflife_service_rule(threshold_hours)
+            map_threshold = threshold_hours
+        model_key = service_model_key(model, speed_kmh, handling_hours, min_remaining_pct / 100)
+        
+        # Calculate KPIs
+        with profiler.stage('kpis'):
+            total_sites = df_legend['ID'].nunique()
+            total_countries = df_map['Country'].nunique()
+            total_gateways = len(df_gateways)
+            coverage = compute_gateway_coverage(df_map, df_gateways)
+            covered_count = int(coverage['covered'].sum())
+        
+            # Count isotopes and serviceability
+            all_isotopes = set()
+            serviceable_count = 0
+            for site in sites:
+                for iso in site.isotopes:
+                    all_isotopes.add(iso.name)
+                if site.serviceability in ['can_serve', 'partial_serve']:
+                    serviceable_count += 1
+        
+        # KPI Row
+        st.markdown(f'''
+        <div class="kpi-row">
+            <div class="kpi-box"><div class="kpi-val">{total_sites}</div><div class="kpi-lbl">Production Sites</div></div>
+            <div class="kpi-box"><div class="kpi-val">{total_countries}</div><div class="kpi-lbl">Countries</div></div>
+            <div class="kpi-box"><div class="kpi-val">{total_gateways}</div><div class="kpi-lbl">UPS Gateways</div></div>
+            <div class="kpi-box"><div class="kpi-val">{len(all_isotopes)}</div><div class="kpi-lbl">Isotopes</div></div>
+            <div class="kpi-box"><div class="kpi-val" style="color:#22A06B;">{serviceable_count}</div><div class="kpi-lbl">Serviceable Sites</div></div>
+            <div class="kpi-box"><div class="kpi-val">{covered_count}</div><div class="kpi-lbl">Sites Covered ({GATEWAY_RADIUS_METERS // 1000} km)</div></div>
         </div>
-        <div style="display:flex;align-items:center;gap:6px;font-size:11px;">
-            <div style="width:18px;height:18px;border:3px solid #DC2626;border-radius:50%;"></div>
-            <span><strong>Requested</strong></span>
+        ''', unsafe_allow_html=True)
+        
+        # Color Legend - Sites
+        st.markdown(f'''
+        <div style="display:flex;gap:20px;margin-bottom:8px;padding:8px 12px;background:white;border-radius:8px;border:1px solid #E5E8EB;">
+            <div style="font-size:11px;font-weight:600;color:#374151;margin-right:4px;">Sites:</div>
+            <div style="display:flex;align-items:center;gap:6px;font-size:11px;">
+                <div style="width:18px;height:14px;background:#22A06B;border-radius:3px;border:2px solid #065F46;"></div>
+                <span><strong>Can Serve</strong> ({service_labels[0]})</span>
+            </div>
+            <div style="display:flex;align-items:center;gap:6px;font-size:11px;">
+                <div style="width:18px;height:14px;background:#F59E0B;border-radius:3px;border:2px solid #92400E;"></div>
+                <span><strong>Partial</strong></span>
+            </div>
+            <div style="display:flex;align-items:center;gap:6px;font-size:11px;">
+                <div style="width:18px;height:14px;background:#DC2626;border-radius:3px;border:2px solid #7F1D1D;"></div>
+                <span><strong>Cannot Serve</strong> ({service_labels[1]})</span>
+            </div>
         </div>
-    </div>
-    ''', unsafe_allow_html=True)
-    
-    # Map
-    m = create_map(df_map, df_legend, df_gateways)
-    st_folium(m, width=None, height=520, returned_objects=[])
-    
-    st.markdown("---")
-    
-    # Collapsible Legend Panel
-    with st.expander("📋 Site Legend & Isotope Details (Click to Expand)", expanded=False):
-        # Build legend HTML
-        items_html = ""
-        for _, row in df_legend.iterrows():
-            isotopes = parse_isotopes_from_description(row['Description'])
-            serviceability = get_site_serviceability(isotopes)
-            
-            if serviceability == 'can_serve':
-                bg_color = COLORS['can_serve']
-                border_color = '#065F46'
-            elif serviceability == 'cannot_serve':
-                bg_color = COLORS['cannot_serve']
-                border_color = '#7F1D1D'
-            else:
-                bg_color = COLORS['partial_serve']
-                border_color = '#92400E'
-            
-            # Create isotope badges
-            isotope_badges = ""
-            for iso in isotopes:
-                iso_bg = '#D1FAE5' if iso['can_serve'] else '#FEE2E2'
-                iso_color = '#065F46' if iso['can_serve'] else '#991B1B'
-                isotope_badges += f'<span style="background:{iso_bg};color:{iso_color};padding:1px 5px;border-radius:6px;font-size:9px;margin-right:3px;white-space:nowrap;">{iso["name"]} ({iso["halflife_display"]})</span>'
-            
-            items_html += f'''<div style="display:flex;align-items:flex-start;padding:8px 10px;border-bottom:1px solid #F0F0F0;gap:8px;">
-                <div style="background:{bg_color};color:white;font-weight:700;min-width:28px;height:24px;display:flex;align-items:center;justify-content:center;border-radius:4px;font-size:12px;flex-shrink:0;border:2px solid {border_color};">{row["ID"]}</div>
-                <div style="flex:1;">
-                    <div style="font-size:11px;color:#374151;line-height:1.4;margin-bottom:4px;">{row["Description"][:80]}{'...' if len(row["Description"]) > 80 else ''}</div>
-                    <div style="display:flex;flex-wrap:wrap;gap:2px;">{isotope_badges}</div>
-                </div>
-            </div>'''
+        ''', unsafe_allow_html=True)
         
-        legend_html = f'''<!DOCTYPE html>
-<html>
-<head>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
-    <style>
-        * {{ font-family: 'Inter', -apple-system, sans-serif; margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ background: transparent; }}
-        ::-webkit-scrollbar {{ width: 6px; }}
-        ::-webkit-scrollbar-track {{ background: #f1f1f1; border-radius: 3px; }}
-        ::-webkit-scrollbar-thumb {{ background: #c1c1c1; border-radius: 3px; }}
-    </style>
-</head>
-<body>
-    <div style="background:#F8FAFC;border:1px solid #E2E8F0;border-radius:6px;padding:10px;margin-bottom:10px;">
-        <div style="font-size:11px;font-weight:600;color:#1B4F72;margin-bottom:8px;">✈️ UPS Origin Gateways</div>
-        <div style="display:flex;gap:12px;flex-wrap:wrap;">
-            <div style="display:flex;align-items:center;gap:6px;">
+        # Color Legend - Gateways
+        st.markdown('''
+        <div style="display:flex;gap:20px;margin-bottom:12px;padding:8px 12px;background:white;border-radius:8px;border:1px solid #E5E8EB;">
+            <div style="font-size:11px;font-weight:600;color:#374151;margin-right:4px;">UPS Gateways:</div>
+            <div style="display:flex;align-items:center;gap:6px;font-size:11px;">
                 <div style="width:18px;height:18px;border:3px solid #22A06B;border-radius:50%;"></div>
-                <span style="font-size:10px;color:#374151;"><strong>Current</strong></span>
+                <span><strong>Current</strong></span>
             </div>
-            <div style="display:flex;align-items:center;gap:6px;">
+            <div style="display:flex;align-items:center;gap:6px;font-size:11px;">
                 <div style="width:18px;height:18px;border:3px solid #F59E0B;border-radius:50%;"></div>
-                <span style="font-size:10px;color:#374151;"><strong>Development</strong></span>
+                <span><strong>Development</strong></span>
             </div>
-            <div style="display:flex;align-items:center;gap:6px;">
+            <div style="display:flex;align-items:center;gap:6px;font-size:11px;">
                 <div style="width:18px;height:18px;border:3px solid #DC2626;border-radius:50%;"></div>
-                <span style="font-size:10px;color:#374151;"><strong>Requested</strong></span>
+                <span><strong>Requested</strong></span>
             </div>
         </div>
-    </div>
-    <div style="font-weight:600;color:#1B4F72;font-size:12px;margin-bottom:6px;">📍 Manufacturing Sites by Serviceability</div>
-    <div style="background:white;border:1px solid #E5E8EB;border-radius:6px;max-height:500px;overflow-y:auto;">
-        {items_html}
-    </div>
-</body>
-</html>'''
+        ''', unsafe_allow_html=True)
         
-        components.html(legend_html, height=560, scrolling=False)
-    
-    # Data Tables
-    c1, c2 = st.columns(2)
-    
-    with c1:
-        st.markdown('<p class="section-hdr">⚛️ Isotope Serviceability by Site</p>', unsafe_allow_html=True)
-        summary_df = create_isotope_summary(df_legend)
-        st.dataframe(summary_df, use_container_width=True, hide_index=True, height=280)
-    
-    with c2:
-        st.markdown('<p class="section-hdr">✈️ UPS Origin Gateways</p>', unsafe_allow_html=True)
-        st.dataframe(df_gateways[['Code', 'City', 'Country', 'Status']], use_container_width=True, hide_index=True, height=200)
+        # Map
+        viewport_mode = st.toggle(
+            "Viewport streaming", key='viewport_mode',
+            help="Send only the sites in the visible map area (or per-area counts when zoomed out) "
+                 "instead of every site; the map reloads its markers after each pan or zoom"
+        )
+        site_layer = st.radio(
+            "Show sites as", list(SITE_LAYERS), format_func=SITE_LAYERS.get, horizontal=True, key='site_layer',
+            disabled=viewport_mode,
+            help="Density and country layers summarize every site in a few hundred shapes, "
+                 "readable at regional zoom where markers overlap"
+        )
+        if viewport_mode:
+            with profiler.stage('viewport_map'):
+                render_viewport_map(df_map, df_gateways, sites, service_rule)
+        else:
+            with profiler.stage('create_map') as stage:
+                map_html = stage.output = render_map_html(df_map, df_legend, df_gateways, sites, model_key, map_threshold,
+                                                          service_rule, site_layer)
+            with profiler.stage('map_transfer') as stage:
+                stage.output = map_html
+                components.html(map_html, height=520)
         
-        st.markdown('<p class="section-hdr" style="margin-top:16px;">📊 Isotope Half-Life Reference</p>', unsafe_allow_html=True)
-        isotope_ref = []
-        for name, hours in sorted(ISOTOPE_HALFLIVES.items(), key=lambda x: x[1]):
-            if hours < 1:
-                display = f"{hours*60:.1f} min"
-            elif hours < 24:
-                display = f"{hours:.1f} h"
-            else:
-                display = f"{hours/24:.1f} d"
-            can_serve = "✓ Yes" if hours >= SERVICE_THRESHOLD_HOURS else "✗ No"
-            isotope_ref.append({'Isotope': name, 'Half-Life': display, 'Serviceable': can_serve})
-        st.dataframe(pd.DataFrame(isotope_ref), use_container_width=True, hide_index=True, height=180)
-    
-    st.markdown('<div class="info-box"><b>Service Threshold:</b> Marken can serve isotopes with half-life ≥ 6 hours. Isotopes with shorter half-lives (e.g., F-18, Ga-68) require specialized local production and delivery.</div>', unsafe_allow_html=True)
+        st.markdown("---")
+        
+        # Collapsible Legend Panel
+        with st.expander("📋 Site Legend & Isotope Details (Click to Expand)", expanded=False):
+            with profiler.stage('legend') as stage:
+                legend_html = stage.output = create_legend_html(sites)
+            components.html(legend_html, height=560, scrolling=False)
+        
+        # Data Tables
+        c1, c2 = st.columns(2)
+        
+        with c1:
+            st.markdown('<p class="section-hdr">⚛️ Isotope Serviceability by Site</p>', unsafe_allow_html=True)
+            with profiler.stage('isotope_summary') as stage:
+                table = summary_table(df_map, df_legend, df_gateways, sites, coverage, model_key, service_labels)
+                stage.output = paged_dataframe(table, 'summary', height=280)
+        
+        with c2:
+            st.markdown('<p class="section-hdr">✈️ UPS Origin Gateways</p>', unsafe_allow_html=True)
+            paged_dataframe(_gateway_table_cached(data_fingerprint(df_gateways), df_gateways), 'gateways', height=200)
+        
+            st.markdown('<p class="section-hdr" style="margin-top:16px;">📊 Isotope Half-Life Reference</p>', unsafe_allow_html=True)
+            isotope_ref = []
+            for name, hours in sorted(((name, NUCLIDES.halflife_hours(name)) for name in FEATURED_ISOTOPES), key=lambda x: x[1]):
+                display = format_halflife(hours)
+                can_serve = "✓ Yes" if hours >= threshold_hours else "✗ No"
+                isotope_ref.append({'Isotope': name, 'Half-Life': display, 'Serviceable': can_serve})
+            st.dataframe(pd.DataFrame(isotope_ref), use_container_width=True, hide_index=True, height=180)
+        
+        st.markdown(f'<div class="info-box"><b>Service Threshold:</b> Marken can serve isotopes with half-life ≥ {threshold_hours:g} hours. Isotopes with shorter half-lives (e.g., F-18, Ga-68) require specialized local production and delivery.</div>', unsafe_allow_html=True)
+        
+        with st.expander("🕓 Dataset History", expanded=False):
+            with profiler.stage('dataset_history'):
+                label = ', '.join(f.name for f in uploaded_file) if uploaded_file else ', '.join(source_labels(default_sources()))
+                render_dataset_history((df_map, df_legend, df_gateways), label, bool(uploaded_file))
+    
+    with st.expander("🩺 Performance Diagnostics", expanded=False):
+        st.checkbox("Measure peak memory per stage", key='show_diagnostics',
+                    help="Traces Python allocations while enabled, which slows the app down")
+        st.dataframe(profiler.to_frame(), use_container_width=True, hide_index=True)
+        map_cache = get_map_cache()
+        upload_cache = get_upload_cache()
+        if upload_cache.enabled:
+            upload_stats = (f"{upload_cache.hits} hits / {upload_cache.misses} misses, {len(upload_cache)} entries, "
+                            f"{upload_cache.total_bytes / 1e6:.1f} MB")
+        else:
+            upload_stats = f"disabled ({upload_cache.error})"
+        st.caption(f"Run {profiler.run_id} • map cache {map_cache.hits} hits / {map_cache.misses} misses, "
+                   f"{map_cache.total_bytes / 1e6:.1f} MB • upload cache {upload_stats} • "
+                   f"stages are also logged to 'nm_dashboard.perf'")
     
     st.markdown('<div class="footer-bar"><b>Nuclear Medicine EMEA Dashboard</b> • Marken UPS Healthcare Logistics • CONFIDENTIAL</div>', unsafe_allow_html=True)
 
@@ -0,0 +1 @@
+"""Benchmarks for the NM dashboard: synthetic workbooks and timing suites."""
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark: single-pass isotope matcher vs. the original per-isotope regex parser.
+
+The legacy parser looks half-lives up in the same nuclide table as the current one, so any
+output difference is a matcher difference rather than a reference-data difference.
+
+Usage: python benchmarks/bench_isotope_parser.py [N_DESCRIPTIONS]
+"""
+
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nm_core import NUCLIDES, SERVICE_THRESHOLD_HOURS, format_halflife, parse_isotopes_from_description
+from benchmarks.workbook import synthetic_descriptions
+
+def legacy_parse_isotopes_from_description(description):
+    """The parser as it was before the single-pass matcher, kept here for comparison; its
+    14-isotope dict is replaced by the nuclide table so both parsers share reference data."""
+    isotopes = []
+    all_isotope_names = list(dict.fromkeys(re.findall(r'([A-Z][a-z]?-\d+m?)', description)))
+    for isotope in all_isotope_names:
+        if isotope in NUCLIDES.hours:
+            hours = NUCLIDES.hours[isotope]
+            display = format_halflife(hours)
+            isotopes.append({'name': isotope, 'halflife_hours': round(hours, 2),
+                             'halflife_display': display, 'can_serve': hours >= SERVICE_THRESHOLD_HOURS})
+        else:
+            direct_pattern = rf'{re.escape(isotope)}\s*[~]?([\d.]+(?:–[\d.]+)?)\s*(min|h|d)'
+            match = re.search(direct_pattern, description)
+            if match:
+                value_str = match.group(1)
+                unit = match.group(2)
+                if '–' in value_str:
+                    value_str = value_str.split('–')[0]
+                try:
+                    value = float(value_str)
+                    if unit == 'min':
+                        hours = value / 60
+                    elif unit == 'd':
+                        hours = value * 24
+                    else:
+                        hours = value
+                    isotopes.append({'name': isotope, 'halflife_hours': round(hours, 2),
+                                     'halflife_display': f"{value_str} {unit}",
+                                     'can_serve': hours >= SERVICE_THRESHOLD_HOURS})
+                except ValueError:
+                    pass
+    isotopes.sort(key=lambda x: (not x['can_serve'], x['name']))
+    return isotopes
+
+def time_parser(parser, descriptions, rounds=3):
+    """Best of rounds passes over descriptions, in seconds."""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for description in descriptions:
+            parser(description)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    descriptions = synthetic_descriptions(n)
+    
+    as_dicts = lambda isotopes: [{'name': iso.name, 'halflife_hours': iso.halflife_hours,
+                                  'halflife_display': iso.halflife_display, 'can_serve': iso.can_serve}
+                                 for iso in isotopes]
+    mismatches = sum(1 for d in descriptions[:5000]
+                     if as_dicts(parse_isotopes_from_description(d)) != legacy_parse_isotopes_from_description(d))
+    
+    legacy = time_parser(legacy_parse_isotopes_from_description, descriptions)
+    current = time_parser(parse_isotopes_from_description, descriptions)
+    
+    print(f"Descriptions:        {n:,}")
+    print(f"Output differences:  {mismatches} (first 5,000)")
+    print(f"Legacy parser:       {legacy:.3f} s  ({legacy / n * 1e6:.1f} µs/desc)")
+    print(f"Single-pass matcher: {current:.3f} s  ({current / n * 1e6:.1f} µs/desc)")
+    print(f"Speed-up:            {legacy / current:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Memory footprint of a loaded dataset: the three DataFrames and the site records.
+
+Each tree is measured in a fresh interpreter on the same generated workbook:
+frame memory is pandas' deep memory_usage, site records are the Python
+allocations build_sites leaves behind (tracemalloc). Figures are scaled to
+100k sites, the unit every concurrent session pays for. --compare REF measures
+a git ref as well, for a before/after view.
+
+Usage: python benchmarks/bench_memory.py [--sites 100000] [--compare REF]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.bench_startup import checkout
+from benchmarks.workbook import write_workbook
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Run inside the measured tree; prints one JSON object
+MEASURE = """
+import gc, json, sys, tracemalloc
+sys.path.insert(0, '.')
+from nm_core import build_sites, read_workbook
+frames = read_workbook(sys.argv[1])
+gc.collect()
+tracemalloc.start()
+sites = build_sites(frames[1])
+gc.collect()
+print(json.dumps({
+    'sites': len(sites),
+    'frames': {name: int(df.memory_usage(index=True, deep=True).sum())
+               for name, df in zip(('Manufacturers', 'Legend', 'UPS_Gateways'), frames)},
+    'site_records': tracemalloc.get_traced_memory()[0],
+}))
+"""
+
+def measure(cwd, workbook):
+    result = subprocess.run([sys.executable, "-c", MEASURE, str(workbook)], cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"measuring {cwd} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def report(label, stats):
+    """Print MB per 100k sites for each part; returns the total."""
+    scale = 100_000 / max(stats['sites'], 1) / 1e6
+    parts = {**{f"frame {name}": nbytes for name, nbytes in stats['frames'].items()}, 'site records': stats['site_records']}
+    total = sum(parts.values()) * scale
+    print(f"[{label}] MB per 100k sites")
+    for name, nbytes in parts.items():
+        print(f"  {name:<22} {nbytes * scale:8.1f}")
+    print(f"  {'total':<22} {total:8.1f}")
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sites", type=int, default=100_000, help="sites in the generated workbook")
+    parser.add_argument("--compare", metavar="REF", help="also measure this git ref")
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'nm_bench_workbooks'),
+                        help="where generated workbooks are kept between runs")
+    args = parser.parse_args()
+
+    workbook = Path(args.workdir) / f"nm_bench_{args.sites}.xlsx"
+    if not workbook.exists():
+        workbook.parent.mkdir(parents=True, exist_ok=True)
+        write_workbook(workbook, args.sites)
+
+    if args.compare:
+        with tempfile.TemporaryDirectory() as tmp:
+            checkout(args.compare, tmp)
+            before = report(args.compare, measure(tmp, workbook))
+    after = report("working tree", measure(REPO_ROOT, workbook))
+    if args.compare:
+        print(f"\nworking tree uses {after / before:.0%} of {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Snapshot save/load and dataset diff on two revisions of a synthetic dataset.
+
+The second revision is the first with a month's worth of edits: sites removed,
+added and moved, isotopes added to some descriptions, other descriptions
+reworded without changing their isotopes, and gateway statuses changed. Times
+SnapshotStore.save and .load for one revision and diff_datasets between the
+two, and checks the diff finds exactly the injected changes.
+
+Usage: python benchmarks/bench_snapshot_diff.py [--sites 100000] [--changes 1000]
+"""
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nm_core import SnapshotStore, compact_frames, diff_datasets
+from benchmarks.bench_suite import time_case
+from benchmarks.workbook import synthetic_frames
+
+def next_revision(frames, changes, seed=7):
+    """frames with `changes` edits of each kind; returns (new frames, expected DatasetDiff counts)."""
+    df_map, df_legend, df_gateways = (df.copy() for df in frames)
+    rng = np.random.default_rng(seed)
+    removed, moved, edited, reworded = np.split(rng.choice(len(df_map), 4 * changes, replace=False), 4)
+    df_map.loc[moved, 'Latitude'] += np.float32(0.05)
+    df_legend.loc[edited, 'Description'] = df_legend.loc[edited, 'Description'] + ', Er-169'
+    df_legend.loc[reworded, 'Description'] = df_legend.loc[reworded, 'Description'] + ' (revised)'
+    df_map, df_legend = df_map.drop(index=removed), df_legend.drop(index=removed)
+    new_ids = np.arange(changes) + int(frames[0]['ID'].max()) + 1
+    df_map = pd.concat([df_map, pd.DataFrame({'ID': new_ids, 'Country': 'Norway', 'Latitude': 60.0, 'Longitude': 10.0})],
+                       ignore_index=True)
+    df_legend = pd.concat([df_legend, pd.DataFrame({'ID': new_ids, 'Description': 'Nordic Isotopes AS: Tc-99m, F-18'})],
+                          ignore_index=True)
+    df_gateways['Status'] = df_gateways['Status'].astype(object)
+    df_gateways.loc[:1, 'Status'] = df_gateways.loc[:1, 'Status'].map({'Current': 'Requested'}).fillna('Current')
+    expected = {'added': changes, 'removed': changes, 'moved': changes, 'isotopes': changes, 'gateways': 2}
+    return compact_frames((df_map, df_legend, df_gateways)), expected
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sites", type=int, default=100_000, help="sites in each revision")
+    parser.add_argument("--changes", type=int, default=1000, help="edits of each kind between the revisions")
+    args = parser.parse_args()
+
+    old = compact_frames(synthetic_frames(args.sites))
+    new, expected = next_revision(old, args.changes)
+    with tempfile.TemporaryDirectory() as tmp:
+        save = time_case(lambda: SnapshotStore(tempfile.mkdtemp(dir=tmp)).save(new))
+        store = SnapshotStore(tmp)
+        old_digest, new_digest = store.save(old, 'old'), store.save(new, 'new')
+        load = time_case(lambda: store.load(new_digest))
+        old, new = store.load(old_digest), store.load(new_digest)
+        diff = time_case(lambda: diff_datasets(old, new))
+        counts = diff_datasets(old, new).counts()
+
+    print(f"Sites per revision:  {args.sites:,}")
+    for name, stats in (('Save snapshot', save), ('Load snapshot', load), ('Diff revisions', diff)):
+        print(f"{name + ':':<20} {stats['median']:.3f} s  (min {stats['min']:.3f}, {stats['rounds']} rounds)")
+    print(f"Changes found:       {counts}")
+    print(f"Matches injected:    {counts == expected}")
+
+if __name__ == "__main__":
+    main()
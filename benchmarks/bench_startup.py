@@ -0,0 +1,89 @@
+"""
+Import-time budget report: cold-start cost of importing the app modules.
+
+Each module is imported in fresh interpreters under `python -X importtime`;
+the median cumulative import time is reported with the heaviest packages it
+pulled in. --compare REF measures the same modules in a git ref as well, for a
+before/after view.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--budget-ms MS] [--compare REF] [MODULE ...]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_MODULES = ("app1", "nm_core")
+
+# Packages worth calling out when they show up at import time
+HEAVY_PACKAGES = ("streamlit", "pandas", "numpy", "pyarrow", "folium", "branca", "jinja2", "openpyxl", "streamlit_folium")
+
+def import_profile(module, cwd):
+    """Import module once in a fresh interpreter.
+    Returns (total µs, {top-level package: cumulative µs of its outermost import})."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed in {cwd}:\n{result.stderr[-2000:]}")
+    total, packages = 0, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        package = name.strip().split(".")[0]
+        packages[package] = max(packages.get(package, 0), int(cumulative))
+        if name.strip() == module:
+            total = int(cumulative)
+    return total, packages
+
+def measure(module, cwd, runs):
+    """Median total import time (ms) of module and the packages loaded in the median run."""
+    profiles = [import_profile(module, cwd) for _ in range(runs)]
+    totals = [total / 1000 for total, _ in profiles]
+    median = statistics.median(totals)
+    return median, profiles[totals.index(min(totals, key=lambda t: abs(t - median)))][1]
+
+def checkout(ref, into):
+    """Extract the tree at a git ref into a directory (no worktree bookkeeping)."""
+    archive = subprocess.run(["git", "archive", ref], cwd=REPO_ROOT, capture_output=True, check=True)
+    subprocess.run(["tar", "-x", "-C", str(into)], input=archive.stdout, check=True)
+
+def report(label, cwd, modules, runs, budget_ms):
+    over = []
+    print(f"[{label}]")
+    for module in modules:
+        total_ms, packages = measure(module, cwd, runs)
+        heavy = ", ".join(f"{p} {packages[p] / 1000:.0f}" for p in HEAVY_PACKAGES if p in packages)
+        flag = "" if budget_ms is None or total_ms <= budget_ms else "  OVER BUDGET"
+        print(f"  {module:<10} {total_ms:8.0f} ms{flag}")
+        print(f"  {'':<10} heavy (ms): {heavy or '—'}")
+        if flag:
+            over.append(module)
+    return over
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_MODULES))
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module (median is reported)")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail when a module's import exceeds this")
+    parser.add_argument("--compare", metavar="REF", help="also measure the modules at this git ref")
+    args = parser.parse_args()
+
+    print(f"Cold import, median of {args.runs} runs")
+    if args.compare:
+        with tempfile.TemporaryDirectory() as tmp:
+            checkout(args.compare, tmp)
+            report(args.compare, tmp, [m for m in args.modules if (Path(tmp) / f"{m}.py").exists()], args.runs, None)
+    over = report("working tree", REPO_ROOT, args.modules, args.runs, args.budget_ms)
+    return 1 if over else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
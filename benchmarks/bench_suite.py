@@ -0,0 +1,154 @@
+"""
+Scaling benchmarks for the dashboard pipeline on synthetic workbooks.
+
+Times loading, isotope parsing, site building, map build and HTML
+serialization (markers and the aggregate density and country layers), the
+summary table, the legend HTML and transit viability at each size. Cases that
+derive per-site values drop the SiteMemo cache before every round, so they
+time the work; their /warm variants time a rerun that reuses it. Stats
+follow pytest-benchmark's shape (rounds, min, max, mean, median, stddev, in
+seconds) and --json writes them with the git version for comparing runs;
+--compare OLD.json prints the ratio against an earlier result file.
+
+Usage: python benchmarks/bench_suite.py [--sizes 10,100,1000,10000,100000]
+                                        [--only NAME] [--json OUT.json] [--compare OLD.json]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nm_core import (
+    build_sites, create_isotope_summary, create_legend_html, gateway_coverage,
+    parse_isotopes_batch, parse_isotopes_from_description, read_workbook, read_workbook_with_sidecar,
+    transit_viability,
+)
+from nm_map import create_map
+from benchmarks.workbook import write_workbook
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_SIZES = (10, 100, 1_000, 10_000, 100_000)
+
+def time_case(fn, setup=None, min_time=0.5, max_rounds=20):
+    """Call fn repeatedly (at least once, then until min_time has elapsed or max_rounds); stats in seconds.
+    setup runs untimed before each round and its result is passed to fn, as in pytest-benchmark's pedantic mode."""
+    timings = []
+    while not timings or (sum(timings) < min_time and len(timings) < max_rounds):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return {
+        'rounds': len(timings), 'min': min(timings), 'max': max(timings),
+        'mean': statistics.fmean(timings), 'median': statistics.median(timings),
+        'stddev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+def workbook_for(n_sites, workdir):
+    """Generated workbook for a size, reused across runs (generation dominates at 100k)."""
+    path = Path(workdir) / f"nm_bench_{n_sites}.xlsx"
+    if not path.exists():
+        write_workbook(path, n_sites)
+    return path
+
+def forget_derived(sites):
+    """The same sites with their SiteMemo values dropped, so the next call derives them again."""
+    for site in sites:
+        site.derived = None
+    return sites
+
+def cases_for(path):
+    """(name, callable, setup) triples for one workbook; the cases share the data loaded here."""
+    df_map, df_legend, df_gateways = read_workbook(path)
+    descriptions = df_legend['Description'].astype(str).tolist()
+    sites = build_sites(df_legend)
+    coverage = gateway_coverage(df_map, df_gateways)
+    read_workbook_with_sidecar(path)  # make sure the sidecar exists before timing a warm read
+    cold = lambda: forget_derived(sites)
+    warm = lambda: sites
+    build_map = lambda sites: create_map(df_map, sites, df_gateways)
+
+    return [
+        ('load_data/read_workbook', lambda: read_workbook(path), None),
+        ('load_data/sidecar', lambda: read_workbook_with_sidecar(path), None),
+        ('parse_isotopes_from_description', lambda: [parse_isotopes_from_description(d) for d in descriptions], None),
+        ('parse_isotopes_batch', lambda: parse_isotopes_batch(df_legend['Description'].astype(str)), None),
+        ('build_sites', lambda: build_sites(df_legend), None),
+        ('create_map/build', build_map, cold),
+        ('create_map/build/warm', build_map, warm),
+        # a folium map renders once, so each round renders a freshly built (untimed) map
+        ('create_map/render', lambda m: m.get_root().render(), lambda: build_map(cold())),
+        ('create_map/density', lambda sites: create_map(df_map, sites, df_gateways, site_layer='density').get_root().render(), cold),
+        ('create_map/countries', lambda sites: create_map(df_map, sites, df_gateways, site_layer='countries').get_root().render(), cold),
+        ('create_isotope_summary', lambda sites: create_isotope_summary(sites, coverage), cold),
+        ('create_isotope_summary/warm', lambda sites: create_isotope_summary(sites, coverage), warm),
+        ('create_legend_html', create_legend_html, cold),
+        ('create_legend_html/warm', create_legend_html, warm),
+        ('transit_viability', lambda: transit_viability(df_map, df_gateways, sites), None),
+    ]
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, old_path):
+    """Print median time per case against an earlier --json file (ratio > 1 means slower now)."""
+    old = {(b['name'], b['params']['sites']): b['stats']['median']
+           for b in json.loads(Path(old_path).read_text())['benchmarks']}
+    print(f"\nvs {old_path}")
+    for bench in results:
+        before = old.get((bench['name'], bench['params']['sites']))
+        if before:
+            print(f"  {bench['name']:<34} {bench['params']['sites']:>7,}  {bench['stats']['median'] / before:6.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling benchmarks on synthetic workbooks.")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated site counts")
+    parser.add_argument('--only', default=None, help="run only cases whose name contains this")
+    parser.add_argument('--min-time', type=float, default=0.5, help="target seconds of rounds per case")
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'nm_bench_workbooks'),
+                        help="where generated workbooks are kept between runs")
+    parser.add_argument('--json', dest='json_path', default=None, help="write results to this file")
+    parser.add_argument('--compare', default=None, help="earlier --json file to compare against")
+    args = parser.parse_args()
+    Path(args.workdir).mkdir(parents=True, exist_ok=True)
+
+    results = []
+    for n_sites in (int(size) for size in args.sizes.split(',')):
+        path = workbook_for(n_sites, args.workdir)
+        print(f"{n_sites:,} sites ({path.stat().st_size / 1024:,.0f} KB)")
+        for name, fn, setup in cases_for(path):
+            if args.only and args.only not in name:
+                continue
+            stats = time_case(fn, setup, args.min_time)
+            results.append({'group': name.split('/')[0], 'name': name, 'params': {'sites': n_sites}, 'stats': stats})
+            print(f"  {name:<34} {stats['median'] * 1000:10.2f} ms  (min {stats['min'] * 1000:.2f}, {stats['rounds']} rounds)")
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps({
+            'version': git_version(),
+            'datetime': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'machine_info': {'python': platform.python_version(), 'platform': platform.platform(),
+                             'cpu_count': os.cpu_count()},
+            'benchmarks': results,
+        }, indent=2))
+        print(f"\nwrote {args.json_path}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Synthetic nm_manufacturers_data.xlsx workbooks at any size.
+
+Sites are scattered over EMEA countries with legend descriptions in the style
+of the real workbook (company, city, product line, isotopes with and without
+explicit half-lives); gateways carry a mix of Current/Development/Requested.
+
+Usage: python benchmarks/workbook.py N_SITES OUT.xlsx [--gateways M] [--seed S] [--force]
+"""
+
+import argparse
+import random
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nm_core import FEATURED_ISOTOPES
+
+# Country -> (lat min, lat max, lon min, lon max), roughly the populated mainland
+COUNTRY_BOUNDS = {
+    'Germany': (47.5, 54.8, 6.0, 14.8), 'France': (43.3, 50.9, -1.5, 7.5),
+    'Italy': (38.0, 46.5, 7.5, 16.5), 'Spain': (36.8, 43.5, -8.5, 2.8),
+    'United Kingdom': (50.5, 55.8, -4.5, 1.5), 'Netherlands': (51.4, 53.3, 4.0, 6.9),
+    'Belgium': (49.7, 51.4, 2.7, 6.2), 'Poland': (49.5, 54.6, 14.5, 23.8),
+    'Czech Republic': (48.7, 50.9, 12.5, 18.6), 'Austria': (46.5, 48.9, 9.6, 16.9),
+    'Switzerland': (45.9, 47.7, 6.1, 10.3), 'Sweden': (55.5, 60.5, 11.5, 18.5),
+    'Denmark': (54.8, 57.5, 8.2, 12.6), 'Hungary': (45.8, 48.5, 16.2, 22.8),
+    'Türkiye': (36.5, 41.5, 27.0, 40.0), 'Israel': (29.6, 33.2, 34.3, 35.8),
+    'Saudi Arabia': (18.0, 28.0, 38.0, 50.0), 'South Africa': (-34.0, -24.0, 18.5, 31.5),
+}
+
+# Airports used as gateway seeds: (code, city, country, lat, lon)
+GATEWAY_AIRPORTS = [
+    ('FRA', 'Frankfurt', 'Germany', 50.03, 8.57), ('CDG', 'Paris', 'France', 49.01, 2.55),
+    ('MXP', 'Milan', 'Italy', 45.63, 8.72), ('MAD', 'Madrid', 'Spain', 40.47, -3.56),
+    ('LHR', 'London', 'United Kingdom', 51.47, -0.45), ('AMS', 'Amsterdam', 'Netherlands', 52.31, 4.76),
+    ('BRU', 'Brussels', 'Belgium', 50.90, 4.48), ('WAW', 'Warsaw', 'Poland', 52.17, 20.97),
+    ('VIE', 'Vienna', 'Austria', 48.11, 16.57), ('ZRH', 'Zurich', 'Switzerland', 47.46, 8.55),
+    ('CPH', 'Copenhagen', 'Denmark', 55.62, 12.65), ('IST', 'Istanbul', 'Türkiye', 41.26, 28.74),
+    ('TLV', 'Tel Aviv', 'Israel', 32.01, 34.89), ('RUH', 'Riyadh', 'Saudi Arabia', 24.96, 46.70),
+    ('JNB', 'Johannesburg', 'South Africa', -26.14, 28.25), ('CGN', 'Cologne', 'Germany', 50.87, 7.14),
+]
+GATEWAY_STATUSES = ['Current', 'Current', 'Development', 'Requested']
+
+# Isotopes outside FEATURED_ISOTOPES, with the half-life text a description would carry
+# (the nuclide table's value wins over the stated one when parsing)
+UNLISTED_ISOTOPES = [
+    ('Cu-64', '12.7 h'), ('Zr-89', '78.4 h'), ('C-11', '20.4 min'), ('N-13', '10 min'),
+    ('Pb-212', '10.6 h'), ('In-111', '2.8 d'), ('Sc-47', '3.35 d'), ('Cu-67', '61.8–62 h'),
+]
+
+COMPANY_WORDS = ['Radiopharma', 'Isotopen', 'Nuclear', 'Curium', 'Cyclotron', 'Medical', 'PET', 'Theranostics']
+COMPANY_SUFFIXES = ['GmbH', 'SAS', 'S.p.A.', 'B.V.', 'Ltd', 'AG', 'S.A.', 'sp. z o.o.']
+PRODUCT_LINES = ['production', 'cyclotron production', 'generator supply', 'radiolabelling', 'GMP manufacturing']
+
+def synthetic_description(rng, i, city=None):
+    """One legend description mixing reference and unlisted isotopes."""
+    parts = [rng.choice(FEATURED_ISOTOPES) for _ in range(rng.randint(1, 3))]
+    parts += [f"{name} ~{halflife}" for name, halflife in rng.sample(UNLISTED_ISOTOPES, rng.randint(0, 2))]
+    rng.shuffle(parts)
+    company = f"{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_SUFFIXES)}"
+    return f"{company} – {city or f'Site {i % 500}'} (Facility {i}); {rng.choice(PRODUCT_LINES)}: {', '.join(parts)}"
+
+def synthetic_descriptions(n, seed=42):
+    """Legend-style descriptions mixing reference and unlisted isotopes."""
+    rng = random.Random(seed)
+    return [synthetic_description(rng, i) for i in range(n)]
+
+def synthetic_frames(n_sites, n_gateways=len(GATEWAY_AIRPORTS), seed=42):
+    """(Manufacturers, Legend, UPS_Gateways) frames as read_workbook returns them."""
+    rng = random.Random(seed)
+    countries = list(COUNTRY_BOUNDS)
+    manufacturers, legend = [], []
+    for site_id in range(1, n_sites + 1):
+        country = rng.choice(countries)
+        lat_min, lat_max, lon_min, lon_max = COUNTRY_BOUNDS[country]
+        manufacturers.append((site_id, country, round(rng.uniform(lat_min, lat_max), 5),
+                              round(rng.uniform(lon_min, lon_max), 5)))
+        legend.append((site_id, synthetic_description(rng, site_id, f"{country} {site_id % 97}")))
+    gateways = []
+    for i in range(n_gateways):
+        code, city, country, lat, lon = GATEWAY_AIRPORTS[i % len(GATEWAY_AIRPORTS)]
+        if i >= len(GATEWAY_AIRPORTS):  # beyond the seed list: jittered satellites of real airports
+            code, lat, lon = f"{code}{i // len(GATEWAY_AIRPORTS)}", lat + rng.uniform(-2, 2), lon + rng.uniform(-2, 2)
+        gateways.append((code, city, country, rng.choice(GATEWAY_STATUSES), round(lat, 4), round(lon, 4)))
+    return (
+        pd.DataFrame(manufacturers, columns=['ID', 'Country', 'Latitude', 'Longitude']),
+        pd.DataFrame(legend, columns=['ID', 'Description']),
+        pd.DataFrame(gateways, columns=['Code', 'City', 'Country', 'Status', 'Latitude', 'Longitude']),
+    )
+
+def write_workbook(path, n_sites, n_gateways=len(GATEWAY_AIRPORTS), seed=42):
+    """Write a workbook with the bundled layout (title row above the Manufacturers header)."""
+    df_map, df_legend, df_gateways = synthetic_frames(n_sites, n_gateways, seed)
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        pd.DataFrame([['Nuclear medicine manufacturers']]).to_excel(
+            writer, sheet_name='Manufacturers', index=False, header=False)
+        df_map.to_excel(writer, sheet_name='Manufacturers', index=False, startrow=1)
+        df_legend.to_excel(writer, sheet_name='Legend', index=False)
+        df_gateways.to_excel(writer, sheet_name='UPS_Gateways', index=False)
+    return Path(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic nm_manufacturers_data.xlsx workbook.")
+    parser.add_argument('sites', type=int)
+    parser.add_argument('out', type=Path)
+    parser.add_argument('--gateways', type=int, default=len(GATEWAY_AIRPORTS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--force', action='store_true', help="overwrite OUT if it exists")
+    args = parser.parse_args()
+    if args.out.exists() and not args.force:
+        parser.error(f"{args.out} exists; pass --force to overwrite it")
+    path = write_workbook(args.out, args.sites, args.gateways, args.seed)
+    print(f"{path}: {args.sites:,} sites, {args.gateways} gateways")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2333 @@
+"""
+Nuclear Medicine EMEA Manufacturing Dashboard - data and map engine
+
+Workbook loading, isotope parsing, site classification, gateway geometry and
+popup content. Free of Streamlit so it can run headless (see nm_report.py), and
+of folium, which only nm_map.py imports; app1.py adds caching and the dashboard on top.
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from dataclasses import dataclass, field
+import csv
+import gc
+import hashlib
+import html
+import io
+import multiprocessing
+import os
+import json
+import pickle
+import posixpath
+import re
+import shutil
+import threading
+import weakref
+import zipfile
+import logging
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from itertools import accumulate, chain
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+# Marken UPS Healthcare Logistics Color Palette
+COLORS = {
+    'marken_deep_green': '#0D3B2E',
+    'marken_green': '#1A6B52',
+    'marken_accent': '#28B463',
+    'marken_blue': '#1B4F72',
+    'ups_brown': '#351C15',
+    'can_serve': '#22A06B',       # Green - can serve (≥6h half-life)
+    'cannot_serve': '#DC2626',    # Red - cannot serve (<6h half-life)
+    'partial_serve': '#F59E0B',   # Amber - mixed isotopes
+    # Gateway status colors
+    'gateway_current': '#22A06B',      # Green - Current/Active
+    'gateway_development': '#F59E0B',  # Yellow/Amber - Development
+    'gateway_requested': '#DC2626',    # Red - Requested
+}
+
+# Common medical isotopes, listed in the dashboard's half-life reference; half-lives of these
+# and every other nuclide come from the nuclide table (see NuclideTable)
+FEATURED_ISOTOPES = (
+    'Mo-99', 'Lu-177', 'I-131', 'Ac-225', 'Tc-99m', 'Tb-161', 'Ga-68',
+    'Y-90', 'F-18', 'Ho-166', 'Re-188', 'I-125', 'Sm-153', 'Ra-223',
+)
+
+# Nuclide half-lives (columns nuclide, halflife, unit); a CSV or Parquet file in this layout,
+# e.g. a full NUBASE export, can replace it
+NUCLIDE_TABLE_PATH = Path(__file__).parent / "nm_nuclides.csv"
+
+# Element symbols in atomic-number order
+ELEMENT_SYMBOLS = (
+    'H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar K Ca Sc Ti V Cr Mn Fe Co Ni Cu Zn Ga Ge As Se Br Kr '
+    'Rb Sr Y Zr Nb Mo Tc Ru Rh Pd Ag Cd In Sn Sb Te I Xe Cs Ba La Ce Pr Nd Pm Sm Eu Gd Tb Dy Ho Er Tm Yb '
+    'Lu Hf Ta W Re Os Ir Pt Au Hg Tl Pb Bi Po At Rn Fr Ra Ac Th Pa U Np Pu Am Cm Bk Cf Es Fm Md No Lr '
+    'Rf Db Sg Bh Hs Mt Ds Rg Cn Nh Fl Mc Lv Ts Og'
+).split()
+ELEMENT_Z = {symbol: z for z, symbol in enumerate(ELEMENT_SYMBOLS, start=1)}
+
+SERVICE_THRESHOLD_HOURS = 6.0
+
+# Transit decay model defaults: road/air-feeder speed to the gateway, fixed handling
+# time (pick-up, packing, hand-over) and the activity fraction that must remain on arrival
+TRANSIT_SPEED_KMH = 60.0
+TRANSIT_HANDLING_HOURS = 3.0
+MIN_REMAINING_ACTIVITY = 0.5
+GATEWAY_RADIUS_METERS = 120000
+
+# Above this many sites the map switches to a single clustered marker layer
+SCALABLE_MAP_SITE_THRESHOLD = 1500
+
+# Viewport mode: individual markers up to this many sites in view, zoom-level grid aggregates beyond
+VIEWPORT_MAX_MARKERS = 400
+VIEWPORT_AGGREGATE_CELL_PX = 64
+# (south, west, north, east) of the initial EMEA view, used until the browser reports its bounds
+DEFAULT_VIEW_BOUNDS = (30.0, -15.0, 65.0, 40.0)
+DEFAULT_VIEW_ZOOM = 4
+
+# How the map draws sites: one marker each, or aggregates whose size depends on bins, not sites
+SITE_LAYERS = {'markers': "Site markers", 'density': "Site density", 'countries': "Countries"}
+# Hexagon size of the density layer, center to corner (about 55 km)
+HEXBIN_SIZE_DEG = 0.5
+# Optional country borders (GeoJSON features with a 'name' property); without it each country
+# is drawn as the convex hull of its sites, widened by COUNTRY_HULL_PAD_DEG
+COUNTRY_BOUNDARIES_PATH = Path(__file__).parent / "nm_countries.geojson"
+COUNTRY_HULL_PAD_DEG = 0.3
+
+# Dataset diff map overlay: kind of change -> (layer name, color)
+DIFF_STYLES = {
+    'added': ("Added sites", COLORS['can_serve']),
+    'removed': ("Removed sites", COLORS['cannot_serve']),
+    'moved': ("Moved sites", COLORS['partial_serve']),
+    'isotopes': ("Isotope changes", COLORS['marken_blue']),
+    'gateways': ("Gateway changes", COLORS['ups_brown']),
+}
+# Changes drawn per diff map layer; a diff between unrelated datasets lists the rest in its tables only
+DIFF_MAP_MAX_MARKERS = 2000
+
+# Rendered map HTML cache limits (shared by all sessions)
+MAP_CACHE_MAX_ENTRIES = 32
+MAP_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Parsed uploads cached on local disk by content hash (shared by all sessions and restarts)
+UPLOAD_CACHE_DIR = Path(__file__).parent / ".nm_upload_cache"
+UPLOAD_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Every loaded dataset as Parquet files keyed by content hash, for diffing revisions
+SNAPSHOT_DIR = Path(__file__).parent / ".nm_snapshots"
+SNAPSHOT_MAX_BYTES = 1024 * 1024 * 1024
+# Sites whose coordinates shift by less than this are not reported as moved
+SNAPSHOT_MOVE_KM = 0.1
+
+# Rows per page of the server-side paginated tables
+TABLE_PAGE_SIZE = 50
+
+# Single-pass isotope matcher: nuclide symbol in any common spelling (Cu-64, Tc-99m, Tc99m,
+# 99mTc), optionally followed by a half-life value or range and unit (e.g. "~12.7 h", "2.7–3.3 d").
+# Opening with one character class (then branching on it) lets the regex engine skip ahead to
+# candidate characters; the symbol must not be glued to a preceding letter or digit, and Tc99m
+# style spellings must end a word (no suffix such as "C14B" or "P32-200"). Unhyphenated spellings
+# must also name a nuclide in the table (see NuclideTable.mention), so codes like "Co50" are skipped.
+ISOTOPE_PATTERN = re.compile(
+    r'([\dA-Z](?<![A-Za-z\d].)(?:(?<=[A-Z])[a-z]?(?:-\d{1,3}m?(?![a-z])|\d{1,3}m?(?![\w-]))|(?<=\d)\d{0,2}m?[A-Z][a-z]?(?![a-z])))'
+    r'(?:\s*~?([\d.]+)(?:–[\d.]+)?\s*(min|h|d))?'
+)
+# One matched symbol, split into element, mass number and metastable flag
+NUCLIDE_SYMBOL_PATTERN = re.compile(r'([A-Z][a-z]?)-?(\d+)(m?)|(\d+)(m?)([A-Z][a-z]?)')
+
+HALFLIFE_UNIT_HOURS = {'s': 1 / 3600, 'min': 1 / 60, 'h': 1.0, 'd': 24.0, 'y': 24.0 * 365.25}
+
+def format_halflife(hours):
+    """Human-readable half-life in the most natural unit."""
+    if hours < 1:
+        return f"{hours*60:.1f} min"
+    elif hours < 24:
+        return f"{hours:.1f} h"
+    elif hours < HALFLIFE_UNIT_HOURS['y']:
+        return f"{hours/24:.1f} d"
+    else:
+        return f"{hours/HALFLIFE_UNIT_HOURS['y']:.3g} y"
+
+def canonical_nuclide(symbol):
+    """'Tc-99m' for 'Tc-99m', 'Tc99m' or '99mTc'; None when the element does not exist or the
+    mass number is below its atomic number."""
+    match = NUCLIDE_SYMBOL_PATTERN.fullmatch(symbol.strip())
+    if match is None:
+        return None
+    element, mass, metastable = match.group(1, 2, 3) if match.group(1) else match.group(6, 4, 5)
+    z = ELEMENT_Z.get(element)
+    if z is None or not z <= int(mass) <= 300:
+        return None
+    return f"{element}-{int(mass)}{metastable}"
+
+class NuclideTable:
+    """Half-lives in hours keyed by canonical nuclide symbol, read from a CSV or Parquet table
+    (columns nuclide, halflife, unit) on the first half-life lookup so importing stays cheap.
+    Symbol spellings are canonicalized once and remembered, so lookups are dict hits."""
+
+    def __init__(self, path=NUCLIDE_TABLE_PATH):
+        self.path = Path(path)
+        self._hours = None
+        self._symbols = {}
+        self._mentions = {}
+        self._lock = threading.Lock()
+
+    @property
+    def hours(self):
+        if self._hours is None:
+            with self._lock:
+                if self._hours is None:
+                    self._hours = self._load()
+        return self._hours
+
+    def _load(self):
+        if self.path.suffix == '.parquet':
+            rows = pd.read_parquet(self.path, columns=['nuclide', 'halflife', 'unit']).itertuples(index=False)
+        else:
+            with open(self.path, newline='', encoding='utf-8') as f:
+                rows = [(row['nuclide'], row['halflife'], row['unit']) for row in csv.DictReader(f)]
+        hours = {}
+        for nuclide, halflife, unit in rows:
+            name = self.canonical(nuclide)
+            if name is None or unit not in HALFLIFE_UNIT_HOURS:
+                raise ValueError(f"{self.path}: bad nuclide row {nuclide!r}, {halflife!r} {unit!r}")
+            hours[name] = float(halflife) * HALFLIFE_UNIT_HOURS[unit]
+        return hours
+
+    def canonical(self, symbol):
+        """Canonical form of a nuclide symbol (see canonical_nuclide), memoized per spelling."""
+        try:
+            return self._symbols[symbol]
+        except KeyError:
+            name = self._symbols[symbol] = canonical_nuclide(symbol)
+            return name
+
+    def mention(self, symbol):
+        """Canonical form of a symbol matched in free text, or None. Hyphenated spellings are
+        taken as written; Tc99m and 99mTc style ones only name nuclides in the table."""
+        try:
+            return self._mentions[symbol]
+        except KeyError:
+            name = self.canonical(symbol)
+            if name is not None and '-' not in symbol and name not in self.hours:
+                name = None
+            self._mentions[symbol] = name
+            return name
+
+    def halflife_hours(self, symbol):
+        """Half-life in hours of a nuclide in any spelling, or None when it is not in the table."""
+        return self.hours.get(self.canonical(symbol))
+
+    def __contains__(self, symbol):
+        return self.canonical(symbol) in self.hours
+
+    def __len__(self):
+        return len(self.hours)
+
+NUCLIDES = NuclideTable()
+
+def parse_isotopes_from_description(description):
+    """Extract isotopes and their half-lives from description text.
+    Prioritizes reference database for accuracy over potentially ambiguous parsed values."""
+    # One scan collects every mention in order, keeping the first parsed half-life per isotope
+    mentions = {}
+    mention = NUCLIDES.mention
+    for match in ISOTOPE_PATTERN.finditer(description):
+        symbol, value_str, unit = match.groups()
+        isotope = mention(symbol)
+        if isotope is None:
+            continue
+        if mentions.get(isotope) is None:
+            mentions[isotope] = (value_str, unit) if unit else None
+
+    isotopes = []
+    for isotope, parsed in mentions.items():
+        # For known isotopes, always use the nuclide table (more reliable than parsing)
+        known = _TABLE_ISOTOPES.get(isotope)
+        if known is not None:
+            isotopes.append(known)
+            continue
+        hours = NUCLIDES.hours.get(isotope)
+        stated = None
+        if hours is None:
+            if parsed is None:
+                continue
+            # For unknown isotopes, use the half-life stated in the description
+            value_str, unit = parsed
+            try:
+                hours = float(value_str) * HALFLIFE_UNIT_HOURS[unit]
+            except ValueError:
+                continue
+            stated = f"{value_str} {unit}"
+
+        known = make_isotope(isotope, round(hours, 2), hours >= SERVICE_THRESHOLD_HOURS, stated)
+        if stated is None:
+            _TABLE_ISOTOPES[isotope] = known
+        isotopes.append(known)
+
+    # Sort: can serve first, then cannot serve, then by name
+    isotopes.sort(key=lambda x: (not x.can_serve, x.name))
+
+    return isotopes
+
+def get_site_serviceability(isotopes):
+    """Determine overall site serviceability based on isotopes."""
+    if not isotopes:
+        return 'unknown'
+
+    can_serve_count = sum(1 for i in isotopes if i.can_serve)
+    cannot_serve_count = len(isotopes) - can_serve_count
+
+    if cannot_serve_count == 0:
+        return 'can_serve'
+    elif can_serve_count == 0:
+        return 'cannot_serve'
+    else:
+        return 'partial_serve'
+
+def parse_isotopes_batch(descriptions, site_ids=None):
+    """Vectorized parse of a whole Description column, for callers that want a long-form frame
+    (building SiteRecords row by row is faster; see build_sites).
+    Returns one row per (legend row, isotope) with columns row, site_id, isotope,
+    halflife_hours, halflife_display and can_serve; same rules as parse_isotopes_from_description."""
+    descriptions = pd.Series(descriptions, dtype=object).reset_index(drop=True).fillna('').astype(str)
+    if site_ids is None:
+        site_ids = descriptions.index
+    site_ids = pd.Series(site_ids, dtype=object).reset_index(drop=True)
+
+    # One regex pass per description (C-level findall), flattened to one row per mention
+    matches = descriptions.str.findall(ISOTOPE_PATTERN).explode().dropna()
+    mentions = pd.DataFrame(matches.tolist(), columns=['isotope', 'value', 'unit'], dtype=object)
+    mentions.insert(0, 'row', matches.index.to_numpy())
+    mentions['unit'] = mentions['unit'].replace('', None)
+    # Every spelling of a nuclide under its canonical symbol; unknown elements are dropped
+    mentions['isotope'] = mentions['isotope'].map({s: NUCLIDES.mention(s) for s in mentions['isotope'].unique()})
+    mentions = mentions.dropna(subset=['isotope'])
+
+    # Every isotope once per row, with the first half-life stated for it (if any)
+    stated = mentions.dropna(subset=['unit']).drop_duplicates(['row', 'isotope'])
+    long_df = mentions[['row', 'isotope']].drop_duplicates().merge(
+        stated, on=['row', 'isotope'], how='left')
+
+    # Nuclide table wins; otherwise convert the stated value to hours.
+    # Lookups run over the (few) distinct symbols/units rather than every row.
+    isotope_codes = long_df['isotope'].astype('category')
+    known = {name: NUCLIDES.hours[name] for name in isotope_codes.cat.categories if name in NUCLIDES.hours}
+    known_hours = isotope_codes.map(known).astype(float)
+    unit_hours = long_df['unit'].astype('category').map(HALFLIFE_UNIT_HOURS).astype(float)
+    stated_hours = pd.to_numeric(long_df['value'], errors='coerce') * unit_hours
+    hours = known_hours.fillna(stated_hours)
+    long_df['halflife_display'] = isotope_codes.map(
+        {name: format_halflife(h) for name, h in known.items()}
+    ).astype(object).fillna(long_df['value'] + ' ' + long_df['unit'])
+    long_df['halflife_hours'] = hours.round(2)
+    long_df['can_serve'] = hours >= SERVICE_THRESHOLD_HOURS
+    long_df = long_df[hours.notna()].copy()
+
+    long_df['site_id'] = site_ids.iloc[long_df['row'].to_numpy()].to_numpy()
+    long_df = long_df.sort_values(['row', 'can_serve', 'isotope'], ascending=[True, False, True], kind='stable')
+    return long_df[['row', 'site_id', 'isotope', 'halflife_hours', 'halflife_display', 'can_serve']].reset_index(drop=True)
+
+# Marker fill / border colors per serviceability class ('unknown' falls back to partial)
+SERVICEABILITY_COLORS = {
+    'can_serve': (COLORS['can_serve'], '#065F46'),
+    'cannot_serve': (COLORS['cannot_serve'], '#7F1D1D'),
+    'partial_serve': (COLORS['partial_serve'], '#92400E'),
+}
+
+@dataclass(frozen=True, slots=True)
+class Isotope:
+    """One isotope of a site. Instances are shared (see make_isotope): every site naming Tc-99m
+    with the same classification holds the same object, so isotopes cost a pointer per site."""
+    name: str
+    halflife_hours: float
+    can_serve: bool
+    stated: str = None  # half-life as written in the description, for nuclides not in the table
+
+    @property
+    def halflife_display(self):
+        # formatted on first render, from the table's exact half-life: halflife_hours is rounded
+        # to 0.01 h, too coarse for minutes
+        display = _HALFLIFE_DISPLAYS.get(self)
+        if display is None:
+            display = _HALFLIFE_DISPLAYS[self] = (
+                self.stated or format_halflife(NUCLIDES.hours.get(self.name, self.halflife_hours)))
+        return display
+
+    def __reduce__(self):
+        # unpickled isotopes are shared like parsed ones
+        return make_isotope, (self.name, self.halflife_hours, self.can_serve, self.stated)
+
+# (name, hours, can_serve, stated) -> Isotope; a few entries per distinct nuclide
+_ISOTOPES = {}
+# Nuclide-table name -> its parsed Isotope, which depends on the name alone
+_TABLE_ISOTOPES = {}
+# Isotope -> its half-life display string, filled as isotopes are rendered
+_HALFLIFE_DISPLAYS = {}
+
+def make_isotope(name, halflife_hours, can_serve, stated=None):
+    """The shared Isotope with these values, created on first use."""
+    key = (name, halflife_hours, bool(can_serve), stated)
+    isotope = _ISOTOPES.get(key)
+    if isotope is None:
+        isotope = _ISOTOPES.setdefault(key, Isotope(*key))
+    return isotope
+
+@dataclass(slots=True)
+class SiteRecord:
+    """Parsed and classified manufacturing site, shared by the KPIs, map, legend and summary."""
+    site_id: object
+    description: str
+    isotopes: tuple = ()
+    serviceability: str = 'unknown'
+    derived: dict = field(default=None, compare=False, repr=False)  # SiteMemo values
+
+    @property
+    def name(self):
+        # Site name is the description up to the first parenthesis or semicolon
+        return self.description.split('(')[0].split(';')[0].strip()
+
+    @property
+    def color(self):
+        return SERVICEABILITY_COLORS.get(self.serviceability, SERVICEABILITY_COLORS['partial_serve'])[0]
+
+    @property
+    def border_color(self):
+        return SERVICEABILITY_COLORS.get(self.serviceability, SERVICEABILITY_COLORS['partial_serve'])[1]
+
+    def __getstate__(self):
+        # SiteMemo values are per-process caches; they are not worth pickling
+        return None, {name: None if name == 'derived' else getattr(self, name) for name in self.__slots__}
+
+def build_site_record(site_id, description):
+    """Parse a single legend description into a SiteRecord."""
+    isotopes = parse_isotopes_from_description(description)
+    return SiteRecord(site_id, description, tuple(isotopes), get_site_serviceability(isotopes))
+
+def reclassify_site(site, serves):
+    """Copy of a SiteRecord with each isotope's can_serve set by serves(isotope)."""
+    isotopes = []
+    for iso in site.isotopes:
+        flag = bool(serves(iso))
+        isotopes.append(iso if flag == iso.can_serve else make_isotope(iso.name, iso.halflife_hours, flag, iso.stated))
+    isotopes.sort(key=lambda x: (not x.can_serve, x.name))
+    return SiteRecord(site.site_id, site.description, tuple(isotopes), get_site_serviceability(isotopes))
+
+def reclassify_sites(sites, can_serve):
+    """Copy SiteRecords with per-isotope can_serve flags replaced.
+    can_serve maps (site_id, isotope name) -> bool; isotopes missing from it keep their flag."""
+    return [
+        reclassify_site(site, lambda iso, site_id=site.site_id: can_serve.get((site_id, iso.name), iso.can_serve))
+        for site in sites
+    ]
+
+class HalflifeIndex:
+    """Per-site isotope half-lives, sorted within each site and laid out back to back
+    (CSR style), so any half-life threshold is applied with one vectorized pass instead
+    of re-parsing descriptions.
+
+    Because each site's half-lives are sorted, its first serviceable isotope sits after
+    the ones below the threshold; a running count of those gives every site's split
+    point exactly, whatever the range of half-lives (seconds to billions of years)."""
+
+    def __init__(self, sites):
+        counts = np.array([len(site.isotopes) for site in sites], dtype=np.int64)
+        self.starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64) if len(sites) else counts
+        self.ends = self.starts + counts
+        hours = [sorted(iso.halflife_hours for iso in site.isotopes) for site in sites]
+        self.hours = np.array([h for site_hours in hours for h in site_hours], dtype=float)
+
+    def first_serviceable(self, threshold_hours):
+        """Position of each site's first isotope with half-life >= threshold (== end if none)."""
+        below = np.concatenate([[0], np.cumsum(self.hours < threshold_hours)])
+        return self.starts + below[self.ends] - below[self.starts]
+
+    def serviceable_counts(self, threshold_hours):
+        """(serviceable isotopes, total isotopes) per site."""
+        split = self.first_serviceable(threshold_hours)
+        return self.ends - split, self.ends - self.starts
+
+    def changed_sites(self, from_hours, to_hours):
+        """Site positions whose isotope classification differs between two thresholds."""
+        return np.nonzero(self.first_serviceable(from_hours) != self.first_serviceable(to_hours))[0]
+
+def threshold_sites(sites, threshold_hours, index=None):
+    """Reclassify sites for a different half-life threshold without re-parsing.
+    Only sites with an isotope between the default and the new threshold are rebuilt;
+    pass a prebuilt HalflifeIndex to reuse it across thresholds."""
+    if threshold_hours == SERVICE_THRESHOLD_HOURS:
+        return sites
+    if index is None:
+        index = HalflifeIndex(sites)
+    changed = index.changed_sites(SERVICE_THRESHOLD_HOURS, threshold_hours)
+    if len(changed) == 0:
+        return sites
+    serves = lambda iso: iso.halflife_hours >= threshold_hours
+    reclassified = list(sites)
+    for i in changed.tolist():
+        reclassified[i] = reclassify_site(sites[i], serves)
+    return reclassified
+
+# Content digest per live DataFrame, keyed by identity; entries go when the frame does
+_FRAME_DIGESTS = {}
+
+def frame_digest(df):
+    """Content hash of one DataFrame (values, index and column names), computed once per frame
+    object. Frames are treated as immutable once loaded, as everywhere in the dashboard."""
+    key = id(df)
+    entry = _FRAME_DIGESTS.get(key)
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+    digest = hashlib.sha256(repr(list(df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    value = digest.digest()
+    _FRAME_DIGESTS[key] = (weakref.ref(df, lambda _, key=key: _FRAME_DIGESTS.pop(key, None)), value)
+    return value
+
+def data_fingerprint(*frames):
+    """Stable content hash of one or more DataFrames (values, index and column names)."""
+    digest = hashlib.sha256()
+    for df in frames:
+        digest.update(b'<none>' if df is None else frame_digest(df))
+    return digest.hexdigest()
+
+def build_sites(df_legend):
+    """Parse every legend description into SiteRecords (legend order).
+    Row by row: the single-pass parser beats parse_isotopes_batch plus regrouping its long frame."""
+    descriptions = df_legend['Description'].fillna('').astype(str).tolist()
+    sites = list(map(build_site_record, df_legend['ID'].tolist(), descriptions))
+    # Sites listing the same isotopes share one tuple
+    shared = {}
+    for site in sites:
+        if site.isotopes:
+            site.isotopes = shared.setdefault(site.isotopes, site.isotopes)
+    return sites
+
+class SiteBuilder:
+    """build_sites that remembers its last build: legend rows whose ID and description are
+    unchanged (matched by row hash) keep their SiteRecord and only new or edited rows are
+    parsed, so reloading an edited workbook costs in proportion to the edit. Thread-safe."""
+
+    def __init__(self):
+        self.parsed = 0  # legend rows parsed by the last build
+        self._hashes = None
+        self._sites = None
+        self._lock = threading.Lock()
+
+    def build(self, df_legend):
+        hashes = pd.util.hash_pandas_object(df_legend[['ID', 'Description']], index=False).to_numpy()
+        with self._lock:
+            previous_hashes, previous_sites = self._hashes, self._sites
+
+        if previous_hashes is None:
+            changed, sites = None, None
+        elif len(hashes) == len(previous_hashes):
+            changed = np.nonzero(hashes != previous_hashes)[0].tolist()
+            sites = list(previous_sites)
+        else:
+            by_hash = dict(zip(previous_hashes.tolist(), previous_sites))
+            sites = [by_hash.get(h) for h in hashes.tolist()]
+            changed = [i for i, site in enumerate(sites) if site is None]
+
+        # Mostly new data: rebuild every site rather than patching the previous build
+        if changed is None or len(changed) > len(hashes) // 2:
+            sites = build_sites(df_legend)
+            parsed = len(sites)
+        else:
+            ids = df_legend['ID'].iloc[changed].tolist()
+            descriptions = df_legend['Description'].iloc[changed].fillna('').astype(str).tolist()
+            for i, site_id, description in zip(changed, ids, descriptions):
+                sites[i] = build_site_record(site_id, description)
+            parsed = len(changed)
+
+        with self._lock:
+            self._hashes, self._sites, self.parsed = hashes, sites, parsed
+        return sites
+
+class SiteMemo:
+    """A value derived from each SiteRecord, computed once per record and kept on it.
+    SiteBuilder and threshold_sites hand back unchanged sites as the very same objects, so
+    after an edit or a threshold change the map, legend and summary only derive the sites
+    that actually changed."""
+
+    def __init__(self, derive):
+        self.derive = derive
+
+    def get(self, site):
+        derived = site.derived
+        if derived is None:
+            derived = site.derived = {}
+        value = derived.get(self)
+        if value is None:
+            value = derived[self] = self.derive(site)
+        return value
+
+def entry_positions(groups):
+    """(distinct entries in first-use order, position of every entry) over groups of entries,
+    for columnar payloads that store each distinct entry once. Built per payload, so it holds
+    exactly the entries of the sites being rendered."""
+    table = {}
+    positions = [table.setdefault(entry, len(table)) for group in groups for entry in group]
+    return list(table), positions
+
+DEFAULT_WORKBOOK_PATH = Path(__file__).parent / "nm_manufacturers_data.xlsx"
+# Regional workbooks dropped here are merged with the bundled one
+DEFAULT_WORKBOOK_DIR = Path(__file__).parent / "workbooks"
+WORKBOOK_SHEETS = ("Manufacturers", "Legend", "UPS_Gateways")
+# Zero-based header row per sheet (Manufacturers has a title row above its header)
+SHEET_HEADER_ROWS = {"Manufacturers": 1, "Legend": 0, "UPS_Gateways": 0}
+
+# Workbooks larger than this are streamed in read-only mode instead of parsed whole
+STREAMING_WORKBOOK_BYTES = 20 * 1024 * 1024
+STREAMING_CHUNK_ROWS = 20000
+
+# Compact dtypes for loaded sheets: text columns whose values repeat are categoricals, and
+# coordinates are float32 (about 7 significant digits: under a metre at EMEA longitudes)
+CATEGORY_COLUMNS = ('Country', 'City', 'Status', 'Source')
+COORDINATE_COLUMNS = ('Latitude', 'Longitude')
+
+def compact_frame(df):
+    """df with CATEGORY_COLUMNS holding only text as categoricals and numeric COORDINATE_COLUMNS
+    as float32; already compact columns are left alone."""
+    dtypes = {}
+    for column in df.columns.intersection(CATEGORY_COLUMNS):
+        if (not isinstance(df[column].dtype, pd.CategoricalDtype)
+                and pd.api.types.infer_dtype(df[column], skipna=True) in ('string', 'empty')):
+            dtypes[column] = 'category'
+    for column in df.columns.intersection(COORDINATE_COLUMNS):
+        if df[column].dtype.kind in 'fi' and df[column].dtype != np.float32:
+            dtypes[column] = np.float32
+    return df.astype(dtypes) if dtypes else df
+
+def compact_frames(frames):
+    return tuple(compact_frame(df) for df in frames)
+
+def clean_manufacturers(df_map):
+    # Clean up Manufacturers dataframe - drop empty columns
+    df_map = df_map.dropna(axis=1, how='all')
+    # Ensure correct column names
+    if 'ID' not in df_map.columns:
+        df_map.columns = ['ID', 'Country', 'Latitude', 'Longitude']
+    return df_map
+
+def read_workbook(source, streaming=None):
+    """Read and clean all three sheets from a single open of the workbook.
+    streaming=None streams workbooks above STREAMING_WORKBOOK_BYTES."""
+    if streaming is None:
+        streaming = source_size(source) > STREAMING_WORKBOOK_BYTES
+    if streaming:
+        return read_workbook_streaming(source)
+
+    with pd.ExcelFile(source) as xls:
+        df_map, df_legend, df_gateways = (xls.parse(sheet, header=SHEET_HEADER_ROWS[sheet]) for sheet in WORKBOOK_SHEETS)
+
+    return compact_frames((clean_manufacturers(df_map), df_legend, df_gateways))
+
+def source_size(source):
+    """Byte size of a workbook path or uploaded file (0 if unknown)."""
+    if isinstance(source, (str, Path)):
+        return Path(source).stat().st_size
+    return getattr(source, 'size', 0) or 0
+
+def iter_sheet_chunks(worksheet, header_row=0, chunk_rows=STREAMING_CHUNK_ROWS):
+    """Yield (header, DataFrame) chunks from a read-only worksheet.
+    Each chunk keeps only the columns that have values in it and is dtype-inferred,
+    so columns that are empty for the whole sheet are never materialized."""
+    rows = worksheet.iter_rows(values_only=True)
+    for _ in range(header_row):
+        next(rows, None)
+    header_values = next(rows, None) or ()
+    header = [f"Unnamed: {i}" if value is None else value for i, value in enumerate(header_values)]
+
+    def to_frame(chunk):
+        df = pd.DataFrame(chunk, columns=header[:max(len(r) for r in chunk)] if chunk else header)
+        return df.dropna(axis=1, how='all').infer_objects()
+
+    chunk = []
+    for row in rows:
+        # Blank lines are skipped, as read_excel does
+        if all(value is None for value in row):
+            continue
+        chunk.append(row[:len(header)])
+        if len(chunk) >= chunk_rows:
+            yield header, to_frame(chunk)
+            chunk = []
+    if chunk:
+        yield header, to_frame(chunk)
+
+def read_sheet_streaming(workbook, sheet, header_row=0):
+    """Assemble a sheet from its chunks, dropping all-empty columns; columns keep sheet order."""
+    header, chunks = [], []
+    for header, chunk in iter_sheet_chunks(workbook[sheet], header_row):
+        chunks.append(chunk)
+    if not chunks:
+        return pd.DataFrame(columns=header)
+    df = pd.concat(chunks, ignore_index=True)
+    return df[[c for c in header if c in df.columns]]
+
+def read_workbook_streaming(source):
+    """Read all three sheets through openpyxl read-only mode, chunk by chunk."""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        df_map, df_legend, df_gateways = (read_sheet_streaming(workbook, sheet, SHEET_HEADER_ROWS[sheet])
+                                          for sheet in WORKBOOK_SHEETS)
+    finally:
+        workbook.close()
+    # Empty columns are already gone; only the column-name fix-up is still needed
+    return compact_frames((clean_manufacturers(df_map), df_legend, df_gateways))
+
+def read_sheet(source, sheet, streaming=None):
+    """Read and clean a single sheet, the same way read_workbook reads it."""
+    if streaming is None:
+        streaming = source_size(source) > STREAMING_WORKBOOK_BYTES
+    if streaming:
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            df = read_sheet_streaming(workbook, sheet, SHEET_HEADER_ROWS[sheet])
+        finally:
+            workbook.close()
+    else:
+        df = pd.read_excel(source, sheet_name=sheet, header=SHEET_HEADER_ROWS[sheet])
+    return compact_frame(clean_manufacturers(df) if sheet == "Manufacturers" else df)
+
+def workbook_signature(path):
+    """Cheap change detector for a workbook on disk: (mtime_ns, size)."""
+    stat = Path(path).stat()
+    return stat.st_mtime_ns, stat.st_size
+
+def stream_sha256(f, digest=None, chunk_size=1024 * 1024):
+    """Feed a binary file object into a SHA-256 digest chunk by chunk (without loading it whole)."""
+    digest = digest or hashlib.sha256()
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    with open(path, 'rb') as f:
+        return stream_sha256(f, chunk_size=chunk_size).hexdigest()
+
+def upload_sha256(files):
+    """Content address of one or more uploaded workbooks (file objects with a name).
+    Several uploads also hash their names, which become the Source labels of the merged data;
+    a single upload is keyed on its bytes only, so the same file under any name hits."""
+    digest = hashlib.sha256()
+    for f in files:
+        if len(files) > 1:
+            digest.update(f"{len(files)}:{f.name}\0".encode('utf-8'))
+        f.seek(0)
+        stream_sha256(f, digest)
+        f.seek(0)
+    return digest.hexdigest()
+
+def sidecar_dir(path, root=None):
+    """Hidden directory holding the workbook's Parquet sidecars: next to it, or under root."""
+    path = Path(path)
+    return (path.parent if root is None else Path(root)) / f".{path.stem}.cache"
+
+def read_workbook_with_sidecar(path, root=None):
+    """Read the workbook through a Parquet sidecar keyed by content hash and mtime, kept next
+    to the workbook or under root (see sidecar_dir).
+    A changed workbook gets a new key, so stale sidecars are never read and are pruned on write."""
+    path = Path(path)
+    key = f"{file_sha256(path)[:32]}-{workbook_signature(path)[0]}"
+    entry = sidecar_dir(path, root) / key
+
+    try:
+        if entry.is_dir():
+            # compacted again for sidecars written before frames were compact
+            return compact_frames(pd.read_parquet(entry / f"{sheet}.parquet", memory_map=True) for sheet in WORKBOOK_SHEETS)
+    except Exception:
+        pass  # unreadable sidecar: fall back to the workbook and rewrite it
+
+    frames = read_workbook(path)
+    try:
+        entry.mkdir(parents=True, exist_ok=True)
+        for sheet, df in zip(WORKBOOK_SHEETS, frames):
+            df.to_parquet(entry / f"{sheet}.parquet", index=False)
+        for stale in entry.parent.iterdir():
+            if stale != entry:
+                shutil.rmtree(stale, ignore_errors=True)
+    except Exception:
+        # Sidecar is an optimization only (e.g. read-only directory, mixed-type column)
+        shutil.rmtree(entry, ignore_errors=True)
+    return frames
+
+WORKBOOK_SUFFIXES = ('.xlsx', '.xlsm')
+
+def find_workbooks(paths):
+    """Expand the given files and directories into workbook paths (directories are not recursed)."""
+    workbooks = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            workbooks.extend(sorted(p for p in path.iterdir()
+                                    if p.suffix.lower() in WORKBOOK_SUFFIXES and not p.name.startswith('~$')))
+        else:
+            workbooks.append(path)
+    return workbooks
+
+def default_sources():
+    """The bundled workbook (if present) followed by every workbook in DEFAULT_WORKBOOK_DIR."""
+    paths = [DEFAULT_WORKBOOK_PATH] if DEFAULT_WORKBOOK_PATH.exists() else []
+    if DEFAULT_WORKBOOK_DIR.is_dir():
+        paths += find_workbooks([DEFAULT_WORKBOOK_DIR])
+    return paths
+
+def read_source(source):
+    """Worker entry point for read_workbooks: a workbook path, or (name, bytes) of an upload
+    (upload objects don't pickle across processes)."""
+    if isinstance(source, tuple):
+        _, data = source
+        return read_workbook(io.BytesIO(data), streaming=len(data) > STREAMING_WORKBOOK_BYTES)
+    return read_workbook_with_sidecar(source)
+
+def source_label(source):
+    return Path(source[0] if isinstance(source, tuple) else source).stem
+
+def read_workbooks(sources, executor=None, max_workers=None):
+    """Read several workbooks concurrently, one process per workbook, so the total time is
+    close to the slowest file's rather than the sum. Returns [(label, frames)] in input order,
+    labels being file stems made unique."""
+    sources = list(sources)
+    if len(sources) == 1:
+        frames = [read_source(sources[0])]
+    elif executor is not None:
+        frames = list(executor.map(read_source, sources))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers or min(len(sources), os.cpu_count() or 1),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            frames = list(pool.map(read_source, sources))
+
+    return list(zip(source_labels(sources), frames))
+
+def source_labels(sources):
+    """File stems of the sources, made unique with a -2, -3... suffix."""
+    labels, used = [], {}
+    for source in sources:
+        label = source_label(source)
+        used[label] = used.get(label, 0) + 1
+        labels.append(label if used[label] == 1 else f"{label}-{used[label]}")
+    return labels
+
+def same_site(a, b):
+    """Whether two (coordinates, description) identities name the same site: coordinates
+    decide when both sides have them, otherwise the descriptions must match."""
+    if a[0] is not None and b[0] is not None:
+        return a[0] == b[0]
+    return a[1] == b[1]
+
+def merge_workbooks(named_frames):
+    """Merge [(label, (Manufacturers, Legend, UPS_Gateways))] into one dataset.
+    A site ID seen again with the same coordinates (or, without coordinates, the same
+    description) is the same site and kept once, first source wins. The same ID naming a
+    different site is namespaced as "label:ID" in that source's Manufacturers and Legend rows;
+    once any ID is namespaced, all IDs become strings. Gateways are deduplicated by Code.
+    Manufacturers and Legend gain a Source column with the workbook label."""
+    maps, legends, gateways = [], [], []
+    seen = {}  # site ID -> (coordinates, description) in the source that claimed it
+    namespaced = False
+    for label, (df_map, df_legend, df_gateways) in named_frames:
+        located = df_map.dropna(subset=['Latitude', 'Longitude'])
+        coords = dict(zip(located['ID'].tolist(), zip(located['Latitude'].round(5).tolist(),
+                                                        located['Longitude'].round(5).tolist())))
+        descriptions = dict(zip(df_legend['ID'].tolist(), df_legend['Description'].astype(str).tolist()))
+        renames, duplicates = {}, set()
+        for site_id in dict.fromkeys([*df_map['ID'].tolist(), *descriptions]):
+            identity = (coords.get(site_id), descriptions.get(site_id))
+            if site_id not in seen:
+                seen[site_id] = identity
+            elif same_site(seen[site_id], identity):
+                duplicates.add(site_id)
+            else:
+                renames[site_id] = f"{label}:{site_id}"
+        namespaced = namespaced or bool(renames)
+
+        for df, out in ((df_map, maps), (df_legend, legends)):
+            df = df[~df['ID'].isin(duplicates)].copy()
+            if renames:
+                df['ID'] = df['ID'].map(lambda site_id: renames.get(site_id, site_id))
+            df['Source'] = label
+            out.append(df)
+        gateways.append(df_gateways)
+
+    df_map = pd.concat(maps, ignore_index=True)
+    df_legend = pd.concat(legends, ignore_index=True)
+    if namespaced:
+        df_map['ID'] = df_map['ID'].astype(str)
+        df_legend['ID'] = df_legend['ID'].astype(str)
+    df_gateways = pd.concat(gateways, ignore_index=True).drop_duplicates('Code', keep='first', ignore_index=True)
+    # concat turns categoricals with different categories back into text
+    return compact_frames((df_map, df_legend, df_gateways))
+
+def load_workbooks(sources, executor=None):
+    """read_workbooks + merge_workbooks; a single source is returned as read, without a Source column."""
+    named_frames = read_workbooks(sources, executor)
+    if len(named_frames) == 1:
+        return named_frames[0][1]
+    return merge_workbooks(named_frames)
+
+# Watch mode: a changed workbook is diffed against the last read, sheet by sheet and row by row
+WATCH_POLL_SECONDS = 2.0
+# Beyond this many changed rows a sheet is re-read whole (rows were inserted or removed mid-sheet)
+INCREMENTAL_MAX_CHANGED_ROWS = 5000
+# Rows of each freshly read sheet checked against the row reader before patching is trusted
+INCREMENTAL_SAMPLE_ROWS = 64
+# Text read_excel turns into NaN, booleans or numbers; cells holding it take the full-read path
+EXCEL_COERCED_STRINGS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null', 'True', 'False', 'TRUE', 'FALSE', 'true', 'false',
+])
+
+XLSX_CELL_PATTERN = re.compile(rb'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+XLSX_ATTR_PATTERN = re.compile(rb'([\w:]+)="([^"]*)"')
+XLSX_VALUE_PATTERN = re.compile(rb'<v>(.*?)</v>', re.S)
+XLSX_TEXT_PATTERN = re.compile(rb'<t(?:\s[^>]*)?>(.*?)</t>', re.S)
+XLSX_PHONETIC_PATTERN = re.compile(rb'<rPh\b.*?</rPh>', re.S)
+XLSX_ESCAPE_PATTERN = re.compile(r'_x[0-9A-Fa-f]{4}_')
+
+class NeedsFullRead(Exception):
+    """A changed sheet that can't be patched row by row and is re-read whole instead."""
+
+def xlsx_attrs(xml):
+    return dict(XLSX_ATTR_PATTERN.findall(xml))
+
+def xlsx_text(xml):
+    """Text of an inline or shared string (rich-text runs joined, phonetic runs dropped)."""
+    text = html.unescape(b''.join(XLSX_TEXT_PATTERN.findall(XLSX_PHONETIC_PATTERN.sub(b'', xml))).decode('utf-8'))
+    if XLSX_ESCAPE_PATTERN.search(text):
+        raise NeedsFullRead("escaped characters in text")
+    return text
+
+def xlsx_column_index(ref):
+    """Zero-based column of a cell reference such as b'AB12'."""
+    index = 0
+    for char in ref.rstrip(b'0123456789'):
+        index = index * 26 + char - 64
+    return index - 1
+
+def split_sheet_rows(xml):
+    """The <row> elements of a worksheet part as raw byte chunks, in sheet order
+    (None when the rows can't be split apart this way)."""
+    start = xml.find(b'<sheetData>')
+    if start < 0:
+        return []
+    body = xml[start + len(b'<sheetData>'):xml.rfind(b'</sheetData>')]
+    rows = body.split(b'</row>')
+    if rows.pop().strip() or body.count(b'<row') != len(rows):
+        return None  # self-closing <row/> elements
+    return rows
+
+def is_blank_row(row):
+    """Whether a row chunk holds no value at all (read_excel skips such rows)."""
+    return b'<v>' not in row and b'<is>' not in row
+
+def date_style_ids(styles_xml):
+    """Indices of the cell styles whose number format is a date or time."""
+    from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+
+    custom = {}
+    for element in re.findall(rb'<numFmt\b([^>]*)>', styles_xml):
+        attrs = xlsx_attrs(element)
+        custom[int(attrs.get(b'numFmtId', b'0'))] = html.unescape(attrs.get(b'formatCode', b'').decode('utf-8'))
+    cell_xfs = re.search(rb'<cellXfs\b.*?</cellXfs>', styles_xml, re.S)
+    styles = re.findall(rb'<xf\b([^>]*)>', cell_xfs.group(0)) if cell_xfs else []
+    ids = set()
+    for i, element in enumerate(styles):
+        format_id = int(xlsx_attrs(element).get(b'numFmtId', b'0'))
+        code = custom.get(format_id, BUILTIN_FORMATS.get(format_id))
+        if code and is_date_format(code):
+            ids.add(i)
+    return frozenset(ids)
+
+def check_cell_value(dtype, value):
+    """Raise NeedsFullRead unless writing value into a column of dtype gives what a full read would."""
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = dtype.categories.dtype
+    if value is None:
+        ok = dtype.kind == 'f' or (dtype != object and pd.api.types.is_string_dtype(dtype))
+    elif isinstance(value, bool):
+        ok = dtype.kind == 'b'
+    elif isinstance(value, int):
+        ok = dtype.kind in 'if'
+    elif isinstance(value, float):
+        ok = dtype.kind == 'f'
+    else:
+        ok = (dtype != object and pd.api.types.is_string_dtype(dtype) and value not in EXCEL_COERCED_STRINGS
+              and not re.fullmatch(r'\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*|(?i:\s*[-+]?(inf|infinity|nan)\s*)', value))
+    if not ok:
+        raise NeedsFullRead(f"{value!r} in a {dtype} column")
+
+def patch_frame(df, updates):
+    """Copy of df with rows replaced or appended: updates maps row position -> {column: value}
+    (positions from len(df) on are appended; missing columns are empty cells)."""
+    positions = sorted(updates)
+    existing = [i for i in positions if i < len(df)]
+    appended = [i for i in positions if i >= len(df)]
+    if appended != list(range(len(df), len(df) + len(appended))):
+        raise NeedsFullRead("appended rows are not contiguous")
+
+    patched = df.copy()
+    new_columns = {}
+    for j, column in enumerate(df.columns):
+        dtype = df[column].dtype
+        values = [updates[i].get(column) for i in positions]
+        for value in values:
+            check_cell_value(dtype, value)
+        if isinstance(dtype, pd.CategoricalDtype):
+            new_categories = {value for value in values if value is not None}.difference(dtype.categories)
+            if new_categories:
+                # kept sorted, as a full read orders them
+                patched[column] = patched[column].cat.set_categories(sorted([*dtype.categories, *new_categories]))
+                dtype = patched[column].dtype
+        if existing:
+            patched.iloc[existing, j] = values[:len(existing)]
+        new_columns[column] = pd.array(values[len(existing):], dtype=dtype)
+        if dtype.kind == 'f' and any(type(value) is int for value in values):
+            # all-integer columns read back as int64
+            column_values = pd.concat([patched[column], pd.Series(new_columns[column], dtype=dtype)])
+            if column_values.notna().all() and (column_values % 1 == 0).all():
+                raise NeedsFullRead(f"{column} may read back as integers")
+    if appended:
+        patched = pd.concat([patched, pd.DataFrame(new_columns)], ignore_index=True)
+    for column in df.columns:
+        if patched[column].isna().all() and not df[column].isna().all():
+            raise NeedsFullRead(f"{column} is now empty")
+    return patched
+
+@dataclass
+class SheetState:
+    """What IncrementalWorkbook remembers of a sheet between reads."""
+    crc: int
+    header: int = 0          # hash of the header row's XML
+    rows: list = field(default_factory=list)  # hash of each non-blank data row's XML, in frame order
+    columns: dict = None     # sheet column index -> frame column; None when the sheet can't be patched
+    frame: pd.DataFrame = None
+
+class IncrementalWorkbook:
+    """A workbook on disk, re-read by difference. refresh() compares each sheet part's CRC in
+    the zip directory and, inside a changed sheet, a hash of every row's XML; only the changed
+    and appended rows are parsed and patched into a copy of the previous frame, and unchanged
+    sheets come back as the very same frame objects.
+
+    A changed sheet is re-read whole when rows were inserted or removed mid-sheet, its header
+    changed, the shared-string table was rewritten rather than appended to, or a changed cell
+    holds something the row reader doesn't mirror exactly (dates, errors, NA-like or numeric
+    text, or a value that changes the column's dtype). Thread-safe."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.version = 0  # bumped whenever a refresh changes any frame
+        self.changes = {}  # sheet -> row positions changed, added or removed by the last refresh; None if re-read whole
+        self.signature = None  # workbook_signature of the file last read
+        self._layout = None
+        self._sheets = {}
+        self._shared = []
+        self._shared_hashes = []
+        self._shared_crc = None
+        self._date_styles = frozenset()
+        self._lock = threading.Lock()
+
+    def frames(self):
+        return tuple(self._sheets[sheet].frame for sheet in WORKBOOK_SHEETS)
+
+    def refresh(self):
+        """Current (Manufacturers, Legend, UPS_Gateways); cheap when the file is unchanged.
+        A workbook caught mid-save keeps the previous frames until the next refresh."""
+        with self._lock:
+            signature = workbook_signature(self.path)
+            if signature == self.signature:
+                self.changes = {sheet: [] for sheet in WORKBOOK_SHEETS}
+                return self.frames()
+            try:
+                with zipfile.ZipFile(self.path) as archive:
+                    self._refresh(archive)
+            except (zipfile.BadZipFile, KeyError, OSError):
+                if not self._sheets:
+                    raise
+                return self.frames()
+            self.signature = signature
+            if any(rows != [] for rows in self.changes.values()):
+                self.version += 1
+            return self.frames()
+
+    def _refresh(self, archive):
+        crcs = {info.filename: info.CRC for info in archive.infolist()}
+        sheet_parts, shared_part, styles_part = self._parts(archive)
+
+        # A new sheet layout or restyled cells invalidate everything remembered
+        layout = (crcs.get('xl/workbook.xml'), crcs.get('xl/_rels/workbook.xml.rels'), crcs.get(styles_part))
+        if layout != self._layout:
+            self._sheets = {}
+            self._date_styles = date_style_ids(archive.read(styles_part)) if styles_part in crcs else frozenset()
+            self._layout = layout
+        if crcs.get(shared_part) != self._shared_crc:
+            # items only: the <sst> header's counts change with every save
+            data = archive.read(shared_part) if shared_part in crcs else b''
+            shared = data[max(data.find(b'<si'), 0):].split(b'</si>')[:-1]
+            hashes = [hash(si) for si in shared]
+            if hashes[:len(self._shared_hashes)] != self._shared_hashes:
+                self._sheets = {}  # strings were renumbered, not just appended
+            self._shared, self._shared_hashes, self._shared_crc = shared, hashes, crcs.get(shared_part)
+
+        if not self._sheets:
+            frames = dict(zip(WORKBOOK_SHEETS, read_workbook_with_sidecar(self.path)))
+            self.changes = {sheet: None for sheet in WORKBOOK_SHEETS}
+            for sheet in WORKBOOK_SHEETS:
+                part = sheet_parts[sheet]
+                self._sheets[sheet] = self._baseline(sheet, crcs[part], split_sheet_rows(archive.read(part)), frames[sheet])
+            return
+
+        changes = {}
+        for sheet in WORKBOOK_SHEETS:
+            part, state = sheet_parts[sheet], self._sheets[sheet]
+            if crcs[part] == state.crc:
+                changes[sheet] = []
+                continue
+            rows = split_sheet_rows(archive.read(part))
+            try:
+                self._sheets[sheet], changes[sheet] = self._patch(sheet, crcs[part], rows, state)
+            except NeedsFullRead:
+                self._sheets[sheet] = self._baseline(sheet, crcs[part], rows, read_sheet(self.path, sheet))
+                changes[sheet] = None
+        self.changes = changes
+
+    @staticmethod
+    def _parts(archive):
+        """Worksheet part per sheet name, plus the shared-strings and styles parts."""
+        targets, shared_part, styles_part = {}, None, None
+        for element in re.findall(rb'<Relationship\b([^>]*)>', archive.read('xl/_rels/workbook.xml.rels')):
+            attrs = xlsx_attrs(element)
+            target = attrs[b'Target'].decode('utf-8')
+            part = target.lstrip('/') if target.startswith('/') else posixpath.normpath(f"xl/{target}")
+            targets[attrs[b'Id']] = part
+            if attrs[b'Type'].endswith(b'/sharedStrings'):
+                shared_part = part
+            elif attrs[b'Type'].endswith(b'/styles'):
+                styles_part = part
+        sheet_parts = {}
+        for element in re.findall(rb'<sheet\b([^>]*)>', archive.read('xl/workbook.xml')):
+            attrs = xlsx_attrs(element)
+            relationship = next(value for key, value in attrs.items() if key.endswith(b':id'))
+            sheet_parts[html.unescape(attrs[b'name'].decode('utf-8'))] = targets[relationship]
+        return sheet_parts, shared_part, styles_part
+
+    def _cell_value(self, attrs, body):
+        """A cell's value as openpyxl's data-only reader returns it."""
+        kind = attrs.get(b't', b'n')
+        if kind == b'inlineStr':
+            return xlsx_text(body)
+        value = XLSX_VALUE_PATTERN.search(body or b'')
+        if value is None:
+            return None
+        value = value.group(1)
+        if kind == b's':
+            return xlsx_text(self._shared[int(value)])
+        if kind == b'str':
+            return html.unescape(value.decode('utf-8'))
+        if kind == b'b':
+            return value.strip() == b'1'
+        if kind == b'n' and int(attrs.get(b's', b'0')) not in self._date_styles:
+            text = value.decode('ascii')
+            return float(text) if '.' in text or 'E' in text or 'e' in text else int(text)
+        raise NeedsFullRead(f"unsupported cell type {kind!r}")
+
+    def _row_values(self, row, columns):
+        """{frame column: value} for one row chunk; raises NeedsFullRead when the row is blank
+        or has a value outside the frame's columns."""
+        values, position = {}, -1
+        for attrs, body in XLSX_CELL_PATTERN.findall(row):
+            attrs = xlsx_attrs(attrs)
+            position = xlsx_column_index(attrs[b'r']) if b'r' in attrs else position + 1
+            value = self._cell_value(attrs, body)
+            if value is None:
+                continue
+            if position not in columns:
+                raise NeedsFullRead(f"value in unread column {position}")
+            values[columns[position]] = value
+        if not values:
+            raise NeedsFullRead("blank row")
+        return values
+
+    def _baseline(self, sheet, crc, rows, frame):
+        """State after a full read; patching is enabled only if the row reader reproduces
+        a sample of the frame exactly."""
+        header_row = SHEET_HEADER_ROWS[sheet]
+        if rows is None or len(rows) <= header_row:
+            return SheetState(crc, frame=frame)
+        data = [row for row in rows[header_row + 1:] if not is_blank_row(row)]
+        state = SheetState(crc, hash(rows[header_row]), [hash(row) for row in data], None, frame)
+        if len(data) != len(frame):
+            return state
+        try:
+            if re.search(rb'<row\b[^>]*?\br="(\d+)"', rows[header_row]).group(1) != str(header_row + 1).encode():
+                return state
+            header = {}
+            for attrs, body in XLSX_CELL_PATTERN.findall(rows[header_row]):
+                attrs = xlsx_attrs(attrs)
+                header[xlsx_column_index(attrs[b'r'])] = self._cell_value(attrs, body)
+            # read_excel names the frame's columns after the header cells, in order
+            names = [f"Unnamed: {i}" if header.get(i) is None else header[i] for i in range(max(header, default=-1) + 1)]
+            columns, position = {}, 0
+            for column in frame.columns:
+                while position < len(names) and names[position] != column:
+                    position += 1
+                if position == len(names):
+                    return state
+                columns[position] = column
+                position += 1
+
+            sample = sorted(set(np.linspace(0, len(frame) - 1, min(INCREMENTAL_SAMPLE_ROWS, len(frame))).astype(int).tolist()))
+            for i in sample:
+                values = self._row_values(data[i], columns)
+                for column in frame.columns:
+                    expected, value = frame[column].iat[i], values.get(column)
+                    check_cell_value(frame[column].dtype, value)
+                    if value is not None and frame[column].dtype.kind == 'f':
+                        value = frame[column].dtype.type(value)  # e.g. float32 coordinates
+                    if not (value == expected or (value is None and pd.isna(expected))):
+                        return state
+        except (NeedsFullRead, KeyError, ValueError, AttributeError):
+            return state
+        state.columns = columns
+        return state
+
+    def _patch(self, sheet, crc, rows, state):
+        """New state and patched row positions for a changed sheet, or NeedsFullRead."""
+        header_row = SHEET_HEADER_ROWS[sheet]
+        if state.columns is None or rows is None or len(rows) <= header_row or hash(rows[header_row]) != state.header:
+            raise NeedsFullRead("sheet layout changed")
+        data = [row for row in rows[header_row + 1:] if not is_blank_row(row)]
+        hashes = [hash(row) for row in data]
+        common = min(len(hashes), len(state.rows))
+        changed = [i for i in range(common) if hashes[i] != state.rows[i]]
+        if len(changed) + abs(len(hashes) - len(state.rows)) > INCREMENTAL_MAX_CHANGED_ROWS:
+            raise NeedsFullRead(f"{len(changed)} rows changed")
+
+        frame = state.frame.iloc[:len(hashes)] if len(hashes) < len(state.frame) else state.frame
+        updates = {i: self._row_values(data[i], state.columns) for i in changed + list(range(common, len(hashes)))}
+        if updates:
+            frame = patch_frame(frame, updates)
+        changed += range(common, max(len(hashes), len(state.rows)))
+        return SheetState(crc, state.header, hashes, state.columns, frame), changed
+
+# Popup header color, status label and background per serviceability class
+POPUP_STATUS = {
+    'can_serve': (COLORS['can_serve'], '✓ SERVICEABLE', '#D1FAE5'),
+    'cannot_serve': (COLORS['cannot_serve'], '✗ NOT SERVICEABLE', '#FEE2E2'),
+    'partial_serve': (COLORS['partial_serve'], '◐ PARTIAL', '#FEF3C7'),
+}
+
+# Isotope service badge background, text color and mark, indexed by can_serve
+POPUP_BADGES = [('#FEE2E2', '#991B1B', '✗'), ('#D1FAE5', '#065F46', '✓')]
+
+# Popup templates use {placeholder} fields only, so the same strings are filled
+# server-side (create_popup_html) and in the browser (lazy popups)
+POPUP_ISOTOPE_ROW_TEMPLATE = '''
+        <tr style="border-bottom:1px solid #f0f0f0;">
+            <td style="padding:4px 6px;font-weight:600;color:#1B4F72;">{name}</td>
+            <td style="padding:4px 6px;text-align:center;">{halflife}</td>
+            <td style="padding:4px 6px;text-align:center;"><span style="background:{badge_bg};color:{badge_color};padding:1px 6px;border-radius:8px;font-size:9px;font-weight:600;">{badge}</span></td>
+        </tr>'''
+
+POPUP_TEMPLATE = f'''
+    <div style="font-family:Inter,-apple-system,sans-serif;width:280px;padding:0;margin:0;">
+        <div style="background:linear-gradient(135deg,{COLORS['marken_deep_green']},{COLORS['marken_green']});padding:10px 12px;border-radius:8px 8px 0 0;">
+            <div style="color:white;font-size:18px;font-weight:700;">Site {{site_id}}</div>
+            <div style="color:rgba(255,255,255,0.9);font-size:11px;margin-top:2px;">{{site_name}}</div>
+        </div>
+        <div style="background:{{status_bg}};padding:6px 12px;text-align:center;">
+            <span style="color:{{header_color}};font-weight:700;font-size:11px;">{{status_text}}</span>
+        </div>
+        <div style="background:white;padding:8px;border-radius:0 0 8px 8px;border:1px solid #e5e5e5;border-top:none;">
+            <div style="font-size:10px;color:#6B7280;text-transform:uppercase;letter-spacing:0.5px;margin-bottom:6px;">Isotopes & Half-Lives</div>
+            <table style="width:100%;border-collapse:collapse;font-size:10px;">
+                <tr style="background:#f9fafb;">
+                    <th style="padding:4px 6px;text-align:left;color:#374151;">Isotope</th>
+                    <th style="padding:4px 6px;text-align:center;color:#374151;">T½</th>
+                    <th style="padding:4px 6px;text-align:center;color:#374151;">Service</th>
+                </tr>
+                {{isotope_rows}}
+            </table>
+            <div style="margin-top:8px;padding:6px;background:#F3F4F6;border-radius:4px;font-size:9px;color:#6B7280;">
+                <strong>Threshold:</strong> {{service_rule}}
+            </div>
+        </div>
+    </div>
+    '''
+
+def popup_site_name(site):
+    """Site name as shown in the popup header (max 40 characters)."""
+    site_name = site.name
+    if len(site_name) > 40:
+        site_name = site_name[:37] + "..."
+    return site_name
+
+def halflife_service_rule(threshold_hours=SERVICE_THRESHOLD_HOURS):
+    return f"≥{threshold_hours:g}h half-life required for Marken service"
+
+def create_popup_html(site, service_rule=None):
+    """Create rich HTML popup for map markers."""
+    header_color, status_text, status_bg = POPUP_STATUS.get(site.serviceability, POPUP_STATUS['partial_serve'])
+
+    isotope_rows = []
+    for iso in site.isotopes:
+        badge_bg, badge_color, badge = POPUP_BADGES[iso.can_serve]
+        isotope_rows.append(POPUP_ISOTOPE_ROW_TEMPLATE.format(
+            name=iso.name, halflife=iso.halflife_display,
+            badge_bg=badge_bg, badge_color=badge_color, badge=badge
+        ))
+
+    return POPUP_TEMPLATE.format(
+        site_id=site.site_id, site_name=popup_site_name(site),
+        status_bg=status_bg, header_color=header_color, status_text=status_text,
+        isotope_rows=''.join(isotope_rows), service_rule=service_rule or halflife_service_rule()
+    )
+
+# Placeholder in rendered map HTML for the live half-life threshold (hours, or null when
+# the map keeps the classification it was built with); substituted on every render
+SERVICE_THRESHOLD_PLACEHOLDER = '/*NM_SERVICE_THRESHOLD*/null'
+
+def popup_site_key(site_id):
+    return html.escape(str(site_id))
+
+def script_json(value):
+    """JSON that is safe to inline inside a <script> block."""
+    return json.dumps(value, ensure_ascii=False).replace('</', '<\\/')
+
+def apply_map_threshold(map_html, threshold_hours=None):
+    """Fill the live half-life threshold into rendered map HTML (None keeps the built classification)."""
+    threshold = 'null' if threshold_hours is None else json.dumps(float(threshold_hours))
+    return map_html.replace(SERVICE_THRESHOLD_PLACEHOLDER, threshold, 1)
+
+# Placeholders in a map shell for the clustered site layer's data (see fill_site_layer)
+SITE_ROWS_PLACEHOLDER = '/*NM_SITE_ROWS*/null'
+SITE_POPUPS_PLACEHOLDER = '/*NM_SITE_POPUPS*/null'
+
+def map_sites(df_map, sites):
+    """The SiteRecord of each Manufacturers row (last legend row wins on duplicate IDs;
+    rows without a legend entry get an empty record)."""
+    sites_by_id = {site.site_id: site for site in sites}
+    return [sites_by_id.get(site_id) or build_site_record(site_id, "No description available")
+            for site_id in df_map['ID'].tolist()]
+
+def json_object(fields):
+    """JSON object text from field name -> already encoded value."""
+    return '{' + ','.join(f"{script_json(name)}:{value}" for name, value in fields.items()) + '}'
+
+POPUP_CLASSES = list(SERVICEABILITY_COLORS) + ['unknown']
+
+def popup_entry(site):
+    """(key, name, serviceability position, isotopes) of one site's popup; isotopes are
+    (name, half-life display, can_serve, half-life hours) tuples."""
+    status = POPUP_CLASSES.index(site.serviceability if site.serviceability in POPUP_CLASSES else 'partial_serve')
+    isotopes = tuple((iso.name, iso.halflife_display, int(iso.can_serve), iso.halflife_hours) for iso in site.isotopes)
+    return popup_site_key(site.site_id), popup_site_name(site), status, isotopes
+
+POPUP_ENTRIES = SiteMemo(popup_entry)
+
+def site_popup_json(sites):
+    """Columnar popup data as JSON, unpacked per site key in the browser (see LazySitePopups):
+    keys, names, serviceability (index into classes) and isotope offsets per site, isotopes
+    [name, half-life display, can_serve, half-life hours] stored once per distinct entry.
+    A site key given twice keeps its last site."""
+    entries = list({entry[0]: entry for entry in map(POPUP_ENTRIES.get, sites)}.values())
+    isotopes, site_isotopes = entry_positions(entry[3] for entry in entries)
+    return json_object({
+        'classes': script_json(POPUP_CLASSES), 'keys': script_json([entry[0] for entry in entries]),
+        'names': script_json([entry[1] for entry in entries]), 'status': script_json([entry[2] for entry in entries]),
+        'isotopes': script_json([list(isotope) for isotope in isotopes]),
+        'offsets': script_json([0, *accumulate(len(entry[3]) for entry in entries)]),
+        'site_isotopes': script_json(site_isotopes),
+    })
+
+def site_layer_payload(df_map, sites):
+    """(rows, popups) JSON for the clustered site layer: latitude, longitude, site key and
+    country columns for the located Manufacturers rows, and the popup data of their sites.
+    Flat columns keep this a fraction of a map build, so an edit only refreshes the payload."""
+    located = df_map.dropna(subset=['Latitude', 'Longitude'])
+    records = map_sites(located, sites)
+    countries = located['Country'].astype(str).tolist()
+    escaped = {country: html.escape(country) for country in set(countries)}
+    rows = json_object({
+        'lat': script_json([round(lat, 5) for lat in located['Latitude'].astype(float).tolist()]),
+        'lon': script_json([round(lon, 5) for lon in located['Longitude'].astype(float).tolist()]),
+        'key': script_json([POPUP_ENTRIES.get(site)[0] for site in records]),
+        'country': script_json(list(map(escaped.__getitem__, countries))),
+    })
+    return rows, site_popup_json(records)
+
+def fill_site_layer(map_html, rows_json, popups_json):
+    """Fill a map shell's clustered site layer with site_layer_payload output."""
+    return map_html.replace(SITE_ROWS_PLACEHOLDER, rows_json, 1).replace(SITE_POPUPS_PLACEHOLDER, popups_json, 1)
+
+class RenderedMapCache:
+    """Thread-safe LRU of rendered map HTML, bounded by entry count and total bytes."""
+
+    def __init__(self, max_entries=MAP_CACHE_MAX_ENTRIES, max_bytes=MAP_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key, html):
+        size = len(html.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= len(self._entries.pop(key).encode('utf-8'))
+            self._entries[key] = html
+            self.total_bytes += size
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted.encode('utf-8'))
+
+@contextmanager
+def gc_paused():
+    """Hold off cyclic garbage collection while building many objects that all stay alive
+    (e.g. unpickling site records), where collection passes would find nothing to free."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+LOGGER = logging.getLogger("nm_dashboard")
+
+def upload_cache_version(nuclide_table=NUCLIDE_TABLE_PATH):
+    """Version tag of cached parse results: a hash of the nuclide table and of this module's
+    source, so entries parsed with another table or parser are never served."""
+    digest = hashlib.sha256()
+    for path in (Path(nuclide_table), Path(__file__)):
+        try:
+            with open(path, 'rb') as f:
+                stream_sha256(f, digest)
+        except OSError:
+            digest.update(f"missing:{path}".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+class UploadCache:
+    """Pickled results on local disk, one file per content key and version, bounded by total
+    bytes with least-recently-used eviction. Files are written to a temporary name and renamed
+    into place, so other server processes sharing the directory never read half an entry;
+    recency is the file's mtime, refreshed on every hit, so it survives restarts. Entries of
+    other versions are never read and age out by eviction.
+
+    The cache never fails its caller: when the directory cannot be created or read it is
+    disabled (every get misses, put does nothing), and a failed put is logged and skipped."""
+
+    def __init__(self, directory=UPLOAD_CACHE_DIR, max_bytes=UPLOAD_CACHE_MAX_BYTES, version=None):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.version = version or upload_cache_version()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.error = None
+        self._lock = threading.Lock()
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            entries = sorted((entry.stat().st_mtime_ns, entry.stem, entry.stat().st_size)
+                             for entry in self.directory.glob('*.pkl'))
+        except OSError as e:
+            LOGGER.warning("Upload cache disabled: %s", e)
+            self.error, entries = e, []
+        self._entries = OrderedDict((stem, size) for _, stem, size in entries)  # stem -> bytes, oldest first
+        self.total_bytes = sum(self._entries.values())
+
+    @property
+    def enabled(self):
+        return self.error is None
+
+    def _stem(self, key):
+        return f"{key}-{self.version}"
+
+    def _path(self, stem):
+        return self.directory / f"{stem}.pkl"
+
+    def get(self, key):
+        stem = self._stem(key)
+        path = self._path(stem)
+        if not self.enabled:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            with open(path, 'rb') as f, gc_paused():
+                value = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            value = None
+        except Exception:
+            value = None  # truncated or unreadable: drop it and rebuild
+            path.unlink(missing_ok=True)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                self.total_bytes -= self._entries.pop(stem, 0)
+                return None
+            self.hits += 1
+            if stem not in self._entries:  # written by another process
+                self._entries[stem] = path.stat().st_size
+                self.total_bytes += self._entries[stem]
+            self._entries.move_to_end(stem)
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        stem = self._stem(key)
+        path = self._path(stem)
+        temp = path.with_name(f"{stem}.{uuid.uuid4().hex}.tmp")
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            if len(data) > self.max_bytes:
+                return
+            temp.write_bytes(data)
+            os.replace(temp, path)
+        except Exception as e:
+            # a full disk or an unpicklable value costs the cache entry, never the caller's result
+            LOGGER.warning("Upload cache entry %s not stored: %s", key, e)
+            temp.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self.total_bytes += len(data) - self._entries.pop(stem, 0)
+            self._entries[stem] = len(data)
+            while self.total_bytes > self.max_bytes:
+                evicted, size = self._entries.popitem(last=False)
+                self._path(evicted).unlink(missing_ok=True)
+                self.total_bytes -= size
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+# Structured per-stage timings (one JSON object per log record) for external monitoring.
+# Records are at INFO, below logging's default WARNING: the app configures the "nm_dashboard"
+# loggers (see app1.configure_logging); other callers set a level and handler themselves.
+PERF_LOGGER = logging.getLogger("nm_dashboard.perf")
+
+def output_nbytes(value):
+    """Approximate size of a stage's output: encoded text, frame/array memory, or the sum over a tuple.
+    None for anything else (e.g. lists of site records, which are not worth walking)."""
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=True, deep=True)))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, tuple):
+        sizes = [output_nbytes(v) for v in value]
+        return None if any(size is None for size in sizes) else sum(sizes)
+    return None
+
+@dataclass
+class StageRecord:
+    stage: str
+    wall_ms: float = 0.0
+    peak_bytes: int = None
+    output_bytes: int = None
+    output: object = field(default=None, repr=False)
+
+class StageProfiler:
+    """Wall time, peak traced memory and output size per named stage of one run.
+    Memory is only measured with trace_memory=True (tracemalloc slows everything down);
+    each finished stage is logged to PERF_LOGGER as a JSON object. tracemalloc is process-wide,
+    so use the profiler as a context manager: leaving the block stops tracing however it exits."""
+
+    def __init__(self, trace_memory=False, run_id=None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._started_tracing = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    @contextmanager
+    def stage(self, name):
+        """Time the block; assign record.output to have its size measured."""
+        record = StageRecord(name)
+        if self.trace_memory:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.wall_ms = (time.perf_counter() - start) * 1000
+            if self.trace_memory:
+                record.peak_bytes = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+            record.output_bytes = output_nbytes(record.output)
+            record.output = None  # don't keep stage outputs alive
+            self.stages.append(record)
+            PERF_LOGGER.info(json.dumps({
+                'event': 'stage', 'run_id': self.run_id, 'stage': record.stage,
+                'wall_ms': round(record.wall_ms, 3), 'peak_bytes': record.peak_bytes,
+                'output_bytes': record.output_bytes,
+            }))
+
+    def close(self):
+        """Stop memory tracing if this profiler started it."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def to_frame(self):
+        return pd.DataFrame({
+            'Stage': [r.stage for r in self.stages],
+            'Wall (ms)': [round(r.wall_ms, 1) for r in self.stages],
+            'Peak memory (bytes)': pd.array([r.peak_bytes for r in self.stages], dtype='Int64'),
+            'Output (bytes)': pd.array([r.output_bytes for r in self.stages], dtype='Int64'),
+        })
+
+EARTH_RADIUS_KM = 6371.0088
+
+def unit_vectors(latitudes, longitudes):
+    """Lat/lon in degrees -> (n, 3) unit vectors on the sphere."""
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+class SiteGrid:
+    """Uniform lat/lon grid over site coordinates for viewport queries.
+    Sites are sorted by cell key (row-major), so every grid row of a bounding box is
+    one contiguous slice found with searchsorted; only those candidates are tested exactly."""
+
+    def __init__(self, latitudes, longitudes, cell_degrees=1.0):
+        self.lat = np.asarray(latitudes, dtype=float)
+        self.lon = np.asarray(longitudes, dtype=float)
+        self.cell_degrees = cell_degrees
+        self.n_cols = int(np.ceil(360 / cell_degrees)) + 1
+        positions = np.flatnonzero(np.isfinite(self.lat) & np.isfinite(self.lon))
+        keys = self._rows(self.lat[positions]) * self.n_cols + self._cols(self.lon[positions])
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.positions = positions[order]
+
+    def _rows(self, lat):
+        return np.floor((np.clip(lat, -90, 90) + 90) / self.cell_degrees).astype(np.int64)
+
+    def _cols(self, lon):
+        return np.floor((np.clip(lon, -180, 180) + 180) / self.cell_degrees).astype(np.int64)
+
+    def query(self, south, west, north, east):
+        """Positions (ascending) of the sites inside the box; west > east crosses the antimeridian.
+        Longitudes outside [-180, 180] (a panned Leaflet map) are wrapped first."""
+        if east - west >= 360:
+            west, east = -180.0, 180.0
+        else:
+            west, east = (lon if -180 <= lon <= 180 else (lon + 180) % 360 - 180 for lon in (west, east))
+        if west > east:
+            return np.union1d(self.query(south, west, north, 180.0), self.query(south, -180.0, north, east))
+
+        rows = np.arange(self._rows(south), self._rows(north) + 1)
+        first_col, last_col = self._cols(west), self._cols(east)
+        lo = np.searchsorted(self.keys, rows * self.n_cols + first_col, side='left')
+        hi = np.searchsorted(self.keys, rows * self.n_cols + last_col, side='right')
+        if not len(rows) or not (hi > lo).any():
+            return np.empty(0, dtype=np.int64)
+        candidates = np.concatenate([self.positions[a:b] for a, b in zip(lo.tolist(), hi.tolist()) if b > a])
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        return np.sort(candidates[inside])
+
+def aggregate_sites(latitudes, longitudes, classes, zoom, cell_px=VIEWPORT_AGGREGATE_CELL_PX):
+    """Bucket sites into cells about cell_px screen pixels wide at a Leaflet zoom level.
+    classes are serviceability keys per site; returns one row per non-empty cell with its
+    centroid, site count and a count per serviceability class, so the row count depends on
+    the viewport size, not on how many sites are in it."""
+    cell = 360 / 2 ** zoom * cell_px / 256
+    lat = np.asarray(latitudes, dtype=float)
+    lon = np.asarray(longitudes, dtype=float)
+    if not len(lat):
+        return pd.DataFrame(columns=['Latitude', 'Longitude', 'count', *SERVICEABILITY_COLORS])
+    cells = np.floor(lat / cell).astype(np.int64) * (2 ** 31) + np.floor(lon / cell).astype(np.int64)
+    _, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+    aggregates = pd.DataFrame({
+        'Latitude': np.bincount(inverse, weights=lat) / counts,
+        'Longitude': np.bincount(inverse, weights=lon) / counts,
+        'count': counts,
+    })
+    classes = np.asarray(classes, dtype=object)
+    for key in SERVICEABILITY_COLORS:
+        aggregates[key] = np.bincount(inverse, weights=classes == key, minlength=len(counts)).astype(int)
+    return aggregates
+
+def site_classes(df_map, sites):
+    """Serviceability key of each Manufacturers row; rows without a legend entry count as
+    partial, the color their markers fall back to."""
+    serviceability = {site.site_id: site.serviceability for site in sites}
+    return df_map['ID'].map(serviceability).fillna('partial_serve')
+
+def mercator_y(latitudes):
+    """Web Mercator northing in degree units (equal to longitude scale), so shapes binned in
+    (longitude, mercator_y) are regular on the map."""
+    lat = np.radians(np.clip(latitudes, -85.0, 85.0))
+    return np.degrees(np.log(np.tan(np.pi / 4 + lat / 2)))
+
+def inverse_mercator_y(y):
+    return np.degrees(2 * np.arctan(np.exp(np.radians(y))) - np.pi / 2)
+
+# Corner directions of a pointy-top hexagon with unit center-to-corner size
+HEX_CORNERS = np.radians(np.arange(30, 390, 60))
+
+def hexbin_sites(latitudes, longitudes, classes, size_deg=HEXBIN_SIZE_DEG):
+    """Bucket sites into pointy-top hexagons size_deg from center to corner, laid out in Web
+    Mercator. Returns one row per non-empty hexagon with its axial coordinates (q, r), center,
+    site count and a count per serviceability class."""
+    lat = np.asarray(latitudes, dtype=float)
+    lon = np.asarray(longitudes, dtype=float)
+    valid = np.isfinite(lat) & np.isfinite(lon)
+    if not valid.any():
+        return pd.DataFrame(columns=['q', 'r', 'Latitude', 'Longitude', 'count', *SERVICEABILITY_COLORS])
+    x, y = lon[valid] / size_deg, mercator_y(lat[valid]) / size_deg
+    # Fractional axial coordinates, rounded to the nearest hexagon through cube coordinates:
+    # the component with the largest rounding error is recomputed from the other two
+    q, r = np.sqrt(3) / 3 * x - y / 3, 2 / 3 * y
+    q_round, r_round, s_round = np.round(q), np.round(r), np.round(-q - r)
+    q_error, r_error, s_error = np.abs(q_round - q), np.abs(r_round - r), np.abs(s_round + q + r)
+    fix_q = (q_error > r_error) & (q_error > s_error)
+    fix_r = ~fix_q & (r_error > s_error)
+    q_hex = np.where(fix_q, -r_round - s_round, q_round).astype(np.int64)
+    r_hex = np.where(fix_r, -q_round - s_round, r_round).astype(np.int64)
+
+    cells = q_hex * (2 ** 32) + r_hex
+    unique_cells, first, inverse, counts = np.unique(cells, return_index=True, return_inverse=True, return_counts=True)
+    q_hex, r_hex = q_hex[first], r_hex[first]
+    bins = pd.DataFrame({
+        'q': q_hex, 'r': r_hex,
+        'Latitude': inverse_mercator_y(1.5 * r_hex * size_deg),
+        'Longitude': np.sqrt(3) * (q_hex + r_hex / 2) * size_deg,
+        'count': counts,
+    })
+    classes = np.asarray(classes, dtype=object)[valid]
+    for key in SERVICEABILITY_COLORS:
+        bins[key] = np.bincount(inverse, weights=classes == key, minlength=len(unique_cells)).astype(int)
+    return bins
+
+def hexbin_geojson(bins, size_deg=HEXBIN_SIZE_DEG):
+    """GeoJSON FeatureCollection of hexbin_sites rows: one hexagon per bin, with its counts
+    and majority serviceability class as properties."""
+    center_x = np.sqrt(3) * (bins['q'].to_numpy() + bins['r'].to_numpy() / 2) * size_deg
+    center_y = 1.5 * bins['r'].to_numpy() * size_deg
+    corner_lon = np.round(center_x[:, None] + size_deg * np.cos(HEX_CORNERS), 5)
+    corner_lat = np.round(inverse_mercator_y(center_y[:, None] + size_deg * np.sin(HEX_CORNERS)), 5)
+    classes = list(SERVICEABILITY_COLORS)
+    class_counts = bins[classes].to_numpy()
+    majority = [classes[i] for i in class_counts.argmax(axis=1)] if len(bins) else []
+    features = []
+    for i, count in enumerate(bins['count'].tolist()):
+        ring = list(zip(corner_lon[i].tolist(), corner_lat[i].tolist()))
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [ring + ring[:1]]},
+            'properties': {'count': count, 'majority': majority[i],
+                           **dict(zip(classes, class_counts[i].tolist()))},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+def country_service_counts(df_map, classes):
+    """Sites per Country: a count per serviceability class, the total (including sites with
+    no isotopes) and how many are serviceable, fully or partly as in the KPIs."""
+    table = pd.crosstab(df_map['Country'].astype(object).to_numpy(), np.asarray(classes, dtype=object))
+    counts = table.reindex(columns=list(SERVICEABILITY_COLORS), fill_value=0)
+    counts['total'] = table.sum(axis=1)
+    counts['serviceable'] = counts['can_serve'] + counts['partial_serve']
+    counts.index.name = 'Country'
+    counts.columns.name = None
+    return counts
+
+def convex_hull(points):
+    """Counter-clockwise convex hull of (x, y) points (Andrew's monotone chain)."""
+    points = sorted(set(points))
+    if len(points) <= 2:
+        return points
+
+    def half_hull(ordered):
+        chain = []
+        for x, y in ordered:
+            while len(chain) >= 2 and ((chain[-1][0] - chain[-2][0]) * (y - chain[-2][1])
+                                       - (chain[-1][1] - chain[-2][1]) * (x - chain[-2][0])) <= 0:
+                chain.pop()
+            chain.append((x, y))
+        return chain
+
+    return half_hull(points)[:-1] + half_hull(reversed(points))[:-1]
+
+def load_country_boundaries(path=COUNTRY_BOUNDARIES_PATH):
+    """{country name: GeoJSON geometry} from a boundaries file; empty when there is none."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    features = json.loads(path.read_text(encoding='utf-8')).get('features') or []
+    return {feature['properties']['name']: feature['geometry'] for feature in features
+            if (feature.get('properties') or {}).get('name') and feature.get('geometry')}
+
+def country_geojson(df_map, counts, boundaries=None, pad_deg=COUNTRY_HULL_PAD_DEG):
+    """GeoJSON FeatureCollection with one shape per row of country_service_counts, carrying its
+    counts and serviceable share. Shapes come from boundaries (see load_country_boundaries)
+    where a country is listed, else the convex hull of its sites widened by pad_deg. Only the
+    northern- and southernmost site of each 0.1° longitude column can be a hull corner, so a
+    hull costs about the same at any site count."""
+    if boundaries is None:
+        boundaries = load_country_boundaries()
+    columns = pd.DataFrame({
+        'Country': df_map['Country'].astype(object).to_numpy(),
+        'lon': np.round(df_map['Longitude'].to_numpy(dtype=float), 1),
+        'lat': df_map['Latitude'].to_numpy(dtype=float),
+    }).dropna().groupby(['Country', 'lon'])['lat'].agg(['min', 'max'])
+    pads = ((-pad_deg, -pad_deg), (-pad_deg, pad_deg), (pad_deg, -pad_deg), (pad_deg, pad_deg))
+    features = []
+    for country, row in counts.iterrows():
+        geometry = boundaries.get(country)
+        if geometry is None:
+            if country not in columns.index:
+                continue
+            extremes = columns.loc[country]
+            lons = extremes.index.tolist()
+            core = convex_hull(chain(zip(lons, extremes['min'].tolist()), zip(lons, extremes['max'].tolist())))
+            ring = convex_hull((round(x + dx, 5), round(y + dy, 5)) for x, y in core for dx, dy in pads)
+            geometry = {'type': 'Polygon', 'coordinates': [[list(p) for p in ring + ring[:1]]]}
+        features.append({
+            'type': 'Feature',
+            'geometry': geometry,
+            'properties': {'name': country, 'share': float(round(row['serviceable'] / row['total'], 4)) if row['total'] else 0.0,
+                           **{key: int(value) for key, value in row.items()}},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+class GatewayIndex:
+    """Nearest-gateway lookup over UPS gateway coordinates.
+    Gateways are stored once as 3-D unit vectors. The nearest gateway on the sphere is the one
+    with the largest dot product, so a block of sites is matched against every gateway with
+    a single matrix product; the distance then follows from the chord length (haversine-
+    equivalent). At hundreds of gateways this beats a tree index and needs no extra dependency."""
+
+    def __init__(self, df_gateways, block_size=8192):
+        gateways = df_gateways.dropna(subset=['Latitude', 'Longitude'])
+        self.codes = gateways['Code'].astype(str).to_numpy()
+        self.vectors = unit_vectors(gateways['Latitude'], gateways['Longitude'])
+        self.block_size = block_size
+
+    def nearest(self, latitudes, longitudes):
+        """Return (gateway_position, distance_km) arrays for each query point (-1/NaN if no gateway)."""
+        points = unit_vectors(latitudes, longitudes)
+        valid = ~np.isnan(points).any(axis=1)
+        index = np.full(len(points), -1, dtype=np.int64)
+        distance = np.full(len(points), np.nan)
+        if len(self.vectors) == 0:
+            return index, distance
+
+        for start in range(0, len(points), self.block_size):
+            block = slice(start, start + self.block_size)
+            best = np.argmax(np.nan_to_num(points[block], nan=0.0) @ self.vectors.T, axis=1)
+            chord = np.linalg.norm(points[block] - self.vectors[best], axis=1)
+            index[block] = best
+            distance[block] = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0.0, 1.0))
+
+        index[~valid] = -1
+        return index, distance
+
+def gateway_coverage(df_map, df_gateways, radius_km=GATEWAY_RADIUS_METERS / 1000):
+    """Nearest gateway, distance and coverage flag for every site, indexed by site ID.
+    A site is covered when it lies within radius_km of any gateway."""
+    index = GatewayIndex(df_gateways)
+    positions, distance = index.nearest(df_map['Latitude'], df_map['Longitude'])
+    nearest = np.where(positions >= 0, index.codes[positions] if len(index.codes) else '', None)
+    coverage = pd.DataFrame({
+        'ID': df_map['ID'].to_numpy(),
+        'nearest_gateway': nearest,
+        'distance_km': distance,
+        'covered': distance <= radius_km,
+    })
+    return coverage.drop_duplicates('ID', keep='last').set_index('ID')
+
+def decay_remaining_activity(distance_km, halflife_hours, speed_kmh=TRANSIT_SPEED_KMH,
+                             handling_hours=TRANSIT_HANDLING_HOURS):
+    """Fraction of activity left on arrival after travelling distance_km.
+    distance_km is (sites,), halflife_hours is (isotopes,); returns a float32
+    (sites x isotopes) array of 2 ** (-transit_hours / half-life)."""
+    transit_hours = handling_hours + np.asarray(distance_km, dtype=np.float32) / np.float32(speed_kmh)
+    halflife_hours = np.asarray(halflife_hours, dtype=np.float32)
+    return np.exp2(-transit_hours[:, None] / halflife_hours[None, :])
+
+def transit_viability(df_map, df_gateways, sites, speed_kmh=TRANSIT_SPEED_KMH,
+                      handling_hours=TRANSIT_HANDLING_HOURS, min_remaining=MIN_REMAINING_ACTIVITY):
+    """Per-isotope transit viability: (site_id, isotope) -> True when the best gateway still
+    receives at least min_remaining of the activity (see decay_remaining_activity)."""
+    # Isotope axis: every distinct isotope across all sites
+    halflives = {}
+    for site in sites:
+        for iso in site.isotopes:
+            halflives.setdefault(iso.name, iso.halflife_hours)
+    isotope_names = list(halflives)
+    isotope_pos = {name: i for i, name in enumerate(isotope_names)}
+
+    mapsites = df_map.dropna(subset=['Latitude', 'Longitude']).drop_duplicates('ID', keep='last')
+    if mapsites.empty or not isotope_names or df_gateways[['Latitude', 'Longitude']].dropna().empty:
+        return {}
+    # Activity left falls monotonically with distance, so the best gateway is the nearest one
+    _, distance = GatewayIndex(df_gateways).nearest(mapsites['Latitude'], mapsites['Longitude'])
+    remaining = decay_remaining_activity(
+        distance, [halflives[name] for name in isotope_names], speed_kmh, handling_hours
+    )
+    viable = remaining >= min_remaining
+    site_pos = {site_id: i for i, site_id in enumerate(mapsites['ID'].tolist())}
+
+    can_serve = {}
+    for site in sites:
+        row = site_pos.get(site.site_id)
+        for iso in site.isotopes:
+            # Sites without coordinates cannot be assessed for transit, so they are not viable
+            can_serve[(site.site_id, iso.name)] = row is not None and bool(viable[row, isotope_pos[iso.name]])
+    return can_serve
+
+class SnapshotStore:
+    """Loaded datasets on local disk: one directory of Parquet files per content hash (see
+    data_fingerprint) with a meta.json holding its label, save time and row counts. Saving a
+    dataset that is already stored is a no-op, so every load can be saved. Directories are
+    written under a temporary name and renamed into place, as in UploadCache, and the store
+    is bounded by total bytes with least-recently-used eviction (recency is meta.json's mtime).
+
+    A snapshot saved with a scope (e.g. a session token) is listed only for that scope, so
+    uploaded workbooks are never offered to other sessions; unscoped snapshots are shared."""
+
+    def __init__(self, directory=SNAPSHOT_DIR, max_bytes=SNAPSHOT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for meta in self.directory.glob('*/meta.json'):
+            try:
+                entries.append((meta.stat().st_mtime_ns, meta.parent.name, self._size(meta.parent)))
+            except OSError:
+                continue  # being deleted
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(entries))  # oldest first
+        self.total_bytes = sum(self._entries.values())
+
+    @staticmethod
+    def _size(path):
+        return sum(f.stat().st_size for f in path.iterdir())
+
+    @staticmethod
+    def key(digest, scope=None):
+        """Directory name of a dataset's snapshot within a scope."""
+        return digest if scope is None else hashlib.sha256(f"{scope}:{digest}".encode()).hexdigest()
+
+    def __contains__(self, key):
+        return (self.directory / key / 'meta.json').exists()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def save(self, frames, label='', scope=None):
+        """Store (Manufacturers, Legend, UPS_Gateways) unless already stored; returns the snapshot key."""
+        digest = data_fingerprint(*frames)
+        key = self.key(digest, scope)
+        if key in self:
+            self._touch(key)
+            return key
+        temp = self.directory / f"{key}.{uuid.uuid4().hex}.tmp"
+        temp.mkdir()
+        try:
+            for sheet, df in zip(WORKBOOK_SHEETS, frames):
+                df.to_parquet(temp / f"{sheet}.parquet", index=False)
+            meta = {'key': key, 'digest': digest, 'scope': scope, 'label': label, 'saved': time.time(),
+                    'sites': int(frames[0]['ID'].nunique()), 'gateways': len(frames[2])}
+            (temp / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
+            size = self._size(temp)
+            os.replace(temp, self.directory / key)
+        except OSError:
+            if key not in self:  # rather than another process saving the same dataset first
+                raise
+            return key
+        finally:
+            shutil.rmtree(temp, ignore_errors=True)
+        with self._lock:
+            self.total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                evicted, evicted_size = self._entries.popitem(last=False)
+                shutil.rmtree(self.directory / evicted, ignore_errors=True)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+        return key
+
+    def _touch(self, key):
+        try:
+            os.utime(self.directory / key / 'meta.json')
+        except OSError:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+    def snapshots(self, scope=None):
+        """meta.json of the shared snapshots plus those saved with scope, oldest first."""
+        snapshots = []
+        for path in self.directory.glob('*/meta.json'):
+            try:
+                meta = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue  # being deleted, or not a snapshot
+            if meta.get('scope') is None or meta.get('scope') == scope:
+                snapshots.append({'key': path.parent.name, **meta})
+        return sorted(snapshots, key=lambda meta: meta['saved'])
+
+    def load(self, key):
+        """The (Manufacturers, Legend, UPS_Gateways) frames of a stored snapshot."""
+        frames = compact_frames(pd.read_parquet(self.directory / key / f"{sheet}.parquet") for sheet in WORKBOOK_SHEETS)
+        self._touch(key)
+        return frames
+
+@dataclass
+class DatasetDiff:
+    """What changed between two datasets (see diff_datasets), one table per kind of change.
+    Latitude/Longitude are where each change is shown: the new position, or the last known
+    one for removals."""
+    sites: pd.DataFrame     # added, removed or moved sites
+    isotopes: pd.DataFrame  # sites in both whose parsed isotopes differ
+    gateways: pd.DataFrame  # added, removed or re-statused gateways
+
+    def counts(self):
+        changes = self.sites['Change'].value_counts()
+        return {'added': int(changes.get('added', 0)), 'removed': int(changes.get('removed', 0)),
+                'moved': int(changes.get('moved', 0)), 'isotopes': len(self.isotopes), 'gateways': len(self.gateways)}
+
+def latest_rows(df, key, columns):
+    """columns of the rows with a key, the last row per key winning (as in map_sites)."""
+    return df.loc[df[key].notna(), columns].drop_duplicates(key, keep='last')
+
+def joined_changes(old, new, key, columns):
+    """Outer hash join of two tables on key (see latest_rows); old columns get an _old suffix
+    and _merge tells 'left_only' (added), 'right_only' (removed) and 'both'."""
+    return latest_rows(new, key, columns).merge(latest_rows(old, key, columns), on=key, how='outer',
+                                                suffixes=('', '_old'), indicator=True)
+
+def current_or_old(joined, column):
+    """joined[column], with the old value for rows only the old table has."""
+    new, old = joined[column], joined[f"{column}_old"]
+    if not (pd.api.types.is_numeric_dtype(new) and pd.api.types.is_numeric_dtype(old)):
+        new, old = new.astype(object), old.astype(object)
+    return new.fillna(old)
+
+def isotope_sets(descriptions):
+    """Frozenset of the canonical isotope names parsed from each description."""
+    return [frozenset(iso.name for iso in parse_isotopes_from_description(description))
+            for description in pd.Series(descriptions, dtype=object).fillna('').astype(str).tolist()]
+
+def diff_sites(old_map, new_map, move_km=SNAPSHOT_MOVE_KM):
+    """Sites added, removed, or moved by more than move_km (great-circle), by Manufacturers ID."""
+    joined = joined_changes(old_map, new_map, 'ID', ['ID', 'Country', 'Latitude', 'Longitude'])
+    both = (joined['_merge'] == 'both').to_numpy()
+    moved_km = np.full(len(joined), np.nan)
+    if both.any():
+        cosines = np.einsum('ij,ij->i', unit_vectors(joined['Latitude'][both], joined['Longitude'][both]),
+                            unit_vectors(joined['Latitude_old'][both], joined['Longitude_old'][both]))
+        moved_km[both] = EARTH_RADIUS_KM * np.arccos(np.clip(cosines, -1.0, 1.0))
+    change = np.select([joined['_merge'] == 'left_only', joined['_merge'] == 'right_only', moved_km > move_km],
+                       ['added', 'removed', 'moved'], None)
+    moved = change == 'moved'
+    sites = pd.DataFrame({
+        'ID': joined['ID'],
+        'Change': change,
+        'Country': current_or_old(joined, 'Country'),
+        'Latitude': current_or_old(joined, 'Latitude'),
+        'Longitude': current_or_old(joined, 'Longitude'),
+        'Old Latitude': joined['Latitude_old'].where(moved),
+        'Old Longitude': joined['Longitude_old'].where(moved),
+        'Moved (km)': np.where(moved, np.round(moved_km, 2), np.nan),
+    })
+    return sites[sites['Change'].notna()].sort_values(['Change', 'ID'], kind='stable').reset_index(drop=True)
+
+def diff_isotopes(old_legend, new_legend, new_map):
+    """Sites in both legends whose parsed isotopes differ, with the isotopes added and removed.
+    Only descriptions whose text changed are parsed."""
+    joined = latest_rows(new_legend, 'ID', ['ID', 'Description']).merge(
+        latest_rows(old_legend, 'ID', ['ID', 'Description']), on='ID', suffixes=('', '_old'))
+    edited = joined[(joined['Description'].fillna('') != joined['Description_old'].fillna('')).to_numpy()]
+    added, removed = [], []
+    for new, old in zip(isotope_sets(edited['Description']), isotope_sets(edited['Description_old'])):
+        added.append(', '.join(sorted(new - old)))
+        removed.append(', '.join(sorted(old - new)))
+    isotopes = pd.DataFrame({'ID': edited['ID'].to_numpy(), 'Added': added, 'Removed': removed})
+    isotopes = isotopes[(isotopes['Added'] != '') | (isotopes['Removed'] != '')]
+    positions = latest_rows(new_map, 'ID', ['ID', 'Country', 'Latitude', 'Longitude'])
+    return isotopes.merge(positions, on='ID', how='left')[
+        ['ID', 'Country', 'Latitude', 'Longitude', 'Added', 'Removed']].reset_index(drop=True)
+
+def diff_gateways(old_gateways, new_gateways):
+    """Gateways added, removed, or with a different Status, by Code."""
+    joined = joined_changes(old_gateways, new_gateways, 'Code',
+                            ['Code', 'City', 'Country', 'Status', 'Latitude', 'Longitude'])
+    new_status = joined['Status'].astype(object).fillna('').astype(str).str.strip()
+    old_status = joined['Status_old'].astype(object).fillna('').astype(str).str.strip()
+    change = np.select([joined['_merge'] == 'left_only', joined['_merge'] == 'right_only', new_status != old_status],
+                       ['added', 'removed', 'status'], None)
+    gateways = pd.DataFrame({
+        'Code': joined['Code'],
+        'City': current_or_old(joined, 'City'),
+        'Country': current_or_old(joined, 'Country'),
+        'Change': change,
+        'Old Status': joined['Status_old'].astype(object),
+        'New Status': joined['Status'].astype(object),
+        'Latitude': current_or_old(joined, 'Latitude'),
+        'Longitude': current_or_old(joined, 'Longitude'),
+    })
+    return gateways[gateways['Change'].notna()].sort_values(['Change', 'Code'], kind='stable').reset_index(drop=True)
+
+def diff_datasets(old_frames, new_frames, move_km=SNAPSHOT_MOVE_KM):
+    """DatasetDiff from old to new (Manufacturers, Legend, UPS_Gateways) frames. Every table is
+    matched by hash join on its key, so two 100k-site datasets diff in about a second."""
+    return DatasetDiff(
+        sites=diff_sites(old_frames[0], new_frames[0], move_km),
+        isotopes=diff_isotopes(old_frames[1], new_frames[1], new_frames[0]),
+        gateways=diff_gateways(old_frames[2], new_frames[2]),
+    )
+
+# Site legend panel: a static page (shared CSS classes, virtualized list) plus one JSON payload.
+# Only the rows in view exist in the iframe DOM, so the panel costs the same at 30 or 100k sites.
+LEGEND_ROW_HEIGHT = 56
+LEGEND_DESCRIPTION_CHARS = 80
+
+LEGEND_PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
+    <style>
+        * { font-family: 'Inter', -apple-system, sans-serif; margin: 0; padding: 0; box-sizing: border-box; }
+        body { background: transparent; }
+        ::-webkit-scrollbar { width: 6px; }
+        ::-webkit-scrollbar-track { background: #f1f1f1; border-radius: 3px; }
+        ::-webkit-scrollbar-thumb { background: #c1c1c1; border-radius: 3px; }
+        .gw-key { background:#F8FAFC;border:1px solid #E2E8F0;border-radius:6px;padding:10px;margin-bottom:10px; }
+        .gw-title, .list-title { font-size:11px;font-weight:600;color:#1B4F72;margin-bottom:8px; }
+        .list-title { font-size:12px;margin-bottom:6px; }
+        .gw-items { display:flex;gap:12px;flex-wrap:wrap; }
+        .gw-item { display:flex;align-items:center;gap:6px;font-size:10px;color:#374151; }
+        .gw-ring { width:18px;height:18px;border:3px solid;border-radius:50%%; }
+        .site-list { background:white;border:1px solid #E5E8EB;border-radius:6px;max-height:500px;overflow-y:auto;position:relative; }
+        .site-row { position:absolute;left:0;right:0;height:%(row_height)dpx;display:flex;align-items:flex-start;padding:8px 10px;border-bottom:1px solid #F0F0F0;gap:8px;overflow:hidden; }
+        .site-id { color:white;font-weight:700;min-width:28px;height:24px;padding:0 3px;display:flex;align-items:center;justify-content:center;border-radius:4px;font-size:12px;flex-shrink:0;border:2px solid; }
+        %(serviceability_css)s
+        .site-body { flex:1;min-width:0; }
+        .site-desc { font-size:11px;color:#374151;line-height:1.4;margin-bottom:4px;white-space:nowrap;overflow:hidden;text-overflow:ellipsis; }
+        .site-isos { display:flex;gap:2px;overflow:hidden; }
+        .iso { padding:1px 5px;border-radius:6px;font-size:9px;margin-right:3px;white-space:nowrap;background:#FEE2E2;color:#991B1B; }
+        .iso.ok { background:#D1FAE5;color:#065F46; }
+    </style>
+</head>
+<body>
+    <div class="gw-key">
+        <div class="gw-title">✈️ UPS Origin Gateways</div>
+        <div class="gw-items">
+            <div class="gw-item"><div class="gw-ring" style="border-color:#22A06B;"></div><strong>Current</strong></div>
+            <div class="gw-item"><div class="gw-ring" style="border-color:#F59E0B;"></div><strong>Development</strong></div>
+            <div class="gw-item"><div class="gw-ring" style="border-color:#DC2626;"></div><strong>Requested</strong></div>
+        </div>
+    </div>
+    <div class="list-title">📍 Manufacturing Sites by Serviceability</div>
+    <div class="site-list" id="site-list"><div id="site-spacer"></div></div>
+    <script>
+        var escapeHtml = function (s) {
+            return String(s).replace(/[&<>"']/g, function (c) {
+                return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+            });
+        };
+        // Columnar payload, see legend_payload(); site i's isotopes are
+        // site_isotopes[offsets[i]:offsets[i + 1]], indexes into the distinct isotopes table
+        var legend = %(payload)s;
+        var count = legend.ids.length;
+        var isotopeHtml = legend.isotopes.map(function (iso) {
+            return '<span class="iso' + (iso[2] ? ' ok' : '') + '">' + escapeHtml(iso[0]) + ' (' + escapeHtml(iso[1]) + ')</span>';
+        });
+        var ROW_HEIGHT = %(row_height)d, OVERSCAN = 8;
+        var list = document.getElementById('site-list'), spacer = document.getElementById('site-spacer');
+        var rowHtml = function (i) {
+            var isotopes = [];
+            for (var k = legend.offsets[i]; k < legend.offsets[i + 1]; k++) isotopes.push(isotopeHtml[legend.site_isotopes[k]]);
+            var description = escapeHtml(legend.desc[i]);
+            return '<div class="site-row" style="top:' + (i * ROW_HEIGHT) + 'px">'
+                + '<div class="site-id ' + legend.classes[legend.status[i]] + '">' + escapeHtml(legend.ids[i]) + '</div>'
+                + '<div class="site-body"><div class="site-desc" title="' + description + '">' + description + '</div>'
+                + '<div class="site-isos">' + isotopes.join('') + '</div></div></div>';
+        };
+        var rendered = null, pending = false;
+        var render = function () {
+            pending = false;
+            var first = Math.max(0, Math.floor(list.scrollTop / ROW_HEIGHT) - OVERSCAN);
+            var last = Math.min(count, Math.ceil((list.scrollTop + list.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+            if (rendered === first + ':' + last) return;
+            rendered = first + ':' + last;
+            var parts = [];
+            for (var i = first; i < last; i++) parts.push(rowHtml(i));
+            spacer.innerHTML = parts.join('');
+        };
+        spacer.style.height = (count * ROW_HEIGHT) + 'px';
+        list.style.height = Math.min(500, count * ROW_HEIGHT + 2) + 'px';
+        list.addEventListener('scroll', function () {
+            if (!pending) { pending = true; window.requestAnimationFrame(render); }
+        });
+        window.addEventListener('resize', render);
+        render();
+    </script>
+</body>
+</html>'''
+
+# Serviceability classes only need filling in once per process
+LEGEND_PAGE = LEGEND_PAGE_TEMPLATE % {
+    'row_height': LEGEND_ROW_HEIGHT,
+    'serviceability_css': '\n        '.join(
+        f".site-id.{key} {{ background:{fill};border-color:{border}; }}"
+        for key, (fill, border) in SERVICEABILITY_COLORS.items()
+    ),
+    'payload': '%(payload)s',
+}
+
+LEGEND_CLASSES = list(SERVICEABILITY_COLORS)
+
+def legend_entry(site):
+    """(ID, serviceability position, truncated description, badges) of one legend row; badges
+    are (isotope, half-life display, can_serve) tuples."""
+    site_id = site.site_id if isinstance(site.site_id, (int, str)) else str(site.site_id)
+    status = LEGEND_CLASSES.index(site.serviceability if site.serviceability in LEGEND_CLASSES else 'partial_serve')
+    description = site.description
+    if len(description) > LEGEND_DESCRIPTION_CHARS:
+        description = description[:LEGEND_DESCRIPTION_CHARS] + '...'
+    badges = tuple((iso.name, iso.halflife_display, int(iso.can_serve)) for iso in site.isotopes)
+    return site_id, status, description, badges
+
+LEGEND_ENTRIES = SiteMemo(legend_entry)
+
+def legend_payload(sites):
+    """Columnar legend data as JSON, in legend order. Flat columns instead of one nested list
+    per site keep the build linear and out of the garbage collector's way at 100k sites;
+    isotope badges are stored once per distinct (isotope, half-life, can_serve), and each
+    site's row is reused until the site changes (see SiteMemo)."""
+    entries = list(map(LEGEND_ENTRIES.get, sites))
+    badges, site_badges = entry_positions(entry[3] for entry in entries)
+    return json_object({
+        'classes': script_json(LEGEND_CLASSES), 'ids': script_json([entry[0] for entry in entries]),
+        'status': script_json([entry[1] for entry in entries]), 'desc': script_json([entry[2] for entry in entries]),
+        'isotopes': script_json([list(badge) for badge in badges]),
+        'offsets': script_json([0, *accumulate(len(entry[3]) for entry in entries)]),
+        'site_isotopes': script_json(site_badges),
+    })
+
+def create_legend_html(sites):
+    """Standalone HTML page for the site legend panel: gateway key plus a virtualized site list."""
+    return LEGEND_PAGE.replace('%(payload)s', legend_payload(sites), 1)
+
+def summary_entry(site):
+    """(site ID, name, can-serve isotopes, cannot-serve isotopes, status) of one summary row."""
+    # Site name without the location part after the dash
+    site_name = site.name
+    if '–' in site_name:
+        site_name = site_name.split('–')[0].strip()
+    can_serve_isotopes = [i.name for i in site.isotopes if i.can_serve]
+    cannot_serve_isotopes = [i.name for i in site.isotopes if not i.can_serve]
+    serviceability = site.serviceability
+    return (
+        site.site_id,
+        site_name[:30] + ('...' if len(site_name) > 30 else ''),
+        ', '.join(can_serve_isotopes) if can_serve_isotopes else '—',
+        ', '.join(cannot_serve_isotopes) if cannot_serve_isotopes else '—',
+        '✓ Full' if serviceability == 'can_serve' else ('✗ None' if serviceability == 'cannot_serve' else '◐ Partial'),
+    )
+
+SUMMARY_ENTRIES = SiteMemo(summary_entry)
+
+def create_isotope_summary(sites, coverage=None, service_labels=('≥6h', '<6h')):
+    """Create a summary dataframe of all sites with isotope serviceability."""
+    columns = ['Site', 'Name', f'Can Serve ({service_labels[0]})', f'Cannot Serve ({service_labels[1]})', 'Status']
+    summary_df = pd.DataFrame(list(map(SUMMARY_ENTRIES.get, sites)), columns=columns)
+    if coverage is not None and not summary_df.empty:
+        site_coverage = coverage.reindex(summary_df['Site'])
+        summary_df['Nearest Gateway'] = site_coverage['nearest_gateway'].fillna('—').to_numpy()
+        summary_df['Distance (km)'] = site_coverage['distance_km'].round(0).to_numpy()
+        summary_df['Covered'] = np.where(site_coverage['covered'].fillna(False).to_numpy(dtype=bool), '✓', '✗')
+    return summary_df
+
+class PagedTable:
+    """Filter, sort and page a table server-side so only the visible page reaches the browser.
+    Sort orders and the lowercase search text are computed once per column and reused
+    across reruns; a page is one positional take from the sorted, filtered order."""
+
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        self._orders = {}
+        self._search_text = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.df)
+
+    def order(self, column=None, ascending=True):
+        """Row positions sorted by column (stable, missing values last); None keeps file order."""
+        if column is None:
+            return np.arange(len(self.df))
+        key = (column, ascending)
+        order = self._orders.get(key)
+        if order is None:
+            order = self.df[column].sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+            with self._lock:
+                self._orders[key] = order
+        return order
+
+    def search_text(self):
+        """All columns as one lowercase string per row, for substring filtering."""
+        if self._search_text is None:
+            text = None
+            for column in self.df.columns:
+                values = self.df[column].astype(str)
+                text = values if text is None else text + '\x1f' + values
+            self._search_text = (text if text is not None else pd.Series([''] * len(self.df))).str.lower()
+        return self._search_text
+
+    def select(self, query='', sort_by=None, ascending=True):
+        """Positions of the rows matching query (case-insensitive, any column) in sort order."""
+        order = self.order(sort_by, ascending)
+        query = query.strip().lower()
+        if not query:
+            return order
+        mask = self.search_text().str.contains(query, regex=False).to_numpy(dtype=bool)
+        return order[mask[order]]
+
+    def page(self, positions, page, page_size=TABLE_PAGE_SIZE):
+        """Rows for a 1-based page of a select() result."""
+        start = (page - 1) * page_size
+        return self.df.take(positions[start:start + page_size])
@@ -0,0 +1,387 @@
+"""
+Nuclear Medicine EMEA Manufacturing Dashboard - folium map building
+
+Kept apart from nm_core so folium, branca and jinja2 are imported only when a
+map is actually built, not on every cold start.
+"""
+
+import math
+
+import folium
+from folium import plugins
+from folium.template import Template as FoliumTemplate
+from branca.colormap import LinearColormap
+from branca.element import MacroElement
+from jinja2 import Template
+
+from nm_core import (
+    COLORS, DEFAULT_VIEW_ZOOM, DIFF_MAP_MAX_MARKERS, DIFF_STYLES, GATEWAY_RADIUS_METERS, HEXBIN_SIZE_DEG, POPUP_BADGES,
+    POPUP_ISOTOPE_ROW_TEMPLATE, POPUP_STATUS, POPUP_TEMPLATE, SCALABLE_MAP_SITE_THRESHOLD, SERVICE_THRESHOLD_PLACEHOLDER,
+    SERVICEABILITY_COLORS, SITE_LAYERS, SITE_POPUPS_PLACEHOLDER, SITE_ROWS_PLACEHOLDER,
+    country_geojson, country_service_counts, create_popup_html, halflife_service_rule, hexbin_geojson, hexbin_sites,
+    map_sites, popup_site_key, script_json, site_classes, site_layer_payload, site_popup_json,
+)
+
+class LazySitePopups(MacroElement):
+    """Ships popup data for all sites as one compact JSON blob plus the popup templates;
+    each popup's HTML is built in the browser only when its marker is clicked.
+    The blob also carries isotope half-lives, so marker colors and popups can be
+    re-derived in the browser for any half-life threshold without rebuilding the map.
+    Must be added to the map before a clustered site layer and after per-site markers.
+    data is prebuilt popup JSON (see site_layer_payload) and sites=None with no data leaves
+    SITE_POPUPS_PLACEHOLDER in its place."""
+    
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var sitePopupData = (function (payload) {
+                var data = {};
+                for (var i = 0; payload && i < payload.keys.length; i++) {
+                    var isotopes = [];
+                    for (var j = payload.offsets[i]; j < payload.offsets[i + 1]; j++) {
+                        isotopes.push(payload.isotopes[payload.site_isotopes[j]]);
+                    }
+                    data[payload.keys[i]] = [payload.names[i], payload.classes[payload.status[i]], isotopes];
+                }
+                return data;
+            })({{ this.data }});
+            var siteServiceThreshold = {{ this.threshold_placeholder }};
+            var siteServiceRule = {{ this.service_rule }};
+            var siteServiceColors = {{ this.colors }};
+            var sitePopupStatus = {{ this.status }};
+            var sitePopupBadges = {{ this.badges }};
+            var sitePopupTemplate = {{ this.template }};
+            var sitePopupRowTemplate = {{ this.row_template }};
+            function fillSitePopupTemplate(template, values) {
+                return template.replace(/\\{(\\w+)\\}/g, function (match, key) { return values[key]; });
+            }
+            function siteIsotopeServes(iso) {
+                return siteServiceThreshold === null ? iso[2] === 1 : iso[3] >= siteServiceThreshold;
+            }
+            function siteServiceability(siteId) {
+                var site = sitePopupData[siteId];
+                if (!site) { return 'unknown'; }
+                if (siteServiceThreshold === null) { return site[1]; }
+                var total = site[2].length, canServe = site[2].filter(siteIsotopeServes).length;
+                if (total === 0) { return 'unknown'; }
+                return canServe === total ? 'can_serve' : (canServe === 0 ? 'cannot_serve' : 'partial_serve');
+            }
+            function siteMarkerColors(siteId) {
+                return siteServiceColors[siteServiceability(siteId)] || siteServiceColors['partial_serve'];
+            }
+            function restyleSiteMarker(marker, siteId) {
+                if (siteServiceThreshold === null) { return; }
+                var element = marker.getElement();
+                var box = element && element.querySelector('.nm-site');
+                if (box) {
+                    var colors = siteMarkerColors(siteId);
+                    box.style.background = colors[0];
+                    box.style.borderColor = colors[1];
+                }
+            }
+            function renderSitePopup(siteId) {
+                var site = sitePopupData[siteId];
+                if (!site) { return 'Site ' + siteId; }
+                var status = sitePopupStatus[siteServiceability(siteId)] || sitePopupStatus['partial_serve'];
+                var isotopes = site[2].map(function (iso) { return {iso: iso, serves: siteIsotopeServes(iso)}; });
+                isotopes.sort(function (a, b) {
+                    if (a.serves !== b.serves) { return a.serves ? -1 : 1; }
+                    return a.iso[0] < b.iso[0] ? -1 : (a.iso[0] > b.iso[0] ? 1 : 0);
+                });
+                var rows = isotopes.map(function (entry) {
+                    var badge = sitePopupBadges[entry.serves ? 1 : 0];
+                    return fillSitePopupTemplate(sitePopupRowTemplate, {
+                        name: entry.iso[0], halflife: entry.iso[1], badge_bg: badge[0], badge_color: badge[1], badge: badge[2]
+                    });
+                }).join('');
+                var rule = siteServiceThreshold === null ? siteServiceRule
+                    : '≥' + siteServiceThreshold + 'h half-life required for Marken service';
+                return fillSitePopupTemplate(sitePopupTemplate, {
+                    site_id: siteId, site_name: site[0], status_bg: status[2],
+                    header_color: status[0], status_text: status[1], isotope_rows: rows, service_rule: rule
+                });
+            }
+            {%- for marker_name, site_id in this.bindings %}
+            {{ marker_name }}.bindPopup(function () { return renderSitePopup({{ site_id }}); }, {maxWidth: 300});
+            restyleSiteMarker({{ marker_name }}, {{ site_id }});
+            {%- endfor %}
+        {% endmacro %}
+    """)
+    
+    def __init__(self, sites, service_rule=None, data=None):
+        super().__init__()
+        self._name = 'LazySitePopups'
+        if data is None:
+            data = SITE_POPUPS_PLACEHOLDER if sites is None else site_popup_json(sites)
+        self.data = data
+        self.threshold_placeholder = SERVICE_THRESHOLD_PLACEHOLDER
+        self.service_rule = script_json(service_rule or halflife_service_rule())
+        self.colors = script_json(SERVICEABILITY_COLORS)
+        self.status = script_json(POPUP_STATUS)
+        self.badges = script_json(POPUP_BADGES)
+        self.template = script_json(POPUP_TEMPLATE)
+        self.row_template = script_json(POPUP_ISOTOPE_ROW_TEMPLATE)
+        self.bindings = []
+    
+    def bind(self, marker, site_id):
+        """Attach an on-demand popup to a server-side folium marker."""
+        self.bindings.append((marker.get_name(), script_json(popup_site_key(site_id))))
+
+# Site marker square; colors are filled in per site (shared by both map modes)
+SITE_ICON_STYLE = (
+    "color:white;font-weight:700;font-size:11px;width:26px;height:22px;"
+    "display:flex;align-items:center;justify-content:center;border-radius:4px;"
+    "box-shadow:1px 1px 4px rgba(0,0,0,0.3);transform:translate(-13px,-11px);"
+)
+
+def site_icon_html(site_id, marker_color, border_color):
+    return f'<div class="nm-site" style="background:{marker_color};border:2px solid {border_color};{SITE_ICON_STYLE}">{site_id}</div>'
+
+# Browser-side marker factory for the clustered layer; rows are [lat, lon, id, country].
+# Colors and popups come from LazySitePopups, which create_map always adds first in this mode.
+CLUSTER_MARKER_CALLBACK = """function (row) {
+    var style = siteMarkerColors(row[2]);
+    var icon = L.divIcon({
+        html: '<div class="nm-site" style="background:' + style[0] + ';border:2px solid ' + style[1] + ';%(icon_style)s">' + row[2] + '</div>',
+        iconSize: [26, 22],
+        className: 'empty'
+    });
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindTooltip('Site ' + row[2] + ': ' + row[3] + ' (Click for details)');
+    marker.bindPopup(function () { return renderSitePopup(row[2]); }, {maxWidth: 300});
+    return marker;
+}"""
+
+def add_gateway_layer(m, df_gateways):
+    """Draw each UPS gateway as a status-colored coverage circle."""
+    for _, row in df_gateways.iterrows():
+        status = row.get("Status", "").strip()
+        if status == "Current":
+            gateway_color = COLORS['gateway_current']  # Green
+            status_label = "Current"
+        elif status == "Development":
+            gateway_color = COLORS['gateway_development']  # Yellow
+            status_label = "Development"
+        else:  # Requested or other
+            gateway_color = COLORS['gateway_requested']  # Red
+            status_label = "Requested"
+        
+        folium.Circle(
+            location=[row["Latitude"], row["Longitude"]],
+            radius=GATEWAY_RADIUS_METERS, color=gateway_color, weight=3, fill=False, opacity=0.9,
+            tooltip=f"UPS Gateway: {row['Code']} - {row['City']} ({status_label})"
+        ).add_to(m)
+
+def map_site_records(df_map, sites):
+    """Pair each Manufacturers row with its enriched site (see map_sites)."""
+    return zip((row for _, row in df_map.iterrows()), map_sites(df_map, sites))
+
+def add_site_markers(m, records, lazy_popups=None, service_rule=None):
+    """One DivIcon marker per site; popups are embedded unless a LazySitePopups is given."""
+    for row, site in records:
+        popup = None if lazy_popups else folium.Popup(create_popup_html(site, service_rule), max_width=300)
+        marker = folium.Marker(
+            location=[row["Latitude"], row["Longitude"]],
+            icon=folium.DivIcon(html=site_icon_html(site.site_id, site.color, site.border_color), icon_size=(26, 22)),
+            popup=popup,
+            tooltip=f"Site {site.site_id}: {row['Country']} (Click for details)"
+        ).add_to(m)
+        if lazy_popups:
+            lazy_popups.bind(marker, site.site_id)
+
+class SiteClusterLayer(plugins.FastMarkerCluster):
+    """FastMarkerCluster taking its rows as prebuilt columnar JSON (see site_layer_payload),
+    so they can also be left as SITE_ROWS_PLACEHOLDER and filled into the rendered HTML later."""
+    
+    _template = FoliumTemplate("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                {{ this.callback }}
+                var data = {{ this.rows }};
+                var cluster = L.markerClusterGroup({{ this.options|tojavascript }});
+                for (var i = 0; data && i < data.lat.length; i++) {
+                    callback([data.lat[i], data.lon[i], data.key[i], data.country[i]]).addTo(cluster);
+                }
+                cluster.addTo({{ this._parent.get_name() }});
+                return cluster;
+            })();
+        {% endmacro %}""")
+    
+    def __init__(self, rows_json=SITE_ROWS_PLACEHOLDER, **kwargs):
+        super().__init__([], **kwargs)
+        self.rows = rows_json
+
+def add_site_cluster_layer(m, rows_json=SITE_ROWS_PLACEHOLDER):
+    """All sites as one compact data array, turned into clustered markers in the browser."""
+    callback = CLUSTER_MARKER_CALLBACK % {'icon_style': SITE_ICON_STYLE}
+    SiteClusterLayer(rows_json, callback=callback, name="Manufacturing sites").add_to(m)
+
+def create_base_map(df_gateways):
+    """The map without any site markers: tiles, initial EMEA view and gateway circles."""
+    m = folium.Map(location=[50.0, 10.0], zoom_start=DEFAULT_VIEW_ZOOM, tiles='cartodbpositron')
+    add_gateway_layer(m, df_gateways)
+    return m
+
+def aggregate_icon_html(count, serviceability):
+    fill, border = SERVICEABILITY_COLORS[serviceability]
+    size = 26 if count < 100 else (32 if count < 1000 else 38)
+    return (f'<div style="background:{fill};border:2px solid {border};color:white;font-weight:700;font-size:11px;'
+            f'width:{size}px;height:{size}px;border-radius:50%;display:flex;align-items:center;justify-content:center;'
+            f'opacity:0.9;transform:translate(-{size // 2}px,-{size // 2}px);">{count:,}</div>')
+
+def viewport_layer(df_map, sites, aggregates=None, service_rule=None):
+    """Feature group holding only what is in view: one marker per df_map row, or with
+    aggregates (see aggregate_sites) one count bubble per grid cell, colored by majority class."""
+    layer = folium.FeatureGroup(name="Sites in view")
+    if aggregates is None:
+        add_site_markers(layer, map_site_records(df_map, sites), service_rule=service_rule)
+        return layer
+    classes = list(SERVICEABILITY_COLORS)
+    for row in aggregates.itertuples(index=False):
+        counts = {key: getattr(row, key) for key in classes}
+        majority = max(classes, key=counts.get)
+        folium.Marker(
+            location=[row.Latitude, row.Longitude],
+            icon=folium.DivIcon(html=aggregate_icon_html(row.count, majority), icon_size=(0, 0)),
+            tooltip=(f"{row.count:,} sites: {counts['can_serve']:,} can serve, "
+                     f"{counts['partial_serve']:,} partial, {counts['cannot_serve']:,} cannot serve (zoom in for sites)")
+        ).add_to(layer)
+    return layer
+
+def add_density_layer(m, df_map, classes, size_deg=HEXBIN_SIZE_DEG, show=True):
+    """Hexagon density layer: each hexagon is colored by its majority serviceability class
+    and more opaque the more sites it holds. classes are per df_map row (see site_classes)."""
+    bins = hexbin_sites(df_map['Latitude'], df_map['Longitude'], classes, size_deg)
+    geojson = hexbin_geojson(bins, size_deg)
+    peak = math.log1p(bins['count'].max()) if len(bins) else 1.0
+    for feature in geojson['features']:
+        props = feature['properties']
+        props['opacity'] = round(0.25 + 0.6 * math.log1p(props['count']) / peak, 2)
+        props['tooltip'] = (f"{props['count']:,} sites: {props['can_serve']:,} can serve, "
+                            f"{props['partial_serve']:,} partial, {props['cannot_serve']:,} cannot serve")
+    layer = folium.FeatureGroup(name=SITE_LAYERS['density'], show=show)
+    folium.GeoJson(
+        geojson,
+        style_function=lambda feature: {
+            'fillColor': SERVICEABILITY_COLORS[feature['properties']['majority']][0],
+            'fillOpacity': feature['properties']['opacity'],
+            'color': SERVICEABILITY_COLORS[feature['properties']['majority']][1], 'weight': 1, 'opacity': 0.6,
+        },
+        tooltip=folium.GeoJsonTooltip(fields=['tooltip'], labels=False),
+    ).add_to(layer)
+    return layer.add_to(m)
+
+def add_country_layer(m, df_map, classes, show=True):
+    """Choropleth of the serviceable share of each country's sites, with its color scale
+    when shown."""
+    colormap = LinearColormap([COLORS['cannot_serve'], COLORS['partial_serve'], COLORS['can_serve']],
+                              vmin=0, vmax=1, caption="Share of sites serviceable (fully or partly)")
+    geojson = country_geojson(df_map, country_service_counts(df_map, classes))
+    for feature in geojson['features']:
+        props = feature['properties']
+        props['fill'] = colormap(props['share'])
+        props['tooltip'] = f"{props['name']}: {props['serviceable']:,} of {props['total']:,} sites serviceable"
+    layer = folium.FeatureGroup(name=SITE_LAYERS['countries'], show=show)
+    folium.GeoJson(
+        geojson,
+        style_function=lambda feature: {
+            'fillColor': feature['properties']['fill'], 'fillOpacity': 0.55,
+            'color': '#374151', 'weight': 1, 'opacity': 0.7,
+        },
+        tooltip=folium.GeoJsonTooltip(fields=['tooltip'], labels=False),
+    ).add_to(layer)
+    if show:
+        colormap.add_to(m)
+    return layer.add_to(m)
+
+def create_map(df_map, sites, df_gateways, scalable=None, lazy_popups=None, service_rule=None, shell=False,
+               site_layer='markers'):
+    """Build the folium map. scalable=None picks the clustered layer automatically
+    once the site count exceeds SCALABLE_MAP_SITE_THRESHOLD; lazy_popups=None
+    builds popups on click whenever the clustered layer is used. service_rule is
+    the threshold note shown in popups (defaults to the half-life rule).
+    shell=True builds the clustered map without its sites (df_map and sites are ignored):
+    the rendered HTML keeps placeholders for fill_site_layer, so edits to the sites
+    don't rebuild tiles, gateways and popup code.
+    site_layer (a SITE_LAYERS key) 'density' or 'countries' replaces the markers with both
+    aggregate layers, that one shown and the other a click away in the layer control;
+    their size depends on the number of hexagons and countries, not sites."""
+    if site_layer != 'markers' and not shell:
+        m = create_base_map(df_gateways)
+        classes = site_classes(df_map, sites)
+        add_density_layer(m, df_map, classes, show=site_layer == 'density')
+        add_country_layer(m, df_map, classes, show=site_layer == 'countries')
+        folium.LayerControl(collapsed=False).add_to(m)
+        return m
+    if scalable is None:
+        scalable = shell or len(df_map) > SCALABLE_MAP_SITE_THRESHOLD
+    if scalable:
+        lazy_popups = True  # the clustered layer has no server-side popups
+    
+    m = create_base_map(df_gateways)
+    if shell:
+        LazySitePopups(None, service_rule).add_to(m)
+        add_site_cluster_layer(m)
+    elif scalable:
+        rows_json, popups_json = site_layer_payload(df_map, sites)
+        LazySitePopups(None, service_rule, popups_json).add_to(m)
+        add_site_cluster_layer(m, rows_json)
+    else:
+        records = list(map_site_records(df_map, sites))
+        popups = LazySitePopups([site for _, site in records], service_rule) if lazy_popups else None
+        add_site_markers(m, records, popups, service_rule)
+        if popups:
+            popups.add_to(m)
+    return m
+
+def add_diff_layer(m, kind, rows, tooltips, radius=6):
+    """One toggleable layer of changes (see DIFF_STYLES): a circle per row at its Latitude/Longitude,
+    plus a line from Old Latitude/Old Longitude where rows have them; at most DIFF_MAP_MAX_MARKERS rows."""
+    if rows.empty:
+        return
+    name, color = DIFF_STYLES[kind]
+    if len(rows) > DIFF_MAP_MAX_MARKERS:
+        name = f"{name} (first {DIFF_MAP_MAX_MARKERS:,} of {len(rows):,})"
+        rows, tooltips = rows.head(DIFF_MAP_MAX_MARKERS), tooltips[:DIFF_MAP_MAX_MARKERS]
+    features = []
+    for lat, lon, tooltip in zip(rows['Latitude'].tolist(), rows['Longitude'].tolist(), tooltips):
+        if lat == lat and lon == lon:  # skip rows without coordinates (NaN)
+            features.append({'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                             'properties': {'tooltip': tooltip}})
+    if 'Old Latitude' in rows:
+        for coordinates, tooltip in zip(zip(rows['Old Longitude'].tolist(), rows['Old Latitude'].tolist(),
+                                            rows['Longitude'].tolist(), rows['Latitude'].tolist()), tooltips):
+            if all(value == value for value in coordinates):
+                old_lon, old_lat, lon, lat = coordinates
+                features.append({'type': 'Feature', 'properties': {'tooltip': tooltip},
+                                 'geometry': {'type': 'LineString', 'coordinates': [[old_lon, old_lat], [lon, lat]]}})
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features}, name=name,
+        marker=folium.CircleMarker(radius=radius, fill=True),
+        style_function=lambda feature: {'color': color, 'fillColor': color, 'fillOpacity': 0.8, 'weight': 2},
+        tooltip=folium.GeoJsonTooltip(fields=['tooltip'], labels=False),
+    ).add_to(m)
+
+def create_diff_map(df_gateways, diff):
+    """Map of a DatasetDiff over the newer dataset's gateways: added, removed and moved sites
+    (with a line from where they were), isotope changes and gateway changes, one layer each."""
+    m = create_base_map(df_gateways)
+    sites = diff.sites
+    for change in ('added', 'removed', 'moved'):
+        rows = sites[sites['Change'] == change]
+        distances = rows['Moved (km)'].tolist()
+        tooltips = [f"Site {site_id} ({country}) {change}" + (f" {km:,.2f} km" if change == 'moved' else '')
+                    for site_id, country, km in zip(rows['ID'].tolist(), rows['Country'].tolist(), distances)]
+        add_diff_layer(m, change, rows, tooltips)
+    isotopes = diff.isotopes
+    add_diff_layer(m, 'isotopes', isotopes, [
+        f"Site {site_id}: " + '; '.join(part for part in (f"+ {added}" if added else '', f"− {removed}" if removed else '') if part)
+        for site_id, added, removed in zip(isotopes['ID'].tolist(), isotopes['Added'].tolist(), isotopes['Removed'].tolist())
+    ])
+    gateways = diff.gateways
+    add_diff_layer(m, 'gateways', gateways, [
+        f"UPS Gateway {code} - {city}: " + (f"{old} → {new}" if change == 'status' else change)
+        for code, city, change, old, new in zip(gateways['Code'].tolist(), gateways['City'].tolist(), gateways['Change'].tolist(),
+                                                gateways['Old Status'].tolist(), gateways['New Status'].tolist())
+    ], radius=10)
+    folium.LayerControl(collapsed=False).add_to(m)
+    return m
@@ -0,0 +1,92 @@
+"""
+Nuclear Medicine EMEA Manufacturing Dashboard - headless batch report
+
+Writes a standalone HTML map plus CSV/Parquet summaries for one or more
+workbooks without a Streamlit runtime. Workbooks are processed in parallel:
+
+    python nm_report.py data/*.xlsx --out reports --threshold 6
+"""
+
+import argparse
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from nm_core import (
+    DEFAULT_WORKBOOK_PATH, SERVICE_THRESHOLD_HOURS, build_sites, create_isotope_summary, find_workbooks,
+    gateway_coverage, halflife_service_rule, read_workbook_with_sidecar, threshold_sites,
+)
+from nm_map import create_map
+
+def write_report(workbook, out_dir, threshold_hours=SERVICE_THRESHOLD_HOURS):
+    """Build the map and tables for one workbook into out_dir; returns a one-line summary."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # The sidecar lives with the report: the workbook's directory may be read-only or shared
+    df_map, df_legend, df_gateways = read_workbook_with_sidecar(workbook, root=out_dir)
+    sites = threshold_sites(build_sites(df_legend), threshold_hours)
+    coverage = gateway_coverage(df_map, df_gateways)
+    service_labels = (f'≥{threshold_hours:g}h', f'<{threshold_hours:g}h')
+
+    summary = create_isotope_summary(sites, coverage, service_labels)
+    summary.to_csv(out_dir / "summary.csv", index=False)
+    summary.to_parquet(out_dir / "summary.parquet", index=False)
+    df_gateways.to_csv(out_dir / "gateways.csv", index=False)
+    create_map(df_map, sites, df_gateways, service_rule=halflife_service_rule(threshold_hours)).save(
+        str(out_dir / "map.html")
+    )
+
+    counts = summary['Status'].value_counts() if not summary.empty else {}
+    return (f"{workbook}: {len(sites)} sites ({counts.get('✓ Full', 0)} full, "
+            f"{counts.get('◐ Partial', 0)} partial, {counts.get('✗ None', 0)} none) -> {out_dir}")
+
+def report_dirs(workbooks, out):
+    """One output directory per workbook under out, named after its stem. Same-named workbooks
+    from different directories are numbered in order (a_1, a_2, ...), skipping names in use."""
+    counts = Counter(wb.stem for wb in workbooks)
+    taken = {stem for stem, count in counts.items() if count == 1}
+    names, index = [], Counter()
+    for wb in workbooks:
+        name = wb.stem
+        if counts[name] > 1:
+            while name == wb.stem or name in taken:
+                index[wb.stem] += 1
+                name = f"{wb.stem}_{index[wb.stem]}"
+            taken.add(name)
+        names.append(name)
+    return [Path(out) / name for name in names]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write static NM dashboard reports without Streamlit.")
+    parser.add_argument('workbooks', nargs='*', default=[str(DEFAULT_WORKBOOK_PATH)],
+                        help="workbook files or directories of workbooks (default: the bundled workbook)")
+    parser.add_argument('--out', default='reports', help="output directory; one subdirectory per workbook")
+    parser.add_argument('--threshold', type=float, default=SERVICE_THRESHOLD_HOURS,
+                        help="minimum half-life in hours for an isotope to be serviceable")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per CPU, capped at the workbook count)")
+    args = parser.parse_args(argv)
+
+    workbooks = find_workbooks(args.workbooks)
+    if not workbooks:
+        parser.error("no workbooks found")
+    # Same-named workbooks from different directories must not share an output folder
+    out_dirs = report_dirs(workbooks, args.out)
+
+    workers = min(args.workers or os.cpu_count() or 1, len(workbooks))
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(write_report, wb, out, args.threshold): wb for wb, out in zip(workbooks, out_dirs)}
+        for future in as_completed(futures):
+            try:
+                print(future.result())
+            except Exception as e:
+                failures += 1
+                print(f"{futures[future]}: failed: {e}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+import random
+
+import pandas as pd
+import pytest
+
+from nm_core import build_sites, reclassify_site, threshold_sites
+
+ISOTOPES = ['F-18', 'Ga-68', 'Tc-99m', 'Lu-177', 'I-131', 'Mo-99', 'Cu-64 ~12.7 h', 'In-111', 'Re-188', 'C-11', 'Zr-89']
+
+@pytest.fixture(scope='module')
+def sites():
+    # U-238 (4.5e9 y) next to F-18 (1.8 h): half-lives span 13 orders of magnitude
+    rng = random.Random(3)
+    descriptions = [', '.join(rng.sample(ISOTOPES, rng.randint(1, 3))) for _ in range(5000)]
+    descriptions.append('Depleted U-238 shielding, F-18')
+    return build_sites(pd.DataFrame({'ID': range(len(descriptions)), 'Description': descriptions}))
+
+@pytest.mark.parametrize('threshold', [0.5, 1.0, 2.0, 6.0, 12.0, 24.0, 48.0, 70.0])
+def test_threshold_sites_matches_reclassifying_every_site(sites, threshold):
+    expected = [reclassify_site(site, lambda iso: iso.halflife_hours >= threshold).serviceability for site in sites]
+    assert [site.serviceability for site in threshold_sites(sites, threshold)] == expected
@@ -0,0 +1,132 @@
+import html
+import os
+import zipfile
+
+import pandas as pd
+import pytest
+
+from nm_core import WORKBOOK_SHEETS, IncrementalWorkbook, read_workbook
+from benchmarks.workbook import write_workbook
+
+LEGEND_PART = 'xl/worksheets/sheet2.xml'
+SHARED_PART = 'xl/sharedStrings.xml'
+SHARED_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings'
+SHARED_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml'
+
+def inline_cell(ref, text):
+    return f'<c r="{ref}" t="inlineStr"><is><t>{html.escape(text, quote=False)}</t></is></c>'
+
+def write_legend(path, rows, strings=None, raw_cells=None):
+    """Rewrite the Legend sheet of path with rows of (ID, description): inline strings, or
+    indexes into strings written as the shared-string table. raw_cells replaces the
+    description cell of a row position with the given XML."""
+    cells = [inline_cell('A1', 'ID') + inline_cell('B1', 'Description')]
+    for position, (site_id, text) in enumerate(rows):
+        r = position + 2
+        if raw_cells and position in raw_cells:
+            description = raw_cells[position].format(ref=f"B{r}")
+        elif strings is None:
+            description = inline_cell(f"B{r}", text)
+        else:
+            description = f'<c r="B{r}" t="s"><v>{strings.index(text)}</v></c>'
+        cells.append(f'<c r="A{r}" t="n"><v>{site_id}</v></c>{description}')
+    sheet_data = ''.join(f'<row r="{r}">{row}</row>' for r, row in enumerate(cells, start=1))
+
+    with zipfile.ZipFile(path) as archive:
+        parts = {info.filename: archive.read(info) for info in archive.infolist()}
+    sheet = parts[LEGEND_PART].decode('utf-8')
+    start, end = sheet.index('<sheetData>') + len('<sheetData>'), sheet.index('</sheetData>')
+    parts[LEGEND_PART] = (sheet[:start] + sheet_data + sheet[end:]).encode('utf-8')
+    if strings is not None:
+        items = ''.join(f'<si><t>{html.escape(text, quote=False)}</t></si>' for text in strings)
+        parts[SHARED_PART] = (f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                              f'count="{len(strings)}" uniqueCount="{len(strings)}">{items}</sst>').encode('utf-8')
+        rels = parts['xl/_rels/workbook.xml.rels'].decode('utf-8')
+        if SHARED_TYPE not in rels:
+            rels = rels.replace('</Relationships>', f'<Relationship Id="rIdShared" Type="{SHARED_TYPE}" '
+                                                    f'Target="sharedStrings.xml"/></Relationships>')
+            parts['xl/_rels/workbook.xml.rels'] = rels.encode('utf-8')
+        types = parts['[Content_Types].xml'].decode('utf-8')
+        if SHARED_CONTENT_TYPE not in types:
+            types = types.replace('</Types>', f'<Override PartName="/{SHARED_PART}" '
+                                              f'ContentType="{SHARED_CONTENT_TYPE}"/></Types>')
+            parts['[Content_Types].xml'] = types.encode('utf-8')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for part, data in parts.items():
+            archive.writestr(part, data)
+    # a save within the clock's resolution must still change the signature
+    mtime = os.stat(path).st_mtime_ns + 1_000_000
+    os.utime(path, ns=(mtime, mtime))
+
+def assert_matches_full_read(workbook, frames):
+    for sheet, frame, expected in zip(WORKBOOK_SHEETS, frames, read_workbook(workbook.path)):
+        pd.testing.assert_frame_equal(frame.reset_index(drop=True), expected, obj=sheet)
+
+@pytest.fixture(params=['inline', 'shared'])
+def legend(request, tmp_path):
+    """(path, rows, strings) of a 30-site workbook whose Legend holds inline or shared strings."""
+    path = write_workbook(tmp_path / 'nm.xlsx', 30)
+    df_legend = read_workbook(path)[1]
+    rows = list(zip(df_legend['ID'].tolist(), df_legend['Description'].tolist()))
+    strings = [text for _, text in rows] if request.param == 'shared' else None
+    write_legend(path, rows, strings)
+    return path, rows, strings
+
+def refreshed(path, rows, strings, **edits):
+    """Frames and changes of an IncrementalWorkbook after rewriting the Legend as rows."""
+    workbook = IncrementalWorkbook(path)
+    before = workbook.refresh()
+    if strings is not None:
+        strings = strings + [text for _, text in rows if text not in strings]  # appended, as Excel does
+    write_legend(path, rows, strings, **edits)
+    frames = workbook.refresh()
+    assert frames[0] is before[0] and frames[2] is before[2]  # untouched sheets are not re-read
+    assert_matches_full_read(workbook, frames)
+    return workbook
+
+def test_edited_rows_are_patched(legend):
+    path, rows, strings = legend
+    rows = list(rows)
+    rows[2] = (rows[2][0], 'Edited Isotopes GmbH; production: Lu-177, Cu-64 ~12.7 h')
+    rows[9] = (rows[9][0], rows[0][1])  # a string the table already holds
+    assert refreshed(path, rows, strings).changes['Legend'] == [2, 9]
+
+def test_appended_row_is_patched(legend):
+    path, rows, strings = legend
+    rows = rows + [(31, 'Nordic Isotopes AS; production: F-18, Ga-68')]
+    assert refreshed(path, rows, strings).changes['Legend'] == [30]
+
+def test_inserted_row_shifts_the_rows_after_it(legend):
+    path, rows, strings = legend
+    rows = rows[:5] + [(31, 'Nordic Isotopes AS; production: F-18, Ga-68')] + rows[5:]
+    assert refreshed(path, rows, strings).changes['Legend'] == list(range(5, 31))
+
+def test_deleted_row_shifts_the_rows_after_it(legend):
+    path, rows, strings = legend
+    rows = rows[:5] + rows[6:]
+    workbook = refreshed(path, rows, strings)
+    assert workbook.changes['Legend'] == list(range(5, 30))
+    assert len(workbook.frames()[1]) == 29
+
+def test_renumbered_shared_strings_fall_back_to_a_full_read(tmp_path):
+    path = write_workbook(tmp_path / 'nm.xlsx', 30)
+    df_legend = read_workbook(path)[1]
+    rows = list(zip(df_legend['ID'].tolist(), df_legend['Description'].tolist()))
+    strings = [text for _, text in rows]
+    write_legend(path, rows, strings)
+    workbook = IncrementalWorkbook(path)
+    workbook.refresh()
+    rows[3] = (rows[3][0], 'Edited Isotopes GmbH; production: Lu-177')
+    write_legend(path, rows, ['Edited Isotopes GmbH; production: Lu-177'] + strings)
+    frames = workbook.refresh()
+    assert all(changed is None for changed in workbook.changes.values())
+    assert_matches_full_read(workbook, frames)
+
+def test_unsupported_cell_falls_back_to_a_full_read_of_its_sheet(legend):
+    path, rows, strings = legend
+    workbook = IncrementalWorkbook(path)
+    workbook.refresh()
+    write_legend(path, rows, strings, raw_cells={4: '<c r="{ref}" t="e"><v>#N/A</v></c>'})
+    frames = workbook.refresh()
+    assert workbook.changes == {'Manufacturers': [], 'Legend': None, 'UPS_Gateways': []}
+    assert_matches_full_read(workbook, frames)
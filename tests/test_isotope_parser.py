@@ -0,0 +1,22 @@
+import pytest
+
+from nm_core import Isotope, parse_isotopes_batch, parse_isotopes_from_description
+
+@pytest.mark.parametrize('description, expected', [
+    ('Tc-99m, Tc99m and 99mTc generators', ['Tc-99m']),
+    ('99mTc-MDP kits; 18F-FDG; Lu177.', ['F-18', 'Lu-177', 'Tc-99m']),
+    ('Spare parts C14B, P32-200, H3X and K40A', []),
+    ('Co50 and Sn300 housings', []),
+    ('Radiocarbon (C-14) and tritium (H-3) standards', ['C-14', 'H-3']),
+    ('Xx-12 ~3 h, Cu-64 ~12.7 h', ['Cu-64']),
+])
+def test_isotope_spellings_and_part_numbers(description, expected):
+    assert sorted(iso.name for iso in parse_isotopes_from_description(description)) == expected
+    assert sorted(parse_isotopes_batch([description])['isotope']) == expected
+
+def test_isotopes_store_numeric_half_lives_and_format_them_when_rendered():
+    assert 'halflife_display' not in Isotope.__slots__
+    isotopes = {iso.name: iso for iso in parse_isotopes_from_description('F-18 and Ga-68, Cu-64 ~13 h')}
+    assert isotopes['F-18'].halflife_display == '1.8 h'
+    assert isotopes['Cu-64'].halflife_display == '12.7 h'  # the table's value, not the stated one
+    assert isotopes['Ga-68'].halflife_display == '1.1 h'
@@ -0,0 +1,30 @@
+from pathlib import Path
+
+from nm_report import main, report_dirs
+from benchmarks.workbook import write_workbook
+
+def test_report_dirs_are_unique_per_workbook():
+    workbooks = [Path('a.xlsx'), Path('x/a.xlsx'), Path('y/x/a.xlsx'), Path('z/x/a.xlsx'),
+                 Path('b.xlsx'), Path('regional/a_2.xlsx')]
+    assert report_dirs(workbooks, 'out') == [
+        Path('out/a_1'), Path('out/a_3'), Path('out/a_4'), Path('out/a_5'), Path('out/b'), Path('out/a_2'),
+    ]
+
+def test_workbooks_in_the_current_directory_keep_their_stem():
+    assert report_dirs([Path('a.xlsx'), Path('b.xlsx')], 'out') == [Path('out/a'), Path('out/b')]
+
+def test_same_named_workbooks_get_separate_reports(tmp_path):
+    for region in ('north', 'south'):
+        (tmp_path / region).mkdir()
+        write_workbook(tmp_path / region / 'nm.xlsx', 20)
+    assert main([str(tmp_path / 'north'), str(tmp_path / 'south'), '--out', str(tmp_path / 'out'), '--workers', '1']) == 0
+    assert sorted(path.name for path in (tmp_path / 'out').iterdir()) == ['nm_1', 'nm_2']
+    assert all((tmp_path / 'out' / name / 'map.html').exists() for name in ('nm_1', 'nm_2'))
+
+def test_sidecars_are_written_with_the_report_not_the_workbook(tmp_path):
+    (tmp_path / 'data').mkdir()
+    write_workbook(tmp_path / 'data' / 'nm.xlsx', 20)
+    for _ in range(2):  # the second run reads the sidecar
+        assert main([str(tmp_path / 'data' / 'nm.xlsx'), '--out', str(tmp_path / 'out'), '--workers', '1']) == 0
+    assert [path.name for path in (tmp_path / 'data').iterdir()] == ['nm.xlsx']
+    assert len(list((tmp_path / 'out' / 'nm' / '.nm.cache').iterdir())) == 1
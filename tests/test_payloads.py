@@ -0,0 +1,21 @@
+import json
+
+import pandas as pd
+
+from nm_core import build_sites, legend_payload, site_popup_json
+
+def sites_of(*descriptions):
+    return build_sites(pd.DataFrame({'ID': range(1, len(descriptions) + 1), 'Description': descriptions}))
+
+def test_payloads_hold_only_the_isotopes_of_their_sites():
+    dataset_a = sites_of('Alpha GmbH; production: Pm-149 ~53 h, F-18')
+    dataset_b = sites_of('Beta SAS; production: Tc-99m', 'Gamma Ltd; production: F-18, Tc-99m')
+    legend_payload(dataset_a), site_popup_json(dataset_a)
+
+    legend = json.loads(legend_payload(dataset_b))
+    popups = json.loads(site_popup_json(dataset_b))
+    for payload in (legend, popups):
+        assert sorted(isotope[0] for isotope in payload['isotopes']) == ['F-18', 'Tc-99m']
+        offsets, site_isotopes = payload['offsets'], payload['site_isotopes']
+        assert [[payload['isotopes'][i][0] for i in site_isotopes[start:end]]
+                for start, end in zip(offsets, offsets[1:])] == [['Tc-99m'], ['Tc-99m', 'F-18']]
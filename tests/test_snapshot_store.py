@@ -0,0 +1,35 @@
+import pytest
+
+from nm_core import SnapshotStore, compact_frames
+from benchmarks.workbook import synthetic_frames
+
+@pytest.fixture(scope='module')
+def revisions():
+    return [compact_frames(synthetic_frames(200, seed=seed)) for seed in range(3)]
+
+def test_scoped_snapshots_are_listed_only_to_their_scope(tmp_path, revisions):
+    store = SnapshotStore(tmp_path)
+    shared = store.save(revisions[0], 'workbooks')
+    mine = store.save(revisions[1], 'mine.xlsx', scope='session-a')
+    theirs = store.save(revisions[1], 'theirs.xlsx', scope='session-b')
+    assert mine != theirs
+    assert [meta['key'] for meta in store.snapshots('session-a')] == [shared, mine]
+    assert [meta['key'] for meta in store.snapshots('session-b')] == [shared, theirs]
+    assert [meta['key'] for meta in store.snapshots()] == [shared]
+    assert all('theirs' not in path.name for path in tmp_path.iterdir())
+
+def test_least_recently_used_snapshots_are_evicted_over_max_bytes(tmp_path, revisions):
+    store = SnapshotStore(tmp_path)
+    first, second = store.save(revisions[0]), store.save(revisions[1])
+    store.load(first)  # now second is the least recently used
+    store = SnapshotStore(tmp_path, max_bytes=store.total_bytes * 5 // 4)  # room for two
+    third = store.save(revisions[2])
+    assert second not in store and first in store and third in store
+    assert store.evictions == 1 and len(store) == 2
+
+def test_the_snapshot_just_saved_is_kept_even_over_max_bytes(tmp_path, revisions):
+    store = SnapshotStore(tmp_path, max_bytes=1)
+    key = store.save(revisions[0])
+    assert key in store and len(store) == 1
+    store.save(revisions[1])
+    assert key not in store and len(store) == 1
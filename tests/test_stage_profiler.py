@@ -0,0 +1,26 @@
+import json
+import logging
+import tracemalloc
+
+import pytest
+
+from nm_core import StageProfiler
+
+def test_tracing_stops_however_the_run_exits():
+    assert not tracemalloc.is_tracing()
+    with pytest.raises(RuntimeError):
+        with StageProfiler(trace_memory=True) as profiler:
+            with profiler.stage('load_data'):
+                assert tracemalloc.is_tracing()
+                raise RuntimeError("rerun")
+    assert not tracemalloc.is_tracing()
+    assert [record.stage for record in profiler.stages] == ['load_data']
+    assert profiler.stages[0].peak_bytes is not None
+
+def test_stages_are_logged_as_json(caplog):
+    with caplog.at_level(logging.INFO, logger="nm_dashboard.perf"):
+        with StageProfiler(run_id='run') as profiler:
+            with profiler.stage('kpis') as stage:
+                stage.output = 'x' * 10
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record['run_id'] == 'run' and record['stage'] == 'kpis' and record['output_bytes'] == 10
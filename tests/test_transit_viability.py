@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from nm_core import EARTH_RADIUS_KM, build_sites, transit_viability, unit_vectors
+
+def test_nearest_gateway_decay_matches_best_of_every_gateway():
+    rng = np.random.default_rng(5)
+    df_map = pd.DataFrame({'ID': range(400), 'Latitude': rng.uniform(-60, 70, 400),
+                           'Longitude': rng.uniform(-180, 180, 400)})
+    df_map.loc[3, ['Latitude', 'Longitude']] = np.nan
+    df_gateways = pd.DataFrame({'Code': [f"G{i}" for i in range(40)], 'Latitude': rng.uniform(-60, 70, 40),
+                                'Longitude': rng.uniform(-180, 180, 40)})
+    df_legend = pd.DataFrame({'ID': range(400), 'Description': 'F-18, Ga-68, Tc-99m, Cu-64, Lu-177'})
+    sites = build_sites(df_legend)
+
+    cosines = np.clip(unit_vectors(df_map['Latitude'], df_map['Longitude'])
+                      @ unit_vectors(df_gateways['Latitude'], df_gateways['Longitude']).T, -1.0, 1.0)
+    transit_hours = 3.0 + EARTH_RADIUS_KM * np.arccos(cosines) / 60.0  # sites x gateways
+    expected = {}
+    for site in sites:
+        for iso in site.isotopes:
+            best = np.exp2(-transit_hours[site.site_id] / iso.halflife_hours).max()
+            expected[(site.site_id, iso.name)] = bool(best >= 0.5)
+    assert transit_viability(df_map, df_gateways, sites, 60.0, 3.0, 0.5) == expected
+    assert 0 < sum(expected.values()) < len(expected)
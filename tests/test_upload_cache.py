@@ -0,0 +1,29 @@
+import threading
+
+from nm_core import UploadCache, upload_cache_version
+
+def test_entries_of_another_version_are_not_served(tmp_path):
+    UploadCache(tmp_path, version='old').put('digest', ('frames', 'sites'))
+    assert UploadCache(tmp_path, version='old').get('digest') == ('frames', 'sites')
+    assert UploadCache(tmp_path, version='new').get('digest') is None
+
+def test_version_follows_the_nuclide_table(tmp_path):
+    table = tmp_path / 'nuclides.csv'
+    table.write_text("nuclide,halflife,unit\nF-18,1.83,h\n")
+    before = upload_cache_version(table)
+    table.write_text("nuclide,halflife,unit\nF-18,1.8295,h\n")
+    assert upload_cache_version(table) != before
+
+def test_failed_put_is_skipped(tmp_path):
+    cache = UploadCache(tmp_path, version='v')
+    cache.put('digest', threading.Lock())  # not picklable
+    assert cache.get('digest') is None and len(cache) == 0
+    assert not list(tmp_path.iterdir())
+
+def test_unusable_directory_disables_the_cache(tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    cache = UploadCache(blocker / 'cache', version='v')  # mkdir under a file fails
+    assert not cache.enabled and cache.error is not None
+    cache.put('digest', 'value')
+    assert cache.get('digest') is None and cache.misses == 1